@@ -0,0 +1,84 @@
+"""Scaling of `compare.smith_waterman_distance` with document size.
+
+    python benchmarks/bench_compare.py [--pages 1 5 20 100] [--words-per-page 700] [--max-exact-cells 2e9]
+
+A synthetic ground truth of `pages` pages is aligned against a noisy copy
+(as OCR would produce), for both word and letter sequences, exhaustively
+(band=None; skipped above `--max-exact-cells`) and with the default band
+('auto'). Prints one json object per measurement with the wall time, peak
+traced memory, and the memory a full alignment matrix would have needed.
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from pykrman.compare import smith_waterman_distance
+
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+
+def synthetic_words(n, seed=0):
+    rnd = random.Random(seed)
+    return [''.join(rnd.choice(LETTERS) for _ in range(rnd.randint(2, 9))) for _ in range(n)]
+
+
+def ocr_noise(words, rate=0.05, seed=1):
+    """Drop, garble and insert words at `rate`"""
+    rnd = random.Random(seed)
+    out = []
+    for word in words:
+        r = rnd.random()
+        if r < rate / 3:
+            continue
+        if r < rate * 2 / 3:
+            i = rnd.randrange(len(word))
+            word = word[:i] + rnd.choice(LETTERS) + word[i + 1:]
+        out.append(word)
+        if r > 1 - rate / 3:
+            out.append(rnd.choice(LETTERS))
+    return out
+
+
+def measure(level, truth, ocr, band, **kwargs):
+    tracemalloc.start()
+    start = time.perf_counter()
+    score = smith_waterman_distance(truth, ocr, band=band, **kwargs)
+    wall = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'level': level, 'band': band, 'length': len(truth), 'ocr_length': len(ocr), 'score': score,
+        'wall_seconds': wall, 'peak_bytes': peak, 'full_matrix_bytes': (len(truth) + 1) * (len(ocr) + 1) * 8,
+    }
+
+
+def run(pages=(1, 5, 20, 100), words_per_page=700, max_exact_cells=2e9):
+    smith_waterman_distance('warm', 'up')  # import numpy outside of the measurements
+    for n_pages in pages:
+        truth = synthetic_words(n_pages * words_per_page)
+        ocr = ocr_noise(truth)
+        sequences = [
+            ('word', truth, ocr, {'mismatch': -2, 'deletion': -2, 'insertion': -0.5}),
+            ('letter', ''.join(truth), ''.join(ocr), {}),
+        ]
+        for level, a, b, kwargs in sequences:
+            for band in (None, 'auto'):
+                if band is None and len(a) * len(b) > max_exact_cells:
+                    continue
+                yield dict(measure(level, a, b, band, **kwargs), pages=n_pages)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 5, 20, 100])
+    parser.add_argument('--words-per-page', type=int, default=700)
+    parser.add_argument('--max-exact-cells', type=float, default=2e9)
+    args = parser.parse_args()
+    for result in run(**vars(args)):
+        print(json.dumps(result), flush=True)
+
+
+if __name__ == '__main__':
+    main()
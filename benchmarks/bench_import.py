@@ -0,0 +1,86 @@
+"""Measure import time and cold-start latency, each in a fresh interpreter.
+
+    python benchmarks/bench_import.py [--repeat 5] [--file tests/ocr-wiki/orig.pdf]
+
+Prints one json object per measurement:
+    * import: wall time of `import pykrman.pykrfy`, and the slowest modules
+        according to `python -X importtime`
+    * get_text: wall time of a new process importing pykrman and extracting
+        text from `--file`
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FILE = os.path.join(HERE, '..', 'tests', 'ocr-wiki', 'orig.pdf')
+COLD_START = '''
+import sys
+from pykrman.pykrfy import get_text
+with open(sys.argv[1], 'rb') as fh:
+    get_text(fh, sys.argv[2])
+'''
+
+
+def _env():
+    src = os.path.join(HERE, '..', 'src')
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [src, os.environ.get('PYTHONPATH')])))
+
+
+def parse_importtime(stderr):
+    """
+    :return: dict of module to cumulative import time in microseconds
+    """
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+def measure_import(module='pykrman.pykrfy', repeat=5, top=10):
+    timings = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                              env=_env(), capture_output=True, text=True, check=True)
+        timings.append(parse_importtime(proc.stderr))
+    best = min(timings, key=lambda t: t[module])
+    slowest = sorted((m for m in best if m != module), key=best.get, reverse=True)[:top]
+    return {
+        'benchmark': 'import', 'module': module,
+        'best_seconds': best[module] / 1e6,
+        'mean_seconds': sum(t[module] for t in timings) / len(timings) / 1e6,
+        'slowest': {m: best[m] / 1e6 for m in slowest},
+    }
+
+
+def measure_cold_start(fp=DEFAULT_FILE, repeat=5):
+    ext = os.path.splitext(fp)[-1].strip('.')
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', COLD_START, fp, ext], env=_env(), check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return {
+        'benchmark': 'get_text', 'file': os.path.basename(fp),
+        'best_seconds': min(timings), 'mean_seconds': sum(timings) / len(timings),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--file', default=DEFAULT_FILE)
+    args = parser.parse_args()
+    print(json.dumps(measure_import(repeat=args.repeat)))
+    print(json.dumps(measure_cold_start(args.file, repeat=args.repeat)))
+
+
+if __name__ == '__main__':
+    main()
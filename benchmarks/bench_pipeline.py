@@ -0,0 +1,230 @@
+"""Throughput, per-stage latency and peak memory of the extraction pipeline.
+
+    python benchmarks/bench_pipeline.py [--fixtures DIR] [--pages 5] [--width 2550] [--height 3300]
+        [--workers 1] [--ocr auto] [--repeat 1] [--output results.json]
+
+Synthetic fixtures (see `fixtures.py`) and the documents in `tests/ocr-wiki`
+are measured with:
+    * stages: sniff, classify, pdfminer, image extraction/decoding,
+        preprocessing and OCR, timed separately
+    * get_text, read_file: end to end, for each document
+    * run_config: end to end, for all documents
+Each measurement runs in a new (spawned) process so that peak RSS is its own.
+Prints one json object per measurement, the first describing the environment;
+`--output` also writes them to a file for run-to-run comparison.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from fixtures import generate_fixtures
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+class NullEngine:
+    """Stands in for Tesseract when it is not installed, so the rest of the pipeline can be measured"""
+    name = 'none'
+
+    def image_to_string(self, im):
+        return ''
+
+    def version(self):
+        return None
+
+    def close(self):
+        pass
+
+
+def ocr_options(ocr):
+    if ocr == 'none':
+        return {'engine': NullEngine()}
+    return {'engine': ocr}
+
+
+def resolve_ocr(ocr='auto'):
+    """Fall back to no OCR if neither tesseract nor tesserocr is available"""
+    if ocr != 'auto':
+        return ocr
+    try:
+        import tesserocr  # noqa: F401
+        return 'tesserocr'
+    except ImportError:
+        pass
+    return 'pytesseract' if shutil.which('tesseract') else 'none'
+
+
+def peak_rss():
+    """
+    :return: peak resident set size of this process and its children, in bytes
+    """
+    if resource is None:
+        return None
+    scale = 1 if sys.platform == 'darwin' else 1024  # bytes on macOS, KiB elsewhere
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * scale
+
+
+def _cpu():
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def _timed(stages, name, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    stages[name] = stages.get(name, 0) + time.perf_counter() - start
+    return result
+
+
+def stage_timings(fixture, ocr):
+    """Time each stage of the pipeline separately"""
+    from io import BytesIO
+    stages = {}
+
+    def imports():
+        from PIL import Image  # noqa: F401
+        from pykrman import classify, ocr, preprocess, pykrfy, sniff, util  # noqa: F401
+    _timed(stages, 'import', imports)
+
+    from PIL import Image
+    from pykrman.classify import classify_pdf_pages
+    from pykrman.names import FileType
+    from pykrman.ocr import get_engine
+    from pykrman.preprocess import preprocess_image
+    from pykrman.pykrfy import iter_frames
+    from pykrman.sniff import sniff
+    from pykrman.util import iter_pdf_images, read_pdf
+
+    with open(fixture['path'], 'rb') as fh:
+        data = _timed(stages, 'read', fh.read)
+    ext = _timed(stages, 'sniff', sniff, data)
+    images = []
+    if ext == 'pdf':
+        page_types = _timed(stages, 'classify', classify_pdf_pages, BytesIO(data))
+        text_pagenos = {i for i, ft in enumerate(page_types) if ft == FileType.TEXT_PDF}
+        scanned_pagenos = {i for i, ft in enumerate(page_types) if ft == FileType.SCANNED_PDF}
+        if text_pagenos:
+            _timed(stages, 'pdfminer', read_pdf, BytesIO(data), pagenos=text_pagenos)
+        if scanned_pagenos:
+            images = _timed(stages, 'image_extraction', lambda: [
+                img for _, img in iter_pdf_images(BytesIO(data), force=False, pagenos=scanned_pagenos)
+            ])
+    else:
+        def decode():
+            im = Image.open(BytesIO(data))
+            return [frame for _, frame in iter_frames(im)] if hasattr(im, 'n_frames') else [im.copy()]
+        images = _timed(stages, 'image_decode', decode)
+    engine = get_engine(**ocr)
+    for im in images:
+        cim = _timed(stages, 'preprocess', preprocess_image, im)
+        _timed(stages, 'ocr', engine.image_to_string, cim)
+    return stages
+
+
+def _measure(benchmark, fixtures, ocr, workspace, workers=1, quiet=True):
+    """Run a single measurement; called in a new process"""
+    if quiet:
+        from loguru import logger
+        logger.remove()
+    ocr = ocr_options(ocr)
+    start, cpu = time.perf_counter(), _cpu()
+    extra = {}
+    if benchmark == 'stages':
+        extra['stages'] = stage_timings(fixtures[0], ocr)
+    elif benchmark == 'get_text':
+        from pykrman.pykrfy import get_text
+        with open(fixtures[0]['path'], 'rb') as fh:
+            get_text(fh, ocr=ocr)
+    elif benchmark == 'read_file':
+        from pykrman.pykrfy import read_file
+        read_file(fixtures[0]['path'], workspace, ocr=ocr)
+    elif benchmark == 'run_config':
+        from pykrman.pykrfy import run_config
+        run_config({'files': [f['path'] for f in fixtures]}, workspace, workers=workers, ocr=ocr)
+    else:
+        raise ValueError(f'Unrecognized benchmark: {benchmark}')
+    wall = time.perf_counter() - start
+    return dict(extra, wall_seconds=wall, cpu_seconds=_cpu() - cpu, peak_rss_bytes=peak_rss())
+
+
+def measure(benchmark, fixtures, ocr, workers=1, repeat=1, quiet=True):
+    """
+    :return: result of the fastest of `repeat` runs, each in a new process
+    """
+    ctx = multiprocessing.get_context('spawn')
+    runs = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as workspace, \
+                ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+            runs.append(executor.submit(_measure, benchmark, fixtures, ocr, workspace, workers,
+                                        quiet).result())
+    best = min(runs, key=lambda r: r['wall_seconds'])
+    pages = sum(f['pages'] for f in fixtures)
+    result = {'benchmark': benchmark, 'ocr': ocr, 'pages': pages}
+    if len(fixtures) == 1:
+        result.update(fixture=fixtures[0]['name'], kind=fixtures[0]['kind'])
+    else:
+        result['workers'] = workers
+    result.update(best, pages_per_second=pages / best['wall_seconds'])
+    return result
+
+
+def environment(ocr):
+    return {
+        'benchmark': 'environment',
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'ocr': ocr,
+    }
+
+
+def run(fixtures_dir=None, pages=5, width=2550, height=3300, workers=1, ocr='auto', repeat=1,
+        quiet=True):
+    ocr = resolve_ocr(ocr)
+    yield environment(ocr)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fixtures = generate_fixtures(fixtures_dir or tmpdir, pages, width, height)
+        for fixture in fixtures:
+            for benchmark in ('stages', 'get_text', 'read_file'):
+                yield measure(benchmark, [fixture], ocr, repeat=repeat, quiet=quiet)
+        yield measure('run_config', fixtures, ocr, workers, repeat=repeat, quiet=quiet)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fixtures', dest='fixtures_dir', default=None,
+                        help='Directory to keep generated fixtures in (re-used between runs)')
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--width', type=int, default=2550)
+    parser.add_argument('--height', type=int, default=3300)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--ocr', default='auto', help='auto, pytesseract, tesserocr or none')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--output', default=None, help='Also write results to this json file')
+    parser.add_argument('--verbose', dest='quiet', action='store_false')
+    args = parser.parse_args()
+    output = args.__dict__.pop('output')
+    results = []
+    for result in run(**vars(args)):
+        print(json.dumps(result), flush=True)
+        results.append(result)
+    if output:
+        with open(output, 'w') as out:
+            json.dump(results, out, indent=2)
+
+
+if __name__ == '__main__':
+    main()
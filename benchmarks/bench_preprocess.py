@@ -0,0 +1,46 @@
+"""Compare the PIL and NumPy preprocessing implementations on a synthetic scanned page.
+
+    python benchmarks/bench_preprocess.py [--width 2550] [--height 3300] [--repeat 3]
+
+Prints one json object per configuration.
+"""
+import argparse
+import json
+import time
+
+from fixtures import synthetic_page
+from pykrman.preprocess import preprocess_image
+
+CONFIGS = [
+    {'method': 'pil'},
+    {'method': 'numpy', 'threshold': 'dither'},
+    {'method': 'numpy', 'threshold': 'otsu'},
+    {'method': 'numpy', 'threshold': 'otsu', 'stretch': True},
+    {'method': 'numpy', 'threshold': 'sauvola'},
+]
+
+
+def run(width=2550, height=3300, repeat=3):
+    im = synthetic_page(width, height)
+    for config in CONFIGS:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            preprocess_image(im, **config).close()
+            timings.append(time.perf_counter() - start)
+        yield {'config': config, 'width': width, 'height': height,
+               'best_seconds': min(timings), 'mean_seconds': sum(timings) / len(timings)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--width', type=int, default=2550)
+    parser.add_argument('--height', type=int, default=3300)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    for result in run(**vars(args)):
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
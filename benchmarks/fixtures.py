@@ -0,0 +1,195 @@
+"""Generate synthetic documents for benchmarks, so that nothing needs to be downloaded.
+
+    python benchmarks/fixtures.py OUTDIR [--pages 5] [--width 2550] [--height 3300]
+"""
+import argparse
+import io
+import json
+import os
+import random
+
+from PIL import Image, ImageDraw, ImageOps
+
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+TESTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests')
+
+
+def random_lines(rnd, n_lines=60, n_words=12):
+    return [' '.join(''.join(rnd.choice(LETTERS) for _ in range(rnd.randint(2, 9))) for _ in range(n_words))
+            for _ in range(n_lines)]
+
+
+def synthetic_page(width=2550, height=3300, seed=0):
+    """Grey, noisy page (8.5x11in at 300dpi) covered in lines of text"""
+    rnd = random.Random(seed)
+    im = Image.new('RGB', (width, height), (225, 222, 215))
+    draw = ImageDraw.Draw(im)
+    for y in range(100, height - 100, 40):
+        line = ' '.join(''.join(rnd.choice(LETTERS) for _ in range(rnd.randint(2, 9)))
+                        for _ in range(40))
+        draw.text((100, y), line, fill=(40, 40, 40))
+    im = Image.blend(im, Image.effect_noise((width, height), 40).convert('RGB'), 0.15)
+    return im
+
+
+class PdfWriter:
+    """Just enough of a pdf writer to build text and scanned documents"""
+
+    def __init__(self):
+        self.objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None,
+                        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+        self.pages = []
+
+    def add(self, body):
+        self.objects.append(body)
+        return len(self.objects)
+
+    def add_stream(self, entries, data):
+        return self.add(b'<< ' + entries.encode('ascii') + b' /Length %d >>\nstream\n' % len(data)
+                        + data + b'\nendstream')
+
+    def add_page(self, content, image=None, width=612, height=792):
+        """
+        :param content: page content stream
+        :param image: (image dictionary entries, image data), drawn as /Im0
+        """
+        resources = '/Font << /F1 3 0 R >>'
+        if image:
+            resources += f' /XObject << /Im0 {self.add_stream(*image)} 0 R >>'
+        contents = self.add_stream('', content)
+        self.pages.append(self.add(
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}]'
+            f' /Resources << {resources} >> /Contents {contents} 0 R >>'.encode('ascii')
+        ))
+
+    def save(self, fp):
+        kids = ' '.join(f'{i} 0 R' for i in self.pages)
+        self.objects[1] = f'<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>'.encode('ascii')
+        out = io.BytesIO()
+        out.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        offsets = []
+        for i, body in enumerate(self.objects, 1):
+            offsets.append(out.tell())
+            out.write(b'%d 0 obj\n' % i + body + b'\nendobj\n')
+        xref = out.tell()
+        out.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(self.objects) + 1))
+        for offset in offsets:
+            out.write(b'%010d 00000 n \n' % offset)
+        out.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(self.objects) + 1, xref))
+        with open(fp, 'wb') as fh:
+            fh.write(out.getvalue())
+
+
+def _text_content(lines):
+    ops = [b'BT /F1 10 Tf 12 TL 72 740 Td']
+    for line in lines:
+        ops.append(b'(' + line.encode('ascii') + b') Tj T*')
+    ops.append(b'ET')
+    return b'\n'.join(ops)
+
+
+def _draw_image(width=612, height=792):
+    return f'q {width} 0 0 {height} 0 0 cm /Im0 Do Q'.encode('ascii')
+
+
+def _bilevel(im, level=128):
+    """Threshold like a scanner would (dithering the noise would bloat the encoding)"""
+    return im.convert('L').point(lambda v: 255 if v > level else 0).convert('1', dither=Image.Dither.NONE)
+
+
+def _g4(im):
+    """
+    Group 4 encode a page: a single-strip tiff holds the raw CCITT stream.
+        The tiff is written as BlackIsZero, but fax coding treats 0 as white, so invert first.
+    """
+    bw = _bilevel(ImageOps.invert(im.convert('L')), level=127)
+    fh = io.BytesIO()
+    bw.save(fh, format='TIFF', compression='group4', tiffinfo={278: bw.height})
+    fh.seek(0)
+    with Image.open(fh) as tif:
+        offset, = tif.tag_v2[273]
+        length, = tif.tag_v2[279]
+    return fh.getvalue()[offset:offset + length]
+
+
+def text_pdf(fp, pages=5, seed=0):
+    rnd = random.Random(seed)
+    pdf = PdfWriter()
+    for _ in range(pages):
+        pdf.add_page(_text_content(random_lines(rnd)))
+    pdf.save(fp)
+
+
+def ccitt_pdf(fp, pages=5, width=2550, height=3300, seed=0):
+    pdf = PdfWriter()
+    for i in range(pages):
+        data = _g4(synthetic_page(width, height, seed + i))
+        pdf.add_page(_draw_image(), (
+            f'/Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceGray'
+            f' /BitsPerComponent 1 /Filter /CCITTFaxDecode'
+            f' /DecodeParms << /K -1 /Columns {width} /Rows {height} /BlackIs1 false >>', data))
+    pdf.save(fp)
+
+
+def jpeg_pdf(fp, pages=5, width=2550, height=3300, seed=0):
+    pdf = PdfWriter()
+    for i in range(pages):
+        fh = io.BytesIO()
+        synthetic_page(width, height, seed + i).convert('L').save(fh, format='JPEG', quality=75)
+        pdf.add_page(_draw_image(), (
+            f'/Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceGray'
+            f' /BitsPerComponent 8 /Filter /DCTDecode', fh.getvalue()))
+    pdf.save(fp)
+
+
+def multiframe_tiff(fp, pages=5, width=2550, height=3300, seed=0):
+    frames = [_bilevel(synthetic_page(width, height, seed + i)) for i in range(pages)]
+    frames[0].save(fp, format='TIFF', compression='group4', save_all=True, append_images=frames[1:])
+
+
+def jpeg_scan(fp, width=2550, height=3300, seed=0):
+    synthetic_page(width, height, seed).convert('L').save(fp, format='JPEG', quality=75)
+
+
+def generate_fixtures(directory, pages=5, width=2550, height=3300, include_tests=True):
+    """
+    :param include_tests: also list the documents in `tests/ocr-wiki`
+    :return: list of dicts describing each fixture (name, path, kind, pages)
+    """
+    os.makedirs(directory, exist_ok=True)
+    fixtures = []
+
+    def fixture(name, kind, n, func, *args):
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            func(path, *args)
+        fixtures.append({'name': name, 'path': path, 'kind': kind, 'pages': n})
+
+    fixture('text.pdf', 'text_pdf', pages, text_pdf, pages)
+    fixture('ccitt.pdf', 'scanned_pdf', pages, ccitt_pdf, pages, width, height)
+    fixture('jpeg.pdf', 'scanned_pdf', pages, jpeg_pdf, pages, width, height)
+    fixture('multiframe.tiff', 'image', pages, multiframe_tiff, pages, width, height)
+    fixture('scan.jpg', 'image', 1, jpeg_scan, width, height)
+    if include_tests:
+        for name, kind, n in [('orig.pdf', 'text_pdf', 9), ('pdf-3.pdf', 'scanned_pdf', 9),
+                              (os.path.join('jpg-1', 'ocr-jpg-1.jpg'), 'image', 1)]:
+            path = os.path.join(TESTS, 'ocr-wiki', name)
+            if os.path.exists(path):
+                fixtures.append({'name': os.path.basename(name), 'path': os.path.abspath(path),
+                                 'kind': kind, 'pages': n})
+    return fixtures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory')
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--width', type=int, default=2550)
+    parser.add_argument('--height', type=int, default=3300)
+    args = parser.parse_args()
+    for fixture in generate_fixtures(**vars(args)):
+        print(json.dumps(fixture))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+"""asyncio front-end, for embedding pykrman in async services.
+
+Documents are handled by a pool of long-lived `pykrman.worker` subprocesses
+(see `WorkerPool`), each in its own process group, so the event loop is never
+blocked by pdfminer, PIL or Tesseract, and imports and OCR engines are re-used
+between documents. A timeout or cancellation kills the worker along with any
+Tesseract process it started, and a new worker takes its place.
+
+`get_text` shares a pool per event loop (see `get_pool`); services should
+`await close_pool()` when shutting down.
+"""
+import asyncio
+import os
+import signal
+import weakref
+from collections import Counter
+
+from loguru import logger
+
+from pykrman import metrics
+from pykrman.manifest import get_manifest
+from pykrman.names import FileType
+from pykrman.pool import resolve_workers
+from pykrman.worker import POSIX, WorkerError, build_request, parse_response, worker_command
+
+STDERR_TAIL = 10_000  # bytes of each worker's stderr to keep, for reporting crashes
+RESPONSE_LIMIT = 1 << 30  # bytes in a response line (the text of a document), rather than asyncio's 64 KiB
+
+
+async def _kill(proc):
+    """Kill the worker's whole process group, including Tesseract children"""
+    try:
+        if POSIX:
+            os.killpg(proc.pid, signal.SIGKILL)
+        elif proc.returncode is None:
+            proc.kill()
+    except ProcessLookupError:
+        pass
+    await proc.wait()
+
+
+async def run_worker(task, kwargs, data=b'', timeout=None, log=None, max_memory=None):
+    """
+    Run a task (see `worker.TASKS`) in a new worker process.
+
+    :param data: content of the document, if the task requires it
+    :param timeout: seconds to wait before killing the worker
+    :param log: file for the worker to log to
+    :param max_memory: megabytes the worker may allocate
+    :return: result of the task
+    :raises asyncio.TimeoutError: if `timeout` was exceeded
+    :raises worker.WorkerError: if the task failed (a RuntimeError)
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *worker_command(),
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        start_new_session=POSIX,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(
+            proc.communicate(build_request(task, kwargs, log, max_memory, len(data)) + data), timeout
+        )
+    except BaseException:  # timed out or cancelled
+        await _kill(proc)
+        raise
+    return parse_response(stdout, stderr, proc.returncode)
+
+
+class Worker:
+
+    def __init__(self, log=None, max_memory=None):
+        """
+        A long-lived worker process (`python -m pykrman.worker --serve`), started on first
+            use and restarted after it times out, is cancelled, crashes or runs out of memory.
+            Only run one task at a time.
+
+        :param log: file for the worker to log to
+        :param max_memory: megabytes the worker may allocate
+        """
+        self.log = log
+        self.max_memory = max_memory
+        self.proc = None
+        self._stderr = bytearray()
+        self._drain = None
+
+    async def _start(self):
+        self.proc = await asyncio.create_subprocess_exec(
+            *worker_command(serve=True),
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            start_new_session=POSIX, limit=RESPONSE_LIMIT,
+        )
+        self._stderr = bytearray()
+        self._drain = asyncio.ensure_future(self._drain_stderr(self.proc))
+
+    async def _drain_stderr(self, proc):
+        """Keep reading the worker's logs (so it can't block on a full pipe), keeping the end"""
+        while True:
+            chunk = await proc.stderr.read(1 << 16)
+            if not chunk:
+                break
+            self._stderr += chunk
+            del self._stderr[:-STDERR_TAIL]
+
+    @staticmethod
+    async def _exchange(proc, request):
+        proc.stdin.write(request)
+        await proc.stdin.drain()
+        return await proc.stdout.readline()
+
+    async def run(self, task, kwargs, data=b'', timeout=None):
+        """
+        See `run_worker`.
+
+        :raises asyncio.TimeoutError: if `timeout` was exceeded
+        :raises worker.WorkerError: if the task failed or the worker died
+        """
+        if self.proc is None or self.proc.returncode is not None:
+            await self.stop()
+            await self._start()
+        proc = self.proc
+        request = build_request(task, kwargs, self.log, self.max_memory, len(data)) + data
+        try:
+            line = await asyncio.wait_for(self._exchange(proc, request), timeout)
+        except (BrokenPipeError, ConnectionResetError):
+            line = b''
+        except BaseException:  # timed out or cancelled
+            await self.stop()
+            raise
+        if not line:  # the worker died
+            await self.stop()
+            parse_response(b'', bytes(self._stderr), proc.returncode)
+        try:
+            return parse_response(line, b'', 0)
+        except WorkerError as e:
+            if e.type == 'MemoryError':  # don't trust the worker's state
+                await self.stop()
+            raise
+
+    async def stop(self, kill=True):
+        """
+        :param kill: kill the worker (and its children); otherwise let it finish and exit
+        """
+        proc, self.proc = self.proc, None
+        if proc is None:
+            return
+        if kill:
+            await _kill(proc)
+        else:
+            proc.stdin.close()
+            await proc.wait()
+        await self._drain
+
+
+class WorkerPool:
+
+    def __init__(self, size=None, log=None, max_memory=None):
+        """
+        Run tasks on up to `size` long-lived workers; tasks wait for an idle worker.
+            Use as an async context manager, or call `close`.
+
+        :param size: number of workers; 0 or None to use all cores
+        :param log: file for workers to log to
+        :param max_memory: megabytes each worker may allocate
+        """
+        self.size = resolve_workers(size)
+        self.workers = [Worker(log, max_memory) for _ in range(self.size)]
+        self._idle = None
+
+    async def run(self, task, kwargs, data=b'', timeout=None):
+        """See `run_worker`"""
+        if self._idle is None:  # created in the running loop
+            self._idle = asyncio.Queue()
+            for worker in self.workers:
+                self._idle.put_nowait(worker)
+        worker = await self._idle.get()
+        try:
+            return await worker.run(task, kwargs, data, timeout)
+        finally:
+            self._idle.put_nowait(worker)
+
+    async def close(self):
+        await asyncio.gather(*(worker.stop(kill=False) for worker in self.workers))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+_pools = weakref.WeakKeyDictionary()
+
+
+def get_pool():
+    """
+    :return: WorkerPool shared by calls to `get_text` in the running event loop,
+        with a worker per core
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _pools:
+        _pools[loop] = WorkerPool()
+    return _pools[loop]
+
+
+async def close_pool():
+    """Stop the workers of the running event loop's shared pool"""
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
+
+
+def _read_input(fp, ext=None):
+    if isinstance(fp, (bytes, bytearray)):
+        return bytes(fp), ext
+    if hasattr(fp, 'read'):
+        fp.seek(0)
+        return fp.read(), ext
+    with open(fp, 'rb') as fh:
+        return fh.read(), ext or os.path.splitext(str(fp))[-1].strip('.') or None
+
+
+async def get_text(fp, ext=None, force_convert=True, timeout=None, semaphore=None, pool=None, cache=None,
+                   ocr=None):
+    """
+    Async version of `pykrfy.get_text`, returning the same text.
+
+    :param fp: path, bytes, or binary file-like object containing image or pdf
+    :param ext: extension to use; defaults to that of `fp`, or is sniffed from the content
+    :param force_convert: get text at any cost
+    :param timeout: seconds to wait before killing the extraction
+    :param semaphore: asyncio.Semaphore shared between calls to further limit the
+        number of concurrent extractions
+    :param pool: WorkerPool to run on; defaults to the shared pool (see `get_pool`),
+        which also limits concurrency to the number of cores
+    :param cache: path to cache database; cached text is returned for identical files
+    :param ocr: OCR engine name and its options; see `ocr.get_engine`
+    :return: text
+    """
+    data, ext = await asyncio.get_running_loop().run_in_executor(None, _read_input, fp, ext)
+    pool = pool or get_pool()
+    kwargs = {'ext': ext, 'force_convert': force_convert, 'cache': cache, 'ocr': ocr}
+    if semaphore is None:
+        result = await pool.run('get_text', kwargs, data=data, timeout=timeout)
+    else:
+        async with semaphore:
+            result = await pool.run('get_text', kwargs, data=data, timeout=timeout)
+    return result['text']
+
+
+async def run_config(data=None, workspace='.', concurrency=None, timeout=None, manifest=None,
+                     max_memory=None, sink=None, **options):
+    """
+    Async version of `pykrfy.run_config`: files are read by a pool of worker processes.
+
+    :param data: see `schema.py`
+    :param workspace: directory to do work in
+    :param concurrency: number of worker processes (files in flight); 0 or None to use all cores
+    :param timeout: seconds to allow for each file; files taking longer are
+        killed and logged as failed
+    :param manifest: see `pykrfy.run_config`
+    :param max_memory: megabytes each worker may allocate
+    :param sink: see `pykrfy.run_config`
+    :param options: passed to `pykrfy.read_file` (e.g., cache, ocr, preprocess, max_pages)
+    :return: Counter of successfully processed FileTypes
+    """
+    from pykrman.pykrfy import _finish, _finish_all, collect_input_entries, collect_input_files
+    from pykrman.sinks import get_sink
+    if not data:
+        raise ValueError('Need to specify input data.')
+    for option in ('workers', 'isolate'):  # files are always read in worker processes
+        options.pop(option, None)
+
+    os.makedirs(workspace, exist_ok=True)
+    log_fp = os.path.join(workspace, 'log.txt')
+    log_handler = logger.add(log_fp)
+    manifest = get_manifest(manifest, workspace)
+    if manifest:
+        files = manifest.pending(collect_input_entries(**data))
+    else:
+        files = collect_input_files(**data)
+    sink = get_sink(sink, workspace)
+    unfinished = []  # manifest updates waiting for the sink to commit their records
+    c = Counter()
+    run_metrics = metrics.Metrics()
+
+    def finish(ifp, ft=None, output=None, error=None, doc_metrics=None):
+        _finish(manifest, sink, unfinished, workspace, ifp, ft, output, error, doc_metrics)
+
+    async def consume(pool):
+        for ifp in files:
+            try:
+                result = await pool.run('read_file', dict(options, ifp=ifp, workspace=workspace,
+                                                          input_dirs=data.get('directories'),
+                                                          write_output=sink is None),
+                                        timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.error(f'Timed out after {timeout}s: {ifp}')
+                run_metrics.incr('timed_out')
+                finish(ifp, error=f'Timed out after {timeout}s')
+                continue
+            except Exception as e:
+                logger.error(f'Failed to process: {ifp}')
+                logger.exception(e)
+                run_metrics.incr('failed')
+                finish(ifp, error=str(e))
+                continue
+            run_metrics.merge(result['metrics'])
+            metrics.emit('document', ifp, result['metrics'])
+            ft = FileType[result['filetype']]
+            if result['success']:
+                c[ft] += 1
+                run_metrics.incr(f'filetype.{ft.name}')
+            else:
+                run_metrics.incr('failed')
+            finish(ifp, ft, result['output'], error=None if result['success'] else 'No text extracted',
+                   doc_metrics=result['metrics'])
+
+    try:
+        async with WorkerPool(concurrency, log_fp, max_memory) as pool:
+            await asyncio.gather(*(consume(pool) for _ in range(pool.size)))
+        logger.info(f'Processed: {dict(c)}')
+        logger.info(f'Metrics:\n{run_metrics.summary()}')
+        metrics.emit('run', 'run_config', run_metrics.as_dict())
+        if metrics.current() is not None:
+            metrics.current().merge(run_metrics)
+    finally:
+        if sink:
+            sink.close()
+            _finish_all(manifest, unfinished, os.path.relpath(sink.path, workspace))
+        if manifest:
+            manifest.close()
+        logger.remove(log_handler)
+    return c
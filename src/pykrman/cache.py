@@ -0,0 +1,124 @@
+"""Persistent cache of extracted text, keyed by file content and settings.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+
+from pykrman.names import FileType
+
+CACHE_VERSION = 1
+CACHE_FILENAME = 'cache.sqlite'
+_open_caches = {}
+
+
+def content_hash(fp, chunk_size=1 << 20):
+    """
+    :param fp: path to file, bytes, or binary file-like object
+    :return: sha256 hexdigest of the file's content
+    """
+    h = hashlib.sha256()
+    if isinstance(fp, (bytes, bytearray, memoryview)):
+        h.update(fp)
+    elif hasattr(fp, 'read'):
+        pos = fp.tell()
+        for chunk in iter(lambda: fp.read(chunk_size), b''):
+            h.update(chunk)
+        fp.seek(pos)
+    else:
+        with open(fp, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(chunk_size), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_key(digest, **settings):
+    """
+    :param digest: content hash of the file (see `content_hash`)
+    :param settings: any options which change the extracted text
+    :return: key for `ResultCache`
+    """
+    settings['cache_version'] = CACHE_VERSION
+    return hashlib.sha256(
+        (digest + json.dumps(settings, sort_keys=True, default=str)).encode('utf8')
+    ).hexdigest()
+
+
+class ResultCache:
+
+    def __init__(self, path):
+        """
+        SQLite-backed store of extracted text. Safe to share between
+            processes: each process opens its own connection.
+
+        :param path: path to sqlite database
+        """
+        self.path = path
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=60)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS result ('
+                ' key TEXT PRIMARY KEY,'
+                ' filetype TEXT NOT NULL,'
+                ' text TEXT NOT NULL,'
+                ' output TEXT'
+                ')'
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key):
+        """
+        :param key: see `cache_key`
+        :return: (FileType, text, output) or None if not cached
+        """
+        row = self.conn.execute(
+            'SELECT filetype, text, output FROM result WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return FileType[row[0]], row[1], row[2]
+
+    def put(self, key, filetype, text, output=None):
+        """
+        :param key: see `cache_key`
+        :param filetype: FileType of the source document
+        :param text: extracted text
+        :param output: location of output, relative to workspace, with `{name}` in place of
+            the input's output name (so it can be re-used for files with the same content)
+        """
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO result (key, filetype, text, output) VALUES (?, ?, ?, ?)',
+                (key, filetype.name, text, output)
+            )
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def get_cache(cache, workspace='.'):
+    """
+    Resolve the `cache` option to a `ResultCache`, re-using one connection per process.
+
+    :param cache: ResultCache, path to database, True to use the workspace default,
+        or None/False to disable caching
+    :param workspace: directory containing the default cache
+    :return: ResultCache or None
+    """
+    if not cache or isinstance(cache, ResultCache):
+        return cache or None
+    if cache is True:
+        cache = os.path.join(workspace, CACHE_FILENAME)
+    path = os.path.abspath(cache)
+    if path not in _open_caches:
+        _open_caches[path] = ResultCache(path)
+    return _open_caches[path]
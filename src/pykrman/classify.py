@@ -0,0 +1,107 @@
+"""Cheaply decide whether pdf pages contain text or only scanned images.
+
+Only page resources and (decompressed) content streams are inspected, so
+this is much faster than pdfminer's layout analysis and lets scanned
+documents skip it entirely. pdfminer is only imported once a pdf is classified.
+"""
+import re
+
+from pykrman.names import FileType
+
+# Tj and TJ, or ' and " (which always follow their string operand)
+TEXT_OPERATOR = re.compile(rb'(?<![A-Za-z])(?:Tj|TJ)(?![A-Za-z])|[)>]\s*[\'"]')
+
+
+def _name(obj):
+    from pdfminer.pdftypes import resolve1
+    return getattr(resolve1(obj), 'name', None)
+
+
+def _streams(contents):
+    from pdfminer.pdftypes import PDFStream, resolve1
+    contents = resolve1(contents)
+    if contents is None:
+        return []
+    if not isinstance(contents, list):
+        contents = [contents]
+    return [s for s in (resolve1(c) for c in contents) if isinstance(s, PDFStream)]
+
+
+def _has_text(resources, streams, depth=0):
+    """
+    Text requires fonts and a text-showing operator, either in the
+        content streams or in Form XObjects drawn by them. Forms without
+        their own resources use those of the page (or form) drawing them.
+    """
+    from pdfminer.pdftypes import PDFStream, resolve1
+    resources = resolve1(resources) or {}
+    if resolve1(resources.get('Font')) and any(TEXT_OPERATOR.search(s.get_data()) for s in streams):
+        return True
+    if depth > 2:
+        return False
+    for xobj in (resolve1(resources.get('XObject')) or {}).values():
+        xobj = resolve1(xobj)
+        if isinstance(xobj, PDFStream) and _name(xobj.get('Subtype')) == 'Form':
+            if _has_text(xobj.get('Resources') or resources, [xobj], depth + 1):
+                return True
+    return False
+
+
+def _has_images(resources):
+    from pdfminer.pdftypes import PDFStream, resolve1
+    resources = resolve1(resources) or {}
+    for xobj in (resolve1(resources.get('XObject')) or {}).values():
+        xobj = resolve1(xobj)
+        if not isinstance(xobj, PDFStream):
+            continue
+        subtype = _name(xobj.get('Subtype'))
+        if subtype == 'Image' or (subtype == 'Form' and _has_images(xobj.get('Resources'))):
+            return True
+    return False
+
+
+def classify_page(page):
+    """
+    :param page: pdfminer PDFPage
+    :return: TEXT_PDF if the page has text, SCANNED_PDF if it only has
+        images, or UNKNOWN if it has neither
+    """
+    if _has_text(page.resources, _streams(page.attrs.get('Contents'))):
+        return FileType.TEXT_PDF
+    if _has_images(page.resources):
+        return FileType.SCANNED_PDF
+    return FileType.UNKNOWN
+
+
+def classify_pdf_pages(pdf, password=''):
+    """
+    Classify each page of a pdf in a single pass, without layout analysis.
+
+    :param pdf: path to pdf or binary file-like object
+    :return: list of FileType, one per page
+    """
+    # noinspection PyPackageRequirements
+    from pdfminer.pdfdocument import PDFDocument
+    # noinspection PyPackageRequirements
+    from pdfminer.pdfpage import PDFPage
+    # noinspection PyPackageRequirements
+    from pdfminer.pdfparser import PDFParser
+    if not hasattr(pdf, 'read'):
+        with open(pdf, 'rb') as fh:
+            return classify_pdf_pages(fh, password)
+    pdf.seek(0)
+    doc = PDFDocument(PDFParser(pdf), password=password)
+    return [classify_page(page) for page in PDFPage.create_pages(doc)]
+
+
+def classify_pdf(page_types):
+    """
+    :param page_types: result of `classify_pdf_pages`
+    :return: TEXT_PDF if pages have text, SCANNED_PDF if they only have images,
+        or MIXED_PDF if there is a mixture
+    """
+    if FileType.TEXT_PDF in page_types:
+        if FileType.SCANNED_PDF in page_types:
+            return FileType.MIXED_PDF
+        return FileType.TEXT_PDF
+    return FileType.SCANNED_PDF
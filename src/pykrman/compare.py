@@ -1,29 +1,221 @@
 """Compare output transcriptions
+
+Smith-Waterman scores are computed one row at a time (memory is linear in
+the length of the longer sequence), vectorized with NumPy when it is
+available, and, for very long documents, only within a band around the
+diagonal (see `smith_waterman_distance`).
 """
+import itertools
 import json
+import math
 import os
 import re
+from bisect import bisect_left
 from collections import Counter
 
+from loguru import logger
+
+from pykrman.pool import iter_completed, iter_ordered
 from pykrman.stopwords import get_stopwords
 from pykrman.util import read_pdf
-from nlpakki.score.similarity import jaccard_similarity, cosine_similarity, smith_waterman_distance
+
+# compare exhaustively up to this many cells (e.g., 10k x 10k words), otherwise use a band
+MAX_CELLS = 10 ** 8
+MIN_BAND = 100
+
+
+def auto_band(n, m, max_cells=MAX_CELLS):
+    """
+    :param n: length of one sequence
+    :param m: length of the other
+    :return: None (no band) if the full alignment has at most `max_cells` cells,
+        otherwise a band half-width keeping the work to about `max_cells`
+    """
+    if n * m <= max_cells:
+        return None
+    return max(MIN_BAND, max_cells // (2 * min(n, m)))
+
+
+def _encode(seq1, seq2):
+    """Map tokens (letters or words) to integers"""
+    vocab = {}
+    return ([vocab.setdefault(x, len(vocab)) for x in seq1],
+            [vocab.setdefault(x, len(vocab)) for x in seq2])
+
+
+def _band_limits(center, m, band):
+    """
+    :return: first and last (1-based) column of a row whose band is centered on `center`
+    """
+    if band is None:
+        return 1, m
+    center = min(max(center, 1), m)
+    return max(1, math.floor(center - band)), min(m, math.ceil(center + band))
+
+
+def _next_center(i, n, m, best_col):
+    """
+    Center the band of row `i + 1` on the best cell of row `i` (the end of the
+        best alignment so far), moving along the diagonal; before anything has
+        aligned, follow the diagonal from (0, 0) to (n, m).
+    """
+    if best_col is None:
+        return (i + 1) * m / n
+    return best_col + m / n
+
+
+def _sw_numpy(rows, cols, match, mismatch, insertion, deletion, band):
+    import numpy as np
+    n, m = len(rows), len(cols)
+    cols = np.asarray(cols)
+    prev = np.zeros(m + 1)  # cells outside the band are 0, as after a local restart
+    cur = np.zeros(m + 1)
+    steps = np.arange(1, m + 1) * float(insertion)
+    gaps = np.zeros(m + 1)
+    prev_lo, prev_hi = 1, 0  # columns last written to `prev`
+    cur_lo, cur_hi = 1, 0  # and to `cur` (two rows back)
+    center = m / n
+    best = 0.0
+    for i, token in enumerate(rows, 1):
+        lo, hi = _band_limits(center, m, band)
+        width = hi - lo + 1
+        # no gap in this row: diagonal, vertical (deletion) or restart
+        h = np.where(cols[lo - 1:hi] == token, match, mismatch) + prev[lo - 1:hi]
+        np.maximum(h, prev[lo:hi + 1] + deletion, out=h)
+        np.maximum(h, 0, out=h)
+        # horizontal gaps: h[j] = max(h[j], h[j - 1] + insertion) == max_k<=j (h[k] + (j - k) * insertion)
+        np.subtract(h, steps[:width], out=gaps[1:width + 1])
+        np.maximum.accumulate(gaps[:width + 1], out=gaps[:width + 1])
+        np.add(gaps[1:width + 1], steps[:width], out=h)
+        cur[cur_lo:cur_hi + 1] = 0
+        cur[lo:hi + 1] = h
+        k = int(h.argmax())
+        if h[k] > best:
+            best = h[k]
+        center = _next_center(i, n, m, lo + k if h[k] > 0 else None)
+        prev, cur = cur, prev
+        cur_lo, cur_hi, prev_lo, prev_hi = prev_lo, prev_hi, lo, hi
+    return float(best)
+
+
+def _sw_python(rows, cols, match, mismatch, insertion, deletion, band):
+    n, m = len(rows), len(cols)
+    prev = [0] * (m + 1)
+    cur = [0] * (m + 1)
+    prev_lo, prev_hi = 1, 0  # columns last written to `prev`
+    cur_lo, cur_hi = 1, 0  # and to `cur` (two rows back)
+    center = m / n
+    best = 0
+    for i, token in enumerate(rows, 1):
+        lo, hi = _band_limits(center, m, band)
+        for j in range(cur_lo, cur_hi + 1):
+            cur[j] = 0
+        left = 0
+        row_best, row_best_col = 0, None
+        for j in range(lo, hi + 1):
+            left = max(0,
+                       prev[j - 1] + (match if cols[j - 1] == token else mismatch),
+                       prev[j] + deletion,
+                       left + insertion)
+            cur[j] = left
+            if left > row_best:
+                row_best, row_best_col = left, j
+        best = max(best, row_best)
+        center = _next_center(i, n, m, row_best_col)
+        prev, cur = cur, prev
+        cur_lo, cur_hi, prev_lo, prev_hi = prev_lo, prev_hi, lo, hi
+    return best
+
+
+def smith_waterman_distance(seq1, seq2, match=3, mismatch=-1, insertion=-1, deletion=-1, normalize=1,
+                            band=None):
+    """
+    Local alignment score of two sequences of letters or words, as in
+        `nlpakki.score.similarity.smith_waterman_distance`: the longer sequence
+        is searched for the shorter, and the normalized score is relative to a
+        perfect match of the shorter sequence.
+
+    Only two rows of the alignment matrix are kept, so memory is linear. With a
+        `band`, each row only computes the cells within `band` columns of where
+        the best alignment so far is heading, which bounds time to
+        O(min(n, m) * band); the result is a lower bound, and is exact if the
+        best alignment never jumps further than the band (as for transcriptions
+        of the same text).
+
+    :param band: half-width of the band; None to compare exhaustively, or
+        'auto' to use a band only for long sequences (see `auto_band`)
+    :return: score (between 0 and 1 if normalized)
+    """
+    if len(seq2) > len(seq1):
+        seq1, seq2 = seq2, seq1
+    if not seq2:
+        return 0.0
+    if band == 'auto':
+        band = auto_band(len(seq2), len(seq1))
+        if band is not None:
+            logger.info(f'Aligning {len(seq2)} x {len(seq1)} within a band of {band}')
+    cols, rows = _encode(seq1, seq2)
+    try:
+        import numpy  # noqa: F401
+        sw = _sw_numpy
+    except ImportError:
+        sw = _sw_python
+    score = sw(rows, cols, match, mismatch, insertion, deletion, band)
+    return score / (len(seq2) * match) if normalize else score
+
+
+class PrefixIndex:
+    """Count words by prefix (for wildcard important words) with two binary searches"""
+
+    def __init__(self, counter):
+        self.keys = sorted(counter)
+        self.cumulative = [0] + list(itertools.accumulate(counter[key] for key in self.keys))
+
+    def count(self, prefix):
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + chr(0x10FFFF), start)
+        return self.cumulative[end] - self.cumulative[start]
+
+
+def count_word(counter, word, index=None):
+    """
+    :param word: word, or prefix ending in '*'
+    :param index: PrefixIndex of `counter`, required for prefixes
+    """
+    if word.endswith('*'):
+        return index.count(word[:-1])
+    return counter[word]
 
 
 class Wordlist:
+    """
+    Tokenized ground truth, built once and compared against any number of
+        transcriptions (it can be pickled, e.g., to send to worker processes).
+    """
 
     def __init__(self, text, space_pattern=r'[^A-Za-z]+', flags=0,
                  stopwords='default', important_words=None,
-                 ignore_case=True):
+                 ignore_case=True, band='auto'):
+        """
+        :param band: see `smith_waterman_distance`
+        """
         self.split_pat = re.compile(space_pattern, flags=flags)
         self.letter_pat = re.compile(r'[^A-Za-z]*')
         self.ignore_case = ignore_case
-        self.important_words = [word.lower() for word in important_words] or []
+        self.important_words = [word.lower() if ignore_case else word for word in important_words or []]
         self.stopwords = self.get_stopwords(stopwords)
-        self.letters = Counter(self.get_letters(text))
+        self.band = band
+        self.letters = self.get_letters(text)
+        self.letter_counts = Counter(self.letters)
         self.words = self.text_to_wordlist(text)
         self.unique = set(self.words)
         self.counter = Counter(self.words)
+        index = PrefixIndex(self.counter) if self.has_wildcards else None
+        self.important_counts = {word: count_word(self.counter, word, index) for word in self.important_words}
+
+    @property
+    def has_wildcards(self):
+        return any(word.endswith('*') for word in self.important_words)
 
     def get_letters(self, text):
         if self.ignore_case:
@@ -54,33 +246,18 @@ class Wordlist:
 
     def compare(self, text):
         """Build wordlist from text, and compare"""
+        from nlpakki.score.similarity import jaccard_similarity, cosine_similarity
         words = self.text_to_wordlist(text)
         letters = self.get_letters(text)
         unique = set(words)
         cnt = Counter(words)
         diff = self.counter - cnt
         extra = cnt - self.counter
-        important_words = {}
-        for word in self.important_words:
-            if not word.endswith('*'):
-                important_words[word] = {
-                    'true_count': self.counter[word],
-                    'count': cnt[word]
-                }
-            else:
-                prefix = word[:-1]
-                true_count = 0
-                for w in self.counter:
-                    if w.startswith(prefix):
-                        true_count += self.counter[w]
-                count = 0
-                for w in cnt:
-                    if w.startswith(prefix):
-                        count += cnt[w]
-                important_words[word] = {
-                    'true_count': true_count,
-                    'count': count,
-                }
+        index = PrefixIndex(cnt) if self.has_wildcards else None
+        important_words = {
+            word: {'true_count': true_count, 'count': count_word(cnt, word, index)}
+            for word, true_count in self.important_counts.items()
+        }
         return {
             'descriptive': {
                 'total': {
@@ -100,64 +277,113 @@ class Wordlist:
                 'jaccard': jaccard_similarity(self.unique, unique),
                 'cosine': cosine_similarity(self.counter, cnt),
                 # don't penalize insertions due to OCR inserting too much cruff
-                'swd': smith_waterman_distance(self.words, words, mismatch=-2, deletion=-2, insertion=-0.5)
+                'swd': smith_waterman_distance(self.words, words, mismatch=-2, deletion=-2, insertion=-0.5,
+                                               band=self.band)
             },
             'letter_similarity': {
-                'cosine': cosine_similarity(self.letters, letters),
-                'swd': smith_waterman_distance(self.letters, letters)
+                'cosine': cosine_similarity(self.letter_counts, Counter(letters)),
+                'swd': smith_waterman_distance(self.letters, letters, band=self.band)
             },
             'important_words': important_words
         }
 
 
-def compare_ocr_pdf(true_pdf, *ocr_versions, important_words=None,
-                    ignore_case=True, encoding='utf8'):
+def get_wordlist(true_pdf, important_words=None, ignore_case=True, encoding='utf8'):
+    """
+    :param true_pdf: Wordlist (returned as is), path to pdf or text file, or text
+    :return: Wordlist
+    """
+    if isinstance(true_pdf, Wordlist):
+        return true_pdf
     if os.path.isfile(true_pdf):
         if true_pdf.endswith('.pdf'):
-            wl = Wordlist.frompdf(true_pdf, important_words=important_words,
-                                  ignore_case=ignore_case, encoding=encoding)
-        else:
-            wl = Wordlist.fromtext(true_pdf, important_words=important_words,
-                                   ignore_case=ignore_case, encoding=encoding)
-    else:  # is just text
-        wl = Wordlist(true_pdf, important_words=important_words,
-                      ignore_case=ignore_case)
-
-    results = []
-    if len(ocr_versions) == 1:
+            return Wordlist.frompdf(true_pdf, important_words=important_words,
+                                    ignore_case=ignore_case, encoding=encoding)
+        return Wordlist.fromtext(true_pdf, important_words=important_words,
+                                 ignore_case=ignore_case, encoding=encoding)
+    # is just text
+    return Wordlist(true_pdf, important_words=important_words, ignore_case=ignore_case)
+
+
+def _read_version(ocr, encoding='utf8'):
+    """
+    :param ocr: path to text file, directory of text files, (name, text) tuple, or text
+    :return: (name or None, text)
+    """
+    if isinstance(ocr, tuple):
+        return ocr
+    if os.path.isfile(ocr):
+        with open(ocr, encoding=encoding) as fh:
+            return ocr, fh.read()
+    if os.path.isdir(ocr):
+        texts = []
+        for fn in sorted(os.listdir(ocr)):
+            with open(os.path.join(ocr, fn), encoding=encoding) as fh:
+                texts.append(fh.read())
+        return ocr, '\n'.join(texts)
+    return None, ocr
+
+
+_truth = None
+
+
+def _set_truth(wordlist):
+    """Worker initializer: the ground truth is only sent once to each worker"""
+    global _truth
+    _truth = wordlist
+
+
+def _score_version(ocr, encoding='utf8'):
+    name, text = _read_version(ocr, encoding)
+    res = json.dumps(_truth.compare(text))
+    return (name, res) if name else (res,)
+
+
+def iter_compare_ocr_pdf(true_pdf, *ocr_versions, important_words=None, ignore_case=True,
+                         encoding='utf8', workers=1, ordered=False):
+    """
+    Score each OCR version against the ground truth, in a pool of processes.
+
+    :param true_pdf: Wordlist, path to pdf or text file, or text
+    :param ocr_versions: paths to text files, directories (treated as one
+        version), (name, text) tuples or text; a single directory is treated
+        as a directory of versions
+    :param workers: number of processes to score versions with; 0 to use all cores
+    :param ordered: yield results in the order of `ocr_versions` rather than as they finish
+    :return: generator of (version, json) or (json,) for unnamed text
+    """
+    wl = get_wordlist(true_pdf, important_words, ignore_case, encoding)
+    if len(ocr_versions) == 1 and isinstance(ocr_versions[0], str) and os.path.isdir(ocr_versions[0]):
         base = ocr_versions[0]
-        ocr_versions = [os.path.join(base, fn) for fn in os.listdir(base)]
-    for ocr in ocr_versions:
-        if os.path.isfile(ocr):
-            with open(ocr, encoding=encoding) as fh:
-                text = fh.read()
-        elif os.path.isdir(ocr):
-            texts = []
-            for fn in os.listdir(ocr):
-                with open(os.path.join(ocr, fn), encoding=encoding) as fh:
-                    texts.append(fh.read())
-            text = '\n'.join(texts)
-        elif isinstance(ocr, tuple):
-            ocr, text = ocr
-        else:
-            text = ocr
-        res = json.dumps(wl.compare(text))
-        if ocr:
-            results.append((ocr, res))
-        else:
-            results.append((res,))
-    return results
+        ocr_versions = [os.path.join(base, fn) for fn in sorted(os.listdir(base))]
+    iterator = iter_ordered if ordered else iter_completed
+    for ocr, future in iterator(_score_version, ocr_versions, workers=workers, initializer=_set_truth,
+                                initargs=(wl,), encoding=encoding):
+        yield future.result()
+
+
+def compare_ocr_pdf(true_pdf, *ocr_versions, important_words=None,
+                    ignore_case=True, encoding='utf8', workers=1):
+    """
+    :return: list of (version, json) or (json,), in the order of `ocr_versions`;
+        see `iter_compare_ocr_pdf`
+    """
+    return list(iter_compare_ocr_pdf(true_pdf, *ocr_versions, important_words=important_words,
+                                     ignore_case=ignore_case, encoding=encoding, workers=workers,
+                                     ordered=True))
 
 
 def process(true_pdf, output, ocr_versions, important_words=None,
-            case_sensitive=False, encoding='utf8'):
-    results = compare_ocr_pdf(true_pdf, *ocr_versions,
-                              important_words=important_words,
-                              ignore_case=not case_sensitive,
-                              encoding=encoding)
+            case_sensitive=False, encoding='utf8', workers=1):
+    """Write the score of each version to `output` (json lines) as soon as it is ready"""
+    results = iter_compare_ocr_pdf(true_pdf, *ocr_versions,
+                                   important_words=important_words,
+                                   ignore_case=not case_sensitive,
+                                   encoding=encoding, workers=workers)
     with open(output, 'w', encoding=encoding) as out:
         for result in results:
             out.write('\n'.join(result) + '\n')
+            out.flush()
 
 
 if __name__ == '__main__':
@@ -177,5 +403,7 @@ if __name__ == '__main__':
                         help='Do not ignore case.')
     parser.add_argument('--encoding', default='utf8',
                         help='Default encoding for reading/writing')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes to score versions with; 0 to use all cores')
     args = parser.parse_args()
     process(**vars(args))
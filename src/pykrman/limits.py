@@ -0,0 +1,75 @@
+"""Per-document resource limits.
+
+Page and pixel limits are checked wherever pages are counted or images are
+allocated (e.g., `merge_images`, decoded frames, rendered pages) and raise
+`LimitExceeded`, so that the document is abandoned before the work (or
+allocation) is done. Limits apply within an `apply()` block, including in
+threads started from it.
+
+Time and memory can't be bounded from inside the process doing the work: see
+`worker.run` (timeouts, and `set_memory_limit` in the worker process).
+"""
+import contextlib
+import contextvars
+from collections import namedtuple
+
+Limits = namedtuple('Limits', 'max_pages max_pixels')
+
+_current = contextvars.ContextVar('pykrman_limits', default=Limits(None, None))
+
+
+class LimitExceeded(Exception):
+    """A document is larger than allowed; it should be skipped rather than retried"""
+
+
+def current():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def apply(max_pages=None, max_pixels=None):
+    """
+    :param max_pages: maximum number of pages (or image frames) in a document
+    :param max_pixels: maximum number of pixels in any single image
+    """
+    token = _current.set(Limits(max_pages, max_pixels))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def check_pages(n, name=None):
+    max_pages = _current.get().max_pages
+    if max_pages and n > max_pages:
+        raise LimitExceeded(f'{name or "document"} has {n} pages (max_pages={max_pages})')
+
+
+def check_pixels(width, height, name=None, max_pixels=None):
+    """
+    :param max_pixels: overrides the current limit (e.g., in a process where it isn't set)
+    """
+    max_pixels = max_pixels or _current.get().max_pixels
+    if max_pixels and width * height > max_pixels:
+        raise LimitExceeded(f'{name or "image"} is {int(width)}x{int(height)} pixels'
+                            f' (max_pixels={max_pixels})')
+
+
+def set_memory_limit(max_memory):
+    """
+    Limit the address space of this process (and processes it starts, such as
+        Tesseract); allocations beyond it fail with MemoryError. Only on POSIX.
+
+    :param max_memory: megabytes
+    """
+    try:
+        import resource
+    except ImportError:
+        from loguru import logger
+        logger.warning('Memory limits are not supported on this platform.')
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = int(max_memory) * 1024 * 1024
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
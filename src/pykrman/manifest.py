@@ -0,0 +1,119 @@
+"""Record of processed input files, so that runs only process new, changed or
+failed files and can resume after being interrupted.
+"""
+import os
+import sqlite3
+import time
+
+MANIFEST_FILENAME = 'manifest.sqlite'
+STARTED = 'started'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Manifest:
+
+    def __init__(self, path):
+        """
+        SQLite-backed record of each input's path, size, mtime, outcome and output.
+
+        :param path: path to sqlite database
+        """
+        self.path = path
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=60)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS file ('
+                ' path TEXT PRIMARY KEY,'
+                ' size INTEGER NOT NULL,'
+                ' mtime INTEGER NOT NULL,'
+                ' status TEXT NOT NULL,'
+                ' filetype TEXT,'
+                ' output TEXT,'
+                ' error TEXT,'
+                ' updated REAL NOT NULL'
+                ')'
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, path):
+        """
+        :return: (size, mtime, status, filetype, output, error) or None if not recorded
+        """
+        return self.conn.execute(
+            'SELECT size, mtime, status, filetype, output, error FROM file WHERE path = ?',
+            (os.path.abspath(path),)
+        ).fetchone()
+
+    def is_done(self, path, size, mtime):
+        """
+        :return: True if the file was successfully processed and has not changed since
+        """
+        row = self.get(path)
+        return row is not None and row[2] == DONE and row[0] == size and row[1] == mtime
+
+    def pending(self, entries):
+        """
+        Filter out files which do not need processing, marking the rest as started
+            (so that an interrupted run will pick them up again).
+
+        :param entries: iterable of (path, size, mtime); see `pykrfy.collect_input_entries`
+        :return: generator of paths
+        """
+        for path, size, mtime in entries:
+            if self.is_done(path, size, mtime):
+                continue
+            with self.conn:
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO file (path, size, mtime, status, updated) VALUES (?, ?, ?, ?, ?)',
+                    (os.path.abspath(path), size, mtime, STARTED, time.time())
+                )
+            yield path
+
+    def finish(self, path, filetype=None, output=None, error=None):
+        """
+        Record the outcome of processing a file.
+
+        :param filetype: FileType of the file, if known
+        :param output: location of output, relative to workspace
+        :param error: reason for failure; None if successful
+        """
+        with self.conn:
+            self.conn.execute(
+                'UPDATE file SET status = ?, filetype = ?, output = ?, error = ?, updated = ? WHERE path = ?',
+                (FAILED if error else DONE, filetype.name if filetype else None, output, error,
+                 time.time(), os.path.abspath(path))
+            )
+
+    def counts(self):
+        """
+        :return: dict of status to number of files
+        """
+        return dict(self.conn.execute('SELECT status, COUNT(*) FROM file GROUP BY status').fetchall())
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def get_manifest(manifest, workspace='.'):
+    """
+    :param manifest: Manifest, path to database, True to use the workspace default,
+        or None/False to process every file
+    :param workspace: directory containing the default manifest
+    :return: Manifest or None
+    """
+    if not manifest or isinstance(manifest, Manifest):
+        return manifest or None
+    if manifest is True:
+        manifest = os.path.join(workspace, MANIFEST_FILENAME)
+    return Manifest(manifest)
@@ -0,0 +1,163 @@
+"""Per-stage timers and counters.
+
+Stages (e.g., 'pdfminer', 'ocr') record wall and CPU time, and counters
+record page counts, bytes read and fallback paths taken (e.g.,
+'forced_conversion', 'tesseract_failed'). Nothing is recorded unless a
+`collect()` block is active in the current context, and every measurement
+is also passed to the callbacks registered with `add_hook`.
+
+    with collect() as m:
+        run_config(...)
+    print(m.summary())
+"""
+import contextlib
+import contextvars
+import threading
+import time
+from collections import Counter
+
+_current = contextvars.ContextVar('pykrman_metrics', default=None)
+_hooks = []
+
+
+class Metrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.wall = Counter()
+        self.cpu = Counter()
+        self.calls = Counter()
+        self.counters = Counter()
+
+    def add_time(self, stage, wall, cpu, calls=1):
+        with self._lock:
+            self.wall[stage] += wall
+            self.cpu[stage] += cpu
+            self.calls[stage] += calls
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def merge(self, other):
+        """
+        :param other: Metrics or the result of `Metrics.as_dict`
+        """
+        if isinstance(other, Metrics):
+            other = other.as_dict()
+        for stage, timing in other['stages'].items():
+            self.add_time(stage, timing['wall'], timing['cpu'], timing['calls'])
+        for name, n in other['counters'].items():
+            self.incr(name, n)
+
+    def as_dict(self):
+        """Plain, picklable/json-able, representation"""
+        with self._lock:
+            return {
+                'stages': {stage: {'calls': self.calls[stage], 'wall': self.wall[stage], 'cpu': self.cpu[stage]}
+                           for stage in self.calls},
+                'counters': dict(self.counters),
+            }
+
+    def summary(self):
+        """
+        :return: table of stages, slowest first, followed by counters
+        """
+        data = self.as_dict()
+        lines = [f'{"stage":<20}{"calls":>8}{"wall (s)":>12}{"cpu (s)":>12}']
+        for stage, timing in sorted(data['stages'].items(), key=lambda x: -x[1]['wall']):
+            lines.append(f'{stage:<20}{timing["calls"]:>8}{timing["wall"]:>12.3f}{timing["cpu"]:>12.3f}')
+        for name, n in sorted(data['counters'].items()):
+            lines.append(f'{name:<20}{n:>8}')
+        return '\n'.join(lines)
+
+
+def add_hook(callback):
+    """
+    Register a callback for every measurement, e.g., to forward to a metrics system.
+
+    :param callback: called as `callback(kind, name, value)`, where kind is
+        'stage' (value is dict of wall and cpu seconds), 'counter' (value is
+        the increment), 'document' (name is the input file; value is
+        `Metrics.as_dict` for that file) or 'run' (value is `Metrics.as_dict`)
+
+    Hooks are only registered in the calling process: files that `run_config` reads in worker
+    processes (`workers` > 1, `isolate`, or `aio`) only report their 'document' event, which
+    totals their stages and counters.
+    """
+    _hooks.append(callback)
+
+
+def remove_hook(callback):
+    _hooks.remove(callback)
+
+
+def emit(kind, name, value):
+    for callback in list(_hooks):
+        callback(kind, name, value)
+
+
+def current():
+    """
+    :return: Metrics being collected in this context, or None
+    """
+    return _current.get()
+
+
+@contextlib.contextmanager
+def collect(propagate=True):
+    """
+    Collect metrics for the enclosed block; when nested, the outer
+        collection also receives everything recorded by the inner one.
+
+    :param propagate: if False, don't pass metrics to the outer collection
+        (e.g., when the caller merges them itself)
+    :return: Metrics
+    """
+    metrics = Metrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+        parent = _current.get()
+        if propagate and parent is not None:
+            parent.merge(metrics)
+
+
+def incr(name, n=1):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.incr(name, n)
+    if _hooks:
+        emit('counter', name, n)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Time the enclosed block (CPU time is that of the current thread)"""
+    metrics = _current.get()
+    if metrics is None and not _hooks:
+        yield
+        return
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+        if metrics is not None:
+            metrics.add_time(name, wall, cpu)
+        if _hooks:
+            emit('stage', name, {'wall': wall, 'cpu': cpu})
+
+
+def timed_iter(name, iterable):
+    """Time how long each item of a (lazy) iterable takes to produce"""
+    it = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+        yield item
@@ -1,7 +1,14 @@
 import enum
+from collections import namedtuple
+
 
 class FileType(enum.Enum):
     UNKNOWN = 0
     TEXT_PDF = 1
     SCANNED_PDF = 2
     IMAGE = 3
+    MIXED_PDF = 4  # some pages have text, others are scanned
+
+
+# text of a single page/frame, and how it was obtained
+Page = namedtuple('Page', 'number filetype text')
@@ -0,0 +1,135 @@
+"""OCR engines which can be used to convert an image to text.
+
+The default `pytesseract` engine runs the `tesseract` executable for each
+image. The `tesserocr` engine keeps Tesseract loaded in-process, which avoids
+process startup and model loading for every page.
+"""
+import os
+import queue
+
+from loguru import logger
+
+
+class PytesseractEngine:
+    name = 'pytesseract'
+
+    def __init__(self, lang=None, psm=None, oem=None, config=''):
+        """
+        Run the `tesseract` executable once per image.
+
+        :param lang: Tesseract language(s), e.g., 'eng'
+        :param psm: page segmentation mode
+        :param oem: OCR engine mode
+        :param config: additional command line arguments for tesseract
+        """
+        self.lang = lang
+        options = []
+        if psm is not None:
+            options.append(f'--psm {psm}')
+        if oem is not None:
+            options.append(f'--oem {oem}')
+        if config:
+            options.append(config)
+        self.config = ' '.join(options)
+
+    def image_to_string(self, im):
+        import pytesseract
+        return pytesseract.image_to_string(im, lang=self.lang, config=self.config)
+
+    def version(self):
+        import pytesseract
+        return str(pytesseract.get_tesseract_version())
+
+    def close(self):
+        pass
+
+
+class TesserocrEngine:
+    name = 'tesserocr'
+
+    def __init__(self, lang='eng', psm=None, oem=None, path=None):
+        """
+        Keep warm Tesseract API handles, one for each thread concurrently
+            performing OCR. Handles are created on demand and re-used.
+
+        :param lang: Tesseract language(s), e.g., 'eng'
+        :param psm: page segmentation mode
+        :param oem: OCR engine mode
+        :param path: location of tessdata
+        """
+        import tesserocr  # fail early if not installed
+        self._tesserocr = tesserocr
+        self.lang = lang or 'eng'
+        self.psm = psm
+        self.oem = oem
+        self.path = path
+        self._handles = queue.LifoQueue()
+        self._created = []
+
+    def _new_handle(self):
+        kwargs = {'lang': self.lang}
+        if self.path:
+            kwargs['path'] = self.path
+        if self.psm is not None:
+            kwargs['psm'] = self._tesserocr.PSM(self.psm)
+        if self.oem is not None:
+            kwargs['oem'] = self._tesserocr.OEM(self.oem)
+        api = self._tesserocr.PyTessBaseAPI(**kwargs)
+        self._created.append(api)
+        return api
+
+    def image_to_string(self, im):
+        try:
+            api = self._handles.get_nowait()
+        except queue.Empty:
+            api = self._new_handle()
+        try:
+            api.SetImage(im)
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+            self._handles.put(api)
+
+    def version(self):
+        return self._tesserocr.tesseract_version()
+
+    def close(self):
+        for api in self._created:
+            api.End()
+        self._created = []
+        self._handles = queue.LifoQueue()
+
+
+ENGINES = {
+    PytesseractEngine.name: PytesseractEngine,
+    TesserocrEngine.name: TesserocrEngine,
+}
+_engines = {}
+
+
+def get_engine(engine=None, **kwargs):
+    """
+    Get an OCR engine, re-using engines (and their Tesseract handles)
+        within each process.
+
+    :param engine: name of engine ('pytesseract', 'tesserocr', or 'auto' to
+        prefer tesserocr when it is installed), or an engine instance
+    :param kwargs: options for the engine (e.g., lang, psm, oem)
+    :return: OCR engine
+    """
+    if engine is not None and not isinstance(engine, str):
+        return engine
+    engine = engine or PytesseractEngine.name
+    key = (os.getpid(), engine, tuple(sorted(kwargs.items())))  # handles cannot cross a fork
+    if key not in _engines:
+        if engine == 'auto':
+            try:
+                _engines[key] = TesserocrEngine(**kwargs)
+            except ImportError:
+                logger.info('tesserocr not installed: falling back to pytesseract')
+                _engines[key] = PytesseractEngine(**kwargs)
+        elif engine in ENGINES:
+            _engines[key] = ENGINES[engine](**kwargs)
+        else:
+            raise ValueError(f'Unrecognized OCR engine: {engine}. Expected one of: {", ".join(ENGINES)}.')
+    return _engines[key]
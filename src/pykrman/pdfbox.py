@@ -1,35 +1,202 @@
+"""Extract images from pdfs with PDFBox and OCR them.
+
+In batch mode, a single long-lived JVM extracts the images of every pdf
+(see `PdfBox`), and the images of each pdf are OCR'd on a pool of threads
+while the JVM moves on to the next pdf. Batch mode runs a small launcher
+from source, so needs Java 11 or later; otherwise, a JVM is started for
+each pdf.
+"""
 import os
 import shutil
 import subprocess
 import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
-from pytesseract import pytesseract
-
+from loguru import logger
 
 RESOURCE_PATH = os.path.abspath(__file__).split('src')[0] + 'res'
 JAVA_PATH = r'H:\exe\java\openjdk-12.0.1_windows-x64_bin\jdk-12.0.1\bin'
+PDFBOX_JAR = os.path.join(RESOURCE_PATH, 'pdfbox-app-2.0.15.jar')
+
+# reads "{prefix}\t{pdf}" lines from stdin, and answers each with "ok" or "error\t{message}"
+BATCH_SOURCE = r'''
+import java.io.BufferedReader;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import org.apache.pdfbox.tools.ExtractImages;
+
+public class BatchExtractImages {
+    public static void main(String[] args) throws Exception {
+        PrintStream out = new PrintStream(System.out, true, "UTF-8");
+        System.setOut(System.err);  // keep PDFBox's messages out of the responses
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+        String line;
+        while ((line = in.readLine()) != null) {
+            String[] request = line.split("\t", 2);
+            try {
+                ExtractImages.main(new String[]{"-prefix", request[0], request[1]});
+                out.println("ok");
+            } catch (Exception e) {
+                out.println("error\t" + String.valueOf(e).replace('\n', ' '));
+            }
+        }
+    }
+}
+'''
+
+
+def find_java(java=None):
+    """
+    :param java: path to java executable
+    :return: `java`, java in `JAVA_PATH`, or java on the PATH
+    """
+    if java:
+        return java
+    for name in ('java.exe', 'java'):
+        if os.path.isfile(os.path.join(JAVA_PATH, name)):
+            return os.path.join(JAVA_PATH, name)
+    return shutil.which('java') or 'java'
+
+
+def image_prefix(pdf, image_dir):
+    """Images are written as `{image_dir}/{pdf name}-{n}.{ext}`"""
+    return os.path.join(image_dir, os.path.splitext(os.path.basename(pdf))[0])
+
+
+def extract_images(pdf, image_dir, java=None, jar=PDFBOX_JAR):
+    """Extract images from a single pdf in a new JVM"""
+    os.makedirs(image_dir, exist_ok=True)
+    subprocess.run([find_java(java), '-jar', jar, 'ExtractImages', '-prefix', image_prefix(pdf, image_dir),
+                    os.path.abspath(pdf)], check=True)
+
+
+class PdfBox:
+
+    def __init__(self, java=None, jar=PDFBOX_JAR):
+        """
+        A JVM running PDFBox, which extracts images from one pdf after another.
+            Use as a context manager, or call `close`.
+
+        :param java: path to java executable (11 or later)
+        :param jar: path to pdfbox-app jar
+        """
+        self.java = find_java(java)
+        self.jar = jar
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._source = os.path.join(self._tmpdir.name, 'BatchExtractImages.java')
+        with open(self._source, 'w', encoding='utf8') as out:
+            out.write(BATCH_SOURCE)
+        self.proc = None
+        self._start()
+
+    def _start(self):
+        if self.proc is not None:  # replacing a JVM which exited
+            self.proc.stdin.close()
+            self.proc.stdout.close()
+        self.proc = subprocess.Popen([self.java, '-cp', self.jar, self._source], stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE, encoding='utf8', bufsize=1)
 
+    def extract_images(self, pdf, image_dir):
+        """
+        If the JVM died (e.g., ran out of memory on an earlier pdf), a new one is started first.
 
-def pdfs_to_text(d):
-    cmd = f'{JAVA_PATH}/java -jar {RESOURCE_PATH}/pdfbox-app-2.0.15.jar ExtractImages {{pdf}}'
-    for fo in os.scandir(d):
-        if fo.is_file() and fo.name.endswith('.pdf'):
-            outdir = os.path.splitext(fo.path)[0]
-            os.makedirs(outdir, exist_ok=True)
-            shutil.copy(fo.path, outdir)
-            dest = os.path.join(outdir, fo.name)
-            os.chdir(outdir)
-            p = subprocess.Popen(cmd.format(pdf=dest), cwd=outdir)
-            p.communicate()
-            os.remove(dest)
-            images_to_text(outdir, f'{outdir}.txt')
+        :raises RuntimeError: if PDFBox failed
+        """
+        os.makedirs(image_dir, exist_ok=True)
+        if self.proc.poll() is not None:
+            logger.warning(f'Restarting PDFBox, which exited with code {self.proc.returncode}')
+            self._start()
+        try:
+            self.proc.stdin.write(f'{image_prefix(pdf, image_dir)}\t{os.path.abspath(pdf)}\n')
+            self.proc.stdin.flush()
+            response = self.proc.stdout.readline().rstrip('\n')
+        except (BrokenPipeError, ConnectionResetError):
+            response = ''
+        if response != 'ok':
+            if not response:  # the next pdf gets a new JVM
+                self.proc.wait()
+            raise RuntimeError(f'PDFBox failed on {pdf}: {response.partition(chr(9))[2] or "JVM exited"}')
 
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.stdin.close()
+            self.proc.wait()
+        self._tmpdir.cleanup()
 
-def images_to_text(d, ofp):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _image_number(fn):
+    return int(os.path.splitext(fn)[0].split('-')[-1])
+
+
+def list_images(d):
+    """
+    :return: paths of extracted images, in the order PDFBox wrote them
+    """
+    return [os.path.join(d, fn) for fn in sorted(os.listdir(d), key=_image_number)]
+
+
+def _image_file_to_text(fp, ocr=None):
+    from PIL import Image
+    from pykrman.pykrfy import image_to_string
+    with Image.open(fp) as im:
+        return image_to_string(im, ocr)
+
+
+def _write_text(ofp, futures):
     with open(ofp, 'w', encoding='utf8') as out:
-        for fn in sorted(os.listdir(d), key=lambda x: int(x.split('.')[0].split('-')[-1])):
-            s = pytesseract.image_to_string(os.path.join(d, fn))
-            out.write(s + '\n')
+        for future in futures:
+            out.write(future.result() + '\n')
+
+
+def pdfs_to_text(d, outdir=None, workers=1, ocr=None, batch=True, java=None, jar=PDFBOX_JAR):
+    """
+    Extract the images of every pdf in a directory, and OCR them into `{outdir}/{name}.txt`.
+
+    :param d: directory containing pdfs
+    :param outdir: where to write images (in `{outdir}/{name}/`) and text; defaults to `d`
+    :param workers: number of images to OCR concurrently, while PDFBox extracts the next pdf
+    :param ocr: OCR engine and its options; see `ocr.get_engine`
+    :param batch: extract all pdfs in one JVM; otherwise start a JVM for each pdf
+    """
+    outdir = outdir or d
+    pdfs = sorted(fo.path for fo in os.scandir(d) if fo.is_file() and fo.name.endswith('.pdf'))
+    pdfbox = PdfBox(java, jar) if batch else None
+    pending = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for pdf in pdfs:
+                image_dir = os.path.join(outdir, os.path.splitext(os.path.basename(pdf))[0])
+                try:
+                    if pdfbox:
+                        pdfbox.extract_images(pdf, image_dir)
+                    else:
+                        extract_images(pdf, image_dir, java, jar)
+                except Exception as e:
+                    logger.error(f'Failed to extract images: {pdf}, {e}')
+                    continue
+                # OCR in the background while the next pdf is extracted
+                pending.append((f'{image_dir}.txt', [pool.submit(_image_file_to_text, fp, ocr)
+                                                     for fp in list_images(image_dir)]))
+                while pending and all(future.done() for future in pending[0][1]):
+                    _write_text(*pending.pop(0))
+            for ofp, futures in pending:
+                _write_text(ofp, futures)
+    finally:
+        if pdfbox:
+            pdfbox.close()
+
+
+def images_to_text(d, ofp, workers=1, ocr=None):
+    """OCR the images extracted from a pdf into `ofp`, in page order"""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        _write_text(ofp, [pool.submit(_image_file_to_text, fp, ocr) for fp in list_images(d)])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,369 @@
+"""Extract the images embedded in scanned pdfs.
+
+Two backends are available:
+    * pikepdf: qpdf reads objects lazily by byte offset and decodes images
+        natively, including filter chains, predictors and JBIG2 (requires
+        `jbig2dec`); preferred when installed
+    * pypdf2: walks each page's /XObject dictionary in Python, decoding
+        nested filter chains and raw bitmaps itself
+"""
+import io
+import os
+import re
+import shutil
+import struct
+import subprocess
+import tempfile
+import zlib
+
+from loguru import logger
+from PIL import Image, ImageOps
+
+from pykrman import limits, metrics
+from pykrman.limits import LimitExceeded
+
+BACKENDS = ('auto', 'pikepdf', 'pypdf2')
+
+IMAGE_CODECS = {
+    '/CCITTFaxDecode': 'tiff',
+    '/DCTDecode': 'jpg',
+    '/JPXDecode': 'jp2',
+    '/JBIG2Decode': 'jbig2',
+}
+FILTER_ABBREVIATIONS = {
+    '/AHx': '/ASCIIHexDecode',
+    '/A85': '/ASCII85Decode',
+    '/LZW': '/LZWDecode',
+    '/Fl': '/FlateDecode',
+    '/RL': '/RunLengthDecode',
+    '/CCF': '/CCITTFaxDecode',
+    '/DCT': '/DCTDecode',
+}
+COLORSPACE_MODES = {
+    '/DeviceGray': 'L',
+    '/CalGray': 'L',
+    '/DeviceRGB': 'RGB',
+    '/CalRGB': 'RGB',
+    '/DeviceCMYK': 'CMYK',
+}
+ICC_MODES = {1: 'L', 3: 'RGB', 4: 'CMYK'}
+
+
+def iter_page_images(pdf, image_dir=None, backend='auto', pagenos=None):
+    """
+    :param pdf: binary file-like object containing a pdf
+    :param image_dir: if specified, save the extracted images here
+    :param backend: 'pikepdf', 'pypdf2', or 'auto' to prefer pikepdf when installed
+    :param pagenos: if specified, only extract images from these (0-based) pages
+    :return: generator of (page number, image) in page order
+    """
+    if backend == 'auto':
+        try:
+            import pikepdf
+            backend = 'pikepdf'
+        except ImportError:
+            backend = 'pypdf2'
+    if backend == 'pikepdf':
+        yield from _iter_pikepdf_images(pdf, image_dir, pagenos)
+    elif backend == 'pypdf2':
+        yield from _iter_pypdf2_images(pdf, image_dir, pagenos)
+    else:
+        raise ValueError(f'Unrecognized pdf image backend: {backend}. Expected one of: {", ".join(BACKENDS)}.')
+
+
+def _image_order(name):
+    """Images are not listed in the correct order: sort on the number in their name (e.g., /Im12)"""
+    m = re.search(r'\d+', str(name))
+    return (0, int(m.group())) if m else (1, str(name))
+
+
+def _page_range(n_pages, pagenos=None):
+    if pagenos is None:
+        return range(n_pages)
+    return sorted(i for i in pagenos if 0 <= i < n_pages)
+
+
+def _iter_pikepdf_images(pdf, image_dir=None, pagenos=None):
+    import pikepdf
+    from pikepdf import PdfImage
+
+    with pikepdf.open(pdf) as doc:
+        for i in _page_range(len(doc.pages), pagenos):
+            page = doc.pages[i]
+            images = page.get_images() if hasattr(page, 'get_images') else page.images
+            for name in sorted(images, key=_image_order):
+                try:
+                    pdf_image = PdfImage(images[name])
+                    limits.check_pixels(pdf_image.width, pdf_image.height, f'image {name} on page {i}')
+                    img = pdf_image.as_pil_image()
+                except LimitExceeded:
+                    raise
+                except Exception as e:
+                    logger.warning(f'Failed to read image {name} on page {i}: {e}')
+                    metrics.incr('image_decode_failed')
+                    continue
+                if image_dir:
+                    pdf_image.extract_to(fileprefix=os.path.join(image_dir, f'{i}_{str(name)[1:]}'))
+                yield i, img
+
+
+def _iter_pypdf2_images(pdf, image_dir=None, pagenos=None):
+    import PyPDF2
+
+    reader = PyPDF2.PdfFileReader(pdf)
+    for i in _page_range(reader.getNumPages(), pagenos):
+        page = reader.getPage(i)
+        try:
+            x_object = page['/Resources']['/XObject'].getObject()
+        except KeyError:
+            logger.info(f'No images on page {i}')
+            continue
+        for obj in sorted(x_object, key=_image_order):
+            if x_object[obj]['/Subtype'] != '/Image':
+                continue
+            try:
+                limits.check_pixels(_get(x_object[obj], '/Width', 0), _get(x_object[obj], '/Height', 0),
+                                    f'image {obj} on page {i}')
+                img, ext, data = decode_image(x_object[obj])
+            except LimitExceeded:
+                raise
+            except Exception as e:
+                logger.warning(f'Failed to read image {obj} on page {i}: {e}')
+                metrics.incr('image_decode_failed')
+                if '/FlateDecode' in _as_list(x_object[obj].get('/Filter')):
+                    metrics.incr('flate_decode_failed')
+                continue
+            if image_dir and data:
+                with open(os.path.join(image_dir, f'{i}_{obj[1:]}.{ext}'), 'wb') as out:
+                    out.write(data)
+            if img:
+                yield i, img
+
+
+def _resolve(value):
+    return value.getObject() if hasattr(value, 'getObject') else value
+
+
+def _get(obj, key, default=None):
+    """`obj.get(key, default)`, resolving indirect references (which PyPDF2's `get` returns as they are)"""
+    return _resolve(obj.get(key, default))
+
+
+def _as_list(value):
+    value = _resolve(value)
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [_resolve(v) for v in value]
+    return [value]
+
+
+def _get_filters(x_object):
+    """
+    :return: list of (filter name, decode parameters)
+    """
+    filters = [FILTER_ABBREVIATIONS.get(f, f) for f in _as_list(x_object.get('/Filter'))]
+    parms = _as_list(x_object.get('/DecodeParms', x_object.get('/DP')))
+    parms += [None] * (len(filters) - len(parms))
+    return [(f, p if isinstance(p, dict) else {}) for f, p in zip(filters, parms)]
+
+
+def decode_image(x_object):
+    """
+    Decode an image XObject, applying its whole filter chain.
+
+    :param x_object: PyPDF2 stream object with /Subtype /Image
+    :return: (PIL Image or None, extension, image data)
+    """
+    # noinspection PyProtectedMember
+    data = x_object._data  # sorry, getData() does not work for CCITTFaxDecode
+    filters = _get_filters(x_object)
+    for k, (x_filter, parms) in enumerate(filters):
+        if x_filter in IMAGE_CODECS:  # image codecs must be the final filter
+            return _decode_codec(x_object, x_filter, parms, data), IMAGE_CODECS[x_filter], data
+        if x_filter == '/FlateDecode' and k == len(filters) - 1:
+            png = _flate_to_png(x_object, parms, data)
+            if png:
+                return Image.open(io.BytesIO(png)), 'png', png
+        data = _decode_stream(x_filter, parms, data)
+    img = _raw_to_image(x_object, data)
+    return img, 'png', None
+
+
+def _decode_stream(x_filter, parms, data):
+    from PyPDF2 import filters
+
+    if x_filter == '/FlateDecode':
+        return filters.FlateDecode.decode(data, parms)
+    elif x_filter == '/LZWDecode':
+        return filters.LZWDecode.decode(data, parms)
+    elif x_filter == '/ASCII85Decode':
+        return filters.ASCII85Decode.decode(data)
+    elif x_filter == '/ASCIIHexDecode':
+        return filters.ASCIIHexDecode.decode(data)
+    elif x_filter == '/RunLengthDecode':
+        return run_length_decode(data)
+    raise ValueError(f'Unsupported filter: {x_filter}')
+
+
+def run_length_decode(data):
+    result = bytearray()
+    i = 0
+    while i < len(data):
+        length = data[i]
+        if length == 128:  # EOD
+            break
+        if length < 128:
+            result += data[i + 1:i + length + 2]
+            i += length + 2
+        else:
+            result += data[i + 1:i + 2] * (257 - length)
+            i += 2
+    return bytes(result)
+
+
+def _decode_codec(x_object, x_filter, parms, data):
+    """
+    The  CCITTFaxDecode filter decodes image data that has been encoded using
+    either Group 3 or Group 4 CCITT facsimile (fax) encoding. CCITT encoding is
+    designed to achieve efficient compression of monochrome (1 bit per pixel) image
+    data at relatively low resolutions, and so is useful only for bitmap image data, not
+    for color images, grayscale images, or general data.
+
+    K < 0 --- Pure two-dimensional encoding (Group 4)
+    K = 0 --- Pure one-dimensional encoding (Group 3, 1-D)
+    K > 0 --- Mixed one- and two-dimensional encoding (Group 3, 2-D)
+    """
+    if x_filter == '/CCITTFaxDecode':
+        ccitt_group = 4 if _get(parms, '/K', 0) < 0 else 3
+        width = _get(parms, '/Columns', x_object['/Width'])
+        height = _get(parms, '/Rows', x_object['/Height'])
+        tiff_header = tiff_header_for_ccitt(width, height, len(data), ccitt_group)
+        return Image.open(io.BytesIO(tiff_header + data))
+    elif x_filter in {'/DCTDecode', '/JPXDecode'}:  # jpg, jp2
+        return Image.open(io.BytesIO(data))
+    elif x_filter == '/JBIG2Decode':
+        global_stream = _get(parms, '/JBIG2Globals')
+        return decode_jbig2(data, global_stream.getData() if global_stream else None)
+
+
+def decode_jbig2(data, global_data=None):
+    """
+    Decode an embedded JBIG2 stream using `jbig2dec`.
+
+    :param data: JBIG2 page data
+    :param global_data: content of /JBIG2Globals, if any
+    :return: PIL Image or None if jbig2dec is not installed
+    """
+    jbig2dec = shutil.which('jbig2dec')
+    if not jbig2dec:
+        logger.warning('Unable to decode /JBIG2Decode: install jbig2dec')
+        return None
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cmd = [jbig2dec, '--embedded', '--format', 'png', '-o', os.path.join(tmpdir, 'page.png')]
+        if global_data:
+            with open(os.path.join(tmpdir, 'global.jbig2'), 'wb') as out:
+                out.write(global_data)
+            cmd.append(os.path.join(tmpdir, 'global.jbig2'))
+        with open(os.path.join(tmpdir, 'page.jbig2'), 'wb') as out:
+            out.write(data)
+        cmd.append(os.path.join(tmpdir, 'page.jbig2'))
+        subprocess.run(cmd, check=True, capture_output=True)
+        with Image.open(os.path.join(tmpdir, 'page.png')) as im:
+            im.load()
+            return im.copy()
+
+
+def _color_space(x_object):
+    """
+    :return: (PIL mode, palette or None) for the image's colour space
+    """
+    if _get(x_object, '/ImageMask'):
+        return '1', None
+    cs = _get(x_object, '/ColorSpace', '/DeviceGray')
+    if isinstance(cs, list):
+        family = _resolve(cs[0])
+        if family == '/ICCBased':
+            return ICC_MODES[cs[1].getObject()['/N']], None
+        elif family == '/Indexed':
+            base = cs[1].getObject()
+            base_mode = _color_space({'/ColorSpace': base})[0]
+            lookup = cs[3].getObject()
+            lookup = lookup.getData() if hasattr(lookup, 'getData') else bytes(lookup)
+            if base_mode == 'L':  # expand to rgb palette
+                lookup = bytes(b for v in lookup for b in (v, v, v))
+            elif base_mode != 'RGB':
+                raise ValueError(f'Unsupported /Indexed base colour space: {base}')
+            return 'P', lookup
+        cs = family
+    return COLORSPACE_MODES[cs], None
+
+
+def _inverted(x_object):
+    decode = _as_list(x_object.get('/Decode'))
+    return bool(decode) and decode[0] > decode[1]
+
+
+def _flate_to_png(x_object, parms, data):
+    """
+    FlateDecode with a PNG predictor is the same encoding as PNG image data,
+        so wrap it in a PNG container rather than decoding it in Python.
+
+    :return: png file content or None if the image cannot be represented as a png
+    """
+    width, height = x_object['/Width'], x_object['/Height']
+    bpc = _get(x_object, '/BitsPerComponent', 8)
+    if (_get(parms, '/Predictor', 1) < 10 or _get(parms, '/Columns', 1) != width
+            or bpc not in {1, 2, 4, 8} or _inverted(x_object)):
+        return None
+    mode, palette = _color_space(x_object)
+    color_type = {'L': 0, '1': 0, 'RGB': 2, 'P': 3}.get(mode)
+    if color_type is None or _get(parms, '/Colors', 1) != {0: 1, 2: 3, 3: 1}[color_type] \
+            or _get(parms, '/BitsPerComponent', 8) != bpc or (color_type == 2 and bpc != 8):
+        return None
+
+    def chunk(tag, body):
+        return struct.pack('>I', len(body)) + tag + body + struct.pack('>I', zlib.crc32(tag + body))
+
+    png = b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, bpc, color_type, 0, 0, 0))
+    if palette:
+        png += chunk(b'PLTE', palette)
+    return png + chunk(b'IDAT', data) + chunk(b'IEND', b'')
+
+
+def _raw_to_image(x_object, data):
+    """
+    Build image from decoded (raw) samples.
+    """
+    size = (x_object['/Width'], x_object['/Height'])
+    bpc = _get(x_object, '/BitsPerComponent', 1 if _get(x_object, '/ImageMask') else 8)
+    mode, palette = _color_space(x_object)
+    if mode == 'P':
+        img = Image.frombytes('P', size, data, 'raw', 'P' if bpc == 8 else f'P;{bpc}')
+        img.putpalette(palette)
+        return img
+    if bpc == 1 and mode in {'1', 'L'}:
+        return Image.frombytes('1', size, data, 'raw', '1;I' if _inverted(x_object) else '1')
+    if bpc != 8:
+        raise ValueError(f'Unsupported /BitsPerComponent {bpc} for {mode}')
+    img = Image.frombytes(mode, size, data)
+    return ImageOps.invert(img) if _inverted(x_object) and mode != 'CMYK' else img
+
+
+def tiff_header_for_ccitt(width, height, img_size, ccitt_group=4):
+    tiff_header_struct = '<' + '2s' + 'h' + 'l' + 'h' + 'hhll' * 8 + 'h'
+    return struct.pack(tiff_header_struct,
+                       b'II',  # Byte order indication: Little indian
+                       42,  # Version number (always 42)
+                       8,  # Offset to first IFD
+                       8,  # Number of tags in IFD
+                       256, 4, 1, width,  # ImageWidth, LONG, 1, width
+                       257, 4, 1, height,  # ImageLength, LONG, 1, lenght
+                       258, 3, 1, 1,  # BitsPerSample, SHORT, 1, 1
+                       259, 3, 1, ccitt_group,  # Compression, SHORT, 1, 4 = CCITT Group 4 fax encoding
+                       262, 3, 1, 0,  # Threshholding, SHORT, 1, 0 = WhiteIsZero
+                       273, 4, 1, struct.calcsize(tiff_header_struct),  # StripOffsets, LONG, 1, len of header
+                       278, 4, 1, height,  # RowsPerStrip, LONG, 1, lenght
+                       279, 4, 1, img_size,  # StripByteCounts, LONG, 1, size of image
+                       0  # last IFD
+                       )
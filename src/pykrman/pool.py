@@ -0,0 +1,90 @@
+"""Helpers for fanning work out over a pool of workers.
+"""
+import contextvars
+import os
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+def resolve_workers(workers):
+    """
+    :param workers: number of workers; 0 or None means use all cores
+    :return: positive number of workers
+    """
+    if not workers:
+        return os.cpu_count() or 1
+    return max(int(workers), 1)
+
+
+def iter_completed(func, items, workers=1, max_pending=None, executor_cls=ProcessPoolExecutor,
+                   initializer=None, initargs=(), **kwargs):
+    """
+    Apply `func(item, **kwargs)` to every item, yielding results as they finish
+        rather than in submission order. Only `max_pending` items are submitted
+        at a time so long (or lazy) inputs are never fully materialised.
+
+    :param func: callable; must be picklable when using processes
+    :param items: iterable of arguments
+    :param workers: number of workers; 1 runs inline without a pool
+    :param max_pending: maximum number of submitted but unfinished items
+    :param executor_cls: `concurrent.futures` executor class
+    :param initializer: called with `initargs` once in each worker before any
+        items (e.g., to load shared state which would be costly to send with every item)
+    :param kwargs: passed to each call of `func`
+    :return: generator of (item, future) pairs; call `future.result()` to get
+        the result or re-raise the worker's exception
+    """
+    workers = resolve_workers(workers)
+    if workers == 1:
+        if initializer:
+            initializer(*initargs)
+        for item in items:
+            future = Future()
+            try:
+                future.set_result(func(item, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            yield item, future
+        return
+
+    max_pending = max_pending or workers * 2
+    pending = {}
+    in_threads = issubclass(executor_cls, ThreadPoolExecutor)
+    with executor_cls(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        for item in items:
+            if in_threads:  # e.g., so metrics are recorded for the caller
+                future = executor.submit(contextvars.copy_context().run, func, item, **kwargs)
+            else:
+                future = executor.submit(func, item, **kwargs)
+            pending[future] = item
+            if len(pending) >= max_pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future
+
+
+def _apply_indexed(indexed_item, _func=None, **kwargs):
+    return _func(indexed_item[1], **kwargs)
+
+
+def iter_ordered(func, items, workers=1, max_pending=None, executor_cls=ProcessPoolExecutor,
+                 initializer=None, initargs=(), **kwargs):
+    """
+    Like `iter_completed`, but yield in the order of `items`: results which
+        finish early are held back until all earlier items have been yielded.
+
+    :return: generator of (item, future) pairs, in input order
+    """
+    finished = {}
+    next_index = 0
+    for (index, item), future in iter_completed(_apply_indexed, enumerate(items), workers=workers,
+                                                max_pending=max_pending, executor_cls=executor_cls,
+                                                initializer=initializer, initargs=initargs,
+                                                _func=func, **kwargs):
+        finished[index] = item, future
+        while next_index in finished:
+            yield finished.pop(next_index)
+            next_index += 1
@@ -0,0 +1,138 @@
+"""Clean up images before handing them to Tesseract.
+
+Two implementations are available:
+    * pil: the original chain of RGBA conversion, median filter, contrast
+        enhancement and dithered conversion to 1-bit; each step allocates a
+        new full-size image
+    * numpy: works on a single 8-bit grayscale buffer, applying contrast as a
+        lookup table in place, and binarizes with a global (Otsu) or
+        adaptive (Sauvola) threshold
+"""
+METHODS = ('pil', 'numpy')
+THRESHOLDS = ('otsu', 'sauvola', 'fixed', 'dither')
+
+
+def preprocess_image(im, method='pil', median=3, contrast=2.0, stretch=False,
+                     threshold='otsu', level=128, window=25, k=0.2):
+    """
+    Preprocess an image for OCR.
+
+    :param im: PIL Image
+    :param method: 'pil' (original chain) or 'numpy'
+    :param median: size of median filter; 0 to disable
+    :param contrast: contrast enhancement factor (as in `ImageEnhance.Contrast`); 1 to disable
+    :param stretch: (numpy only) linearly stretch the 1st-99th percentile of intensities to full range
+    :param threshold: (numpy only) 'otsu', 'sauvola', 'fixed' (at `level`), or
+        'dither' (Floyd-Steinberg, as with the pil method)
+    :param level: (numpy only) threshold for 'fixed'
+    :param window: (numpy only) size of the neighbourhood for 'sauvola'
+    :param k: (numpy only) sensitivity for 'sauvola'
+    :return: 1-bit PIL Image
+    """
+    if method == 'pil':
+        return _pil_preprocess(im, median, contrast)
+    elif method == 'numpy':
+        return _numpy_preprocess(im, median, contrast, stretch, threshold, level, window, k)
+    raise ValueError(f'Unrecognized preprocessing method: {method}. Expected one of: {", ".join(METHODS)}.')
+
+
+def _pil_preprocess(im, median=3, contrast=2.0):
+    from PIL import ImageEnhance, ImageFilter
+    cim = im.convert('RGBA')
+    if median:
+        cim = cim.filter(ImageFilter.MedianFilter(median))
+    if contrast != 1:
+        enhancer = ImageEnhance.Contrast(cim)
+        cim = enhancer.enhance(contrast)
+    return cim.convert('1')
+
+
+def _numpy_preprocess(im, median=3, contrast=2.0, stretch=False, threshold='otsu', level=128,
+                      window=25, k=0.2):
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError('The numpy preprocessing method requires numpy: `pip install numpy`.')
+    from PIL import Image, ImageEnhance, ImageFilter
+    gray = im.convert('L')  # the only full-size copy of the source image
+    if median:  # C implementation on a single channel
+        gray = gray.filter(ImageFilter.MedianFilter(median))
+    if threshold == 'dither':
+        if contrast != 1:
+            gray = ImageEnhance.Contrast(gray).enhance(contrast)
+        return gray.convert('1')
+    arr = np.array(gray)
+    gray.close()
+    lut = np.arange(256, dtype=np.float32)
+    if stretch:
+        cdf = np.cumsum(np.bincount(arr.ravel(), minlength=256))
+        low, high = np.searchsorted(cdf, [cdf[-1] * 0.01, cdf[-1] * 0.99])
+        if high > low:
+            lut = (lut - low) * (255 / (high - low))
+    if contrast != 1:
+        # same as ImageEnhance.Contrast: interpolate from the mean grey
+        mean = int(arr.mean() + 0.5)
+        lut = mean + contrast * (lut - mean)
+    if stretch or contrast != 1:
+        np.take(np.clip(lut, 0, 255).astype(np.uint8), arr, out=arr)
+    if threshold == 'otsu':
+        mask = arr > otsu_threshold(arr)
+    elif threshold == 'sauvola':
+        mask = arr > sauvola_threshold(arr, window, k)
+    elif threshold == 'fixed':
+        mask = arr > level
+    else:
+        raise ValueError(f'Unrecognized threshold: {threshold}. Expected one of: {", ".join(THRESHOLDS)}.')
+    return Image.fromarray(mask)
+
+
+def otsu_threshold(arr):
+    """
+    :param arr: 2d uint8 numpy array
+    :return: threshold maximizing between-class variance
+    """
+    import numpy as np
+    hist = np.bincount(arr.ravel(), minlength=256).astype(np.float64)
+    weight = np.cumsum(hist)
+    total = weight[-1]
+    cum_mean = np.cumsum(hist * np.arange(256))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (cum_mean[-1] * weight - cum_mean * total) ** 2 / (weight * (total - weight))
+    return int(np.nanargmax(between))
+
+
+def sauvola_threshold(arr, window=25, k=0.2, r=128):
+    """
+    Local threshold: mean * (1 + k * (std / r - 1)) over a `window` neighbourhood,
+        computed with integral images.
+
+    :param arr: 2d uint8 numpy array
+    :return: 2d float array of thresholds
+    """
+    import numpy as np
+    half = window // 2
+    padded = np.pad(arr, half + 1, mode='edge').astype(np.float64)
+    height, width = arr.shape
+    area = float(window * window)
+
+    def window_sum(integral):
+        return (integral[window:window + height, window:window + width]
+                - integral[:height, window:window + width]
+                - integral[window:window + height, :width]
+                + integral[:height, :width])
+
+    integral = padded.cumsum(0).cumsum(1)
+    mean = window_sum(integral) / area
+    np.square(padded, out=padded)
+    integral = padded.cumsum(0).cumsum(1)
+    del padded
+    std = window_sum(integral) / area
+    del integral
+    std -= mean ** 2
+    np.sqrt(np.clip(std, 0, None, out=std), out=std)
+    std /= r
+    std -= 1
+    std *= k
+    std += 1
+    std *= mean
+    return std
@@ -1,25 +1,34 @@
-import imghdr
+import heapq
+import itertools
 import json
 import os
-import shutil
 import sys
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from io import BytesIO
 from pathlib import Path
 
-import pytesseract
-from pytesseract.pytesseract import TesseractNotFoundError
-import yaml
-from PIL import Image, ImageFilter, ImageEnhance
-from jsonschema import validate
 from loguru import logger
 
+from pykrman import limits, metrics
+from pykrman.cache import cache_key, content_hash, get_cache
+from pykrman.classify import classify_pdf, classify_pdf_pages
+from pykrman.limits import LimitExceeded
+from pykrman.manifest import get_manifest
+from pykrman.ocr import get_engine
+from pykrman.pool import iter_completed, iter_ordered
+from pykrman.preprocess import preprocess_image
 from pykrman.schema import SCHEMA
-from pykrman.util import convert_pdf_to_image, read_pdf
-from pykrman.names import FileType
+from pykrman.sinks import document_record, get_sink
+from pykrman.sniff import sniff, sniff_ext
+from pykrman.worker import WorkerError
+from pykrman.util import convert_pdf_to_image, iter_pdf_images, iter_pdf_text, read_pdf
+from pykrman.names import FileType, Page
 
 
 def config_parser(config_fp):
+    import yaml
+    from jsonschema import validate
     with open(config_fp) as fh:
         if config_fp.endswith('json'):
             config = json.load(fh)
@@ -32,184 +41,906 @@ def config_parser(config_fp):
     run_config(**config)
 
 
-def collect_input_files(files=None, directories=None, filetypes=None):
+def collect_input_files(files=None, directories=None, filetypes=None, recursive=False):
     """
     :param files:
     :param directories:
     :param filetypes:
+    :param recursive: also look in subdirectories
     :return: Generator of files to process
     """
+    for path, _, _ in collect_input_entries(files, directories, filetypes, recursive, stat=False):
+        yield path
+
+
+def collect_input_entries(files=None, directories=None, filetypes=None, recursive=False, stat=True):
+    """
+    Like `collect_input_files`, but also return size and modification time.
+        Directories are scanned with `os.scandir` so that (on most platforms)
+        file types are known without additional `stat` calls.
+
+    :param stat: if False, don't look up size and mtime
+    :return: generator of (path, size, mtime in ns)
+    """
     filetypes = set(filetypes) if filetypes else set()
     for f in files or []:
-        yield f
+        if stat:
+            st = os.stat(f)
+            yield f, st.st_size, st.st_mtime_ns
+        else:
+            yield f, None, None
     for d in directories or []:
-        for f in os.listdir(d):
-            if not filetypes or os.path.splitext(f)[-1] in filetypes:
-                yield os.path.join(d, f)
+        for entry in _scan_directory(d, recursive):
+            if not filetypes or os.path.splitext(entry.name)[-1] in filetypes:
+                if stat:
+                    st = entry.stat()
+                    yield entry.path, st.st_size, st.st_mtime_ns
+                else:
+                    yield entry.path, None, None
 
 
-def run_config(data=None, workspace='.', default_ext='pdf', force_convert=True):
+def _scan_directory(d, recursive=False):
+    """
+    :return: generator of DirEntry for files, sorted by name within each directory
+    """
+    with os.scandir(d) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        if entry.is_dir():
+            if recursive:
+                yield from _scan_directory(entry.path, recursive)
+        else:
+            yield entry
+
+
+def run_config(data=None, workspace='.', default_ext='pdf', force_convert=True, workers=1,
+               page_workers=1, max_frames=None, cache=False, stream_pages=False,
+               keep_intermediates=False, ocr=None, preprocess=None, pdf_workers=1, laparams=None,
+               page_output=False, manifest=None, timeout=None, max_memory=None, max_pages=None,
+               max_pixels=None, isolate=False, sink=None):
     """
 
     :param default_ext: extension to use for unidentified files
     :param data: see `schema.py`
     :param workspace: directory to do work in
-    :return:
+    :param workers: number of processes to read files with; 0 to use all cores
+    :param page_workers: number of pages/frames of each file to OCR concurrently
+    :param max_frames: maximum number of decoded frames to hold in memory per file
+    :param stream_pages: OCR scanned pdfs one page at a time instead of merging
+        all pages into a single image
+    :param keep_intermediates: write copies of inputs and extracted images to
+        `workspace/out`; otherwise files are processed entirely in memory
+    :param ocr: OCR engine and its options, e.g., {'engine': 'tesserocr', 'psm': 6};
+        see `ocr.get_engine`
+    :param preprocess: image preprocessing options, e.g., {'method': 'numpy', 'threshold': 'sauvola'};
+        see `preprocess.preprocess_image`
+    :param pdf_workers: number of processes to extract text from long pdfs with
+    :param laparams: pdfminer layout options (see `util.read_pdf`); False to skip layout analysis
+    :param cache: True to cache results in the workspace, or path to a cache
+        database; files which have already been extracted are not re-processed
+    :param page_output: write the text of each page to `workspace/text/{name}/{page}.txt`
+        as soon as it is extracted, rather than one file per input
+    :param manifest: True to keep a manifest in the workspace, or path to a manifest
+        database; only new, changed or previously failed (or unfinished) files are processed
+    :param timeout: seconds to allow for each file; files taking longer are killed and
+        recorded as failed (implies `isolate`)
+    :param max_memory: megabytes each file may use (implies `isolate`)
+    :param max_pages: skip files with more pages (or image frames) than this
+    :param max_pixels: skip files containing (or requiring) a larger image than this
+    :param isolate: read each file in its own worker process (see `worker.run`), so a
+        file which crashes, hangs or runs out of memory can't take the batch with it
+    :param sink: 'text' (default) for one text file per input in `workspace/text`, or write
+        records of every input (including failures) to a jsonl, sqlite or parquet sink, e.g.,
+        {'format': 'sqlite', 'batch_size': 1000}; see `sinks.get_sink`
+    :return: Counter of successfully processed FileTypes
     """
     if not data:
         raise ValueError('Need to specify input data.')
 
     os.makedirs(workspace, exist_ok=True)
-    logger.basicConfig(filename='log.txt')
+    log_fp = os.path.join(workspace, 'log.txt')
+    log_handler = logger.add(log_fp)
+    manifest = get_manifest(manifest, workspace)
+    if manifest:
+        files = manifest.pending(collect_input_entries(**data))
+    else:
+        files = collect_input_files(**data)
+    sink = get_sink(sink, workspace)
+    unfinished = []  # manifest updates waiting for the sink to commit their records
     c = Counter()
-    for ifp in collect_input_files(**data):
-        ft, success = read_file(ifp, workspace, default_ext, force_convert)
-        if success:
-            c[ft] += 1
+    run_metrics = metrics.Metrics()
+    try:
+        if isolate or timeout or max_memory:
+            # threads are enough to drive the worker processes
+            func, executor_cls = read_file_in_worker, ThreadPoolExecutor
+            isolation = {'timeout': timeout, 'max_memory': max_memory, 'log': log_fp}
+        else:
+            func, executor_cls, isolation = read_file_with_metrics, ProcessPoolExecutor, {}
+        for ifp, future in iter_completed(func, files, workers=workers, executor_cls=executor_cls,
+                                          workspace=workspace, default_ext=default_ext,
+                                          force_convert=force_convert, page_workers=page_workers,
+                                          max_frames=max_frames,
+                                          cache=cache, stream_pages=stream_pages,
+                                          keep_intermediates=keep_intermediates, ocr=ocr,
+                                          preprocess=preprocess, pdf_workers=pdf_workers,
+                                          laparams=laparams, page_output=page_output,
+                                          max_pages=max_pages, max_pixels=max_pixels,
+                                          write_output=sink is None, input_dirs=data.get('directories'),
+                                          **isolation):
+            try:
+                (ft, success, output), doc_metrics = future.result()
+            except Exception as e:
+                logger.error(f'Failed to process: {ifp}')
+                logger.exception(e)
+                run_metrics.incr('failed')
+                if isinstance(e, LimitExceeded) or getattr(e, 'type', None) == 'LimitExceeded':
+                    run_metrics.incr('limit_exceeded')
+                elif isinstance(e, TimeoutError):
+                    run_metrics.incr('timed_out')
+                error = str(e) if isinstance(e, WorkerError) else f'{type(e).__name__}: {e}'  # already typed
+                _finish(manifest, sink, unfinished, workspace, ifp, error=error)
+                continue
+            run_metrics.merge(doc_metrics)
+            metrics.emit('document', ifp, doc_metrics)
+            if success:
+                c[ft] += 1
+                run_metrics.incr(f'filetype.{ft.name}')
+            else:
+                run_metrics.incr('failed')
+            _finish(manifest, sink, unfinished, workspace, ifp, ft, output,
+                    error=None if success else 'No text extracted', doc_metrics=doc_metrics)
+        logger.info(f'Processed: {dict(c)}')
+        logger.info(f'Metrics:\n{run_metrics.summary()}')
+        metrics.emit('run', 'run_config', run_metrics.as_dict())
+        if metrics.current() is not None:
+            metrics.current().merge(run_metrics)
+    finally:
+        if sink:
+            sink.close()
+            _finish_all(manifest, unfinished, os.path.relpath(sink.path, workspace))
+        if manifest:
+            logger.info(f'Manifest: {manifest.counts()}')
+            manifest.close()
+        logger.remove(log_handler)
+    return c
+
+
+def _finish(manifest, sink, unfinished, workspace, ifp, ft=None, output=None, error=None, doc_metrics=None):
+    """Record the outcome of a file in the sink and manifest; with a sink, the manifest
+        is only updated once the file's record has been committed, with the sink's
+        location (relative to `workspace`) as output"""
+    if sink is None:
+        if manifest:
+            manifest.finish(ifp, ft, output, error)
+        return
+    output = output or {}
+    unfinished.append((ifp, ft, error))
+    if sink.write(document_record(ifp, ft, output.get('sha256'), output.get('pages'), doc_metrics, error)):
+        _finish_all(manifest, unfinished, os.path.relpath(sink.path, workspace))
+
+
+def _finish_all(manifest, unfinished, output=None):
+    if manifest:
+        for ifp, ft, error in unfinished:
+            manifest.finish(ifp, ft, output, error)
+    unfinished.clear()
+
+
+def read_file_in_worker(ifp, timeout=None, max_memory=None, log=None, **kwargs):
+    """
+    `read_file_with_metrics` in a new worker process, which is killed if it
+        takes longer than `timeout` seconds.
 
+    :param max_memory: megabytes the worker may allocate
+    :param log: file for the worker to log to
+    :raises TimeoutError: if `timeout` was exceeded
+    :raises WorkerError: if reading failed or the worker died (e.g., ran out of memory)
+    """
+    from pykrman.worker import run
+    result = run('read_file', dict(kwargs, ifp=ifp), timeout=timeout, log=log, max_memory=max_memory)
+    return (FileType[result['filetype']], result['success'], result['output']), result['metrics']
+
+
+def read_file_with_metrics(ifp, **kwargs):
+    """
+    `read_file`, also collecting metrics (so they can be returned from worker processes)
+
+    :return: (result of `read_file`, `Metrics.as_dict`)
+    """
+    with metrics.collect(propagate=False) as m:  # merged by the caller
+        with metrics.stage('document'):
+            result = read_file(ifp, **kwargs)
+    return result, m.as_dict()
+
+
+def read_file(ifp, workspace='.', default_ext='pdf', force_convert=True, page_workers=1,
+              max_frames=None, cache=None, stream_pages=False, keep_intermediates=False, ocr=None,
+              preprocess=None, pdf_workers=1, laparams=None, page_output=False, max_pages=None,
+              max_pixels=None, write_output=True, input_dirs=None):
+    """
+
+    :param cache: ResultCache, path to cache database, or True to use the
+        workspace default; cached text is re-used for identical files
+    :param keep_intermediates: write a copy of the source and any extracted
+        images to `workspace/out`; otherwise all work is done in memory
+    :param ocr: OCR engine and its options; see `ocr.get_engine`
+    :param preprocess: image preprocessing options; see `preprocess.preprocess_image`
+    :param pdf_workers: number of processes to extract text from long pdfs with
+    :param laparams: pdfminer layout options; see `util.read_pdf`
+    :param page_output: write each page to its own file as soon as it is extracted
+    :param max_pages: maximum number of pages (or image frames); see `limits.apply`
+    :param max_pixels: maximum size of any image
+    :param write_output: write text files; otherwise the text of each page (see `iter_text`) is
+        returned, for a sink, and `stream_pages`, `pdf_workers` and `page_output` are ignored
+    :param input_dirs: directories `ifp` may have been found in; output mirrors its path
+        relative to them (so files with the same name in different subdirectories don't collide)
+    :return: (FileType, whether text was extracted, location of output relative to workspace,
+        or if not `write_output`, {'sha256': hash of the file, 'pages': [text of each page]})
+    :raises LimitExceeded: if the file exceeds `max_pages` or `max_pixels`
+    """
+    with limits.apply(max_pages=max_pages, max_pixels=max_pixels):
+        return _read_file_cached(ifp, workspace, default_ext, force_convert, page_workers, max_frames,
+                                 cache, stream_pages, keep_intermediates, ocr, preprocess,
+                                 pdf_workers, laparams, page_output, write_output, input_dirs)
+
+
+def _read_file_cached(ifp, workspace='.', default_ext='pdf', force_convert=True, page_workers=1,
+                      max_frames=None, cache=None, stream_pages=False, keep_intermediates=False,
+                      ocr=None, preprocess=None, pdf_workers=1, laparams=None, page_output=False,
+                      write_output=True, input_dirs=None):
+    with metrics.stage('read'), open(ifp, 'rb') as fh:
+        data = fh.read()
+    metrics.incr('documents')
+    metrics.incr('bytes_read', len(data))
+    cache = get_cache(cache, workspace)
+    page_output = page_output and write_output
+    paged = page_output or not write_output  # sink records have the text of each page
+    key = name = None
+    sha256 = content_hash(data) if cache or not write_output else None
+    if cache:
+        key = cache_key(sha256, **extraction_settings(default_ext=default_ext,
+                                                      force_convert=force_convert,
+                                                      stream_pages=stream_pages,
+                                                      ocr=ocr, preprocess=preprocess,
+                                                      laparams=laparams,
+                                                      page_output=paged,
+                                                      # changes where text is written
+                                                      keep_intermediates=keep_intermediates and not paged))
+        name, _ = _name_and_ext(ifp, data, default_ext, input_dirs)
+        hit = cache.get(key)
+        if hit:
+            ft, text, template = hit
+            logger.info(f'Using cached text for: {ifp}')
+            metrics.incr('cache_hit')
+            if not write_output:
+                return ft, True, {'sha256': sha256, 'pages': text_pages(text)}
+            # the cached text may come from another file with the same content
+            if template is None:
+                template = os.path.join('text', '{name}' if page_output else '{name}.txt')
+            output = os.path.join(workspace, template.replace('{name}', name, 1))
+            if page_output:
+                write_pages(output, split_pages(text))
+            else:
+                write_text(output, text)
+            return ft, True, os.path.relpath(output, workspace)
+    if paged:
+        ft, text, page_dir = _read_file_pages(ifp, data, workspace, default_ext, force_convert,
+                                              page_workers, max_frames, keep_intermediates, ocr,
+                                              preprocess, laparams, collect=bool(cache) or not write_output,
+                                              input_dirs=input_dirs, write=write_output)
+        if not write_output:
+            if ft is None:
+                return FileType.UNKNOWN, False, {'sha256': sha256, 'pages': []}
+            if cache:
+                cache.put(key, ft, text)
+            return ft, True, {'sha256': sha256, 'pages': split_pages(text)}
+        if ft is None:
+            return FileType.UNKNOWN, False, None
+        output = os.path.relpath(page_dir, workspace)
+        if cache:
+            cache.put(key, ft, text, _output_template(output, name))
+        return ft, True, output
+    ft, text, ofp = _read_file(ifp, data, workspace, default_ext, force_convert, page_workers,
+                               max_frames, stream_pages, keep_intermediates, ocr, preprocess,
+                               pdf_workers, laparams, input_dirs)
+    if not text:
+        return ft, False, None
+    write_text(ofp, text)
+    output = os.path.relpath(ofp, workspace)
+    if cache:
+        cache.put(key, ft, text, _output_template(output, name))
+    return ft, True, output
 
-def read_file(ifp, workspace='.', default_ext='pdf', force_convert=True):
+
+def _output_template(output, name):
+    """
+    :param output: location of output, relative to workspace
+    :param name: output name of the input (see `_name_and_ext`)
+    :return: `output` with `{name}` in place of `name`, so that files with the same
+        content are written to the same kind of location
+    """
+    for d in ('text', 'out'):
+        prefix = os.path.join(d, name)
+        if output.startswith(prefix):
+            return os.path.join(d, '{name}') + output[len(prefix):]
+    return None
+
+
+def _read_file(ifp, data, workspace='.', default_ext='pdf', force_convert=True, page_workers=1,
+               max_frames=None, stream_pages=False, keep_intermediates=False, ocr=None,
+               preprocess=None, pdf_workers=1, laparams=None, input_dirs=None):
+    """
+    :param data: content of `ifp`
+    :param input_dirs: see `read_file`
+    :return: (FileType, text or None, path to write text to)
+    """
     img_dir = os.path.join(workspace, 'out')
-    txt_dir = os.path.join(workspace, 'text')
-    os.makedirs(txt_dir, exist_ok=True)
-    p, ext = os.path.splitext(ifp)
-    name = os.path.basename(p)
-    if ext:
-        ext = ext[1:]  # remove leading '.'
-    else:
-        ext = imghdr.what(ifp) or default_ext
-    ofp = os.path.join(img_dir, f'{name}.{ext}')
-    shutil.copy(ifp, ofp)
+    txt_dir = os.path.join(workspace, 'text')  # created by `write_text`
+    name, ext = _name_and_ext(ifp, data, default_ext, input_dirs)
+    src = BytesIO(data)
+    image_dir = None
+    txt_fp = os.path.join(txt_dir, f'{name}.txt')
+    if keep_intermediates:
+        image_dir = img_dir
+        os.makedirs(os.path.dirname(os.path.join(img_dir, name)), exist_ok=True)
+        with open(os.path.join(img_dir, f'{name}.{ext}'), 'wb') as out:
+            out.write(data)
     # cases
     if ext == 'pdf':
-        # try to read text
-        try:
-            result = read_pdf(ifp)
-        except Exception as e:
-            logger.warning(f'Not a pdf: {ifp}, {e}')
-            result = None
-        if result and len(result) > 20:
-            with open(os.path.join(txt_dir, f'{name}.txt'), 'w', encoding='utf8') as out:
-                out.write(result)
-            return FileType.TEXT_PDF, True
-        else:
-            # does it have embedded image?
-            ofp = os.path.join(img_dir, f'{name}.png')
+        page_types = classify_pages(src, ifp)
+        if page_types and classify_pdf(page_types) == FileType.MIXED_PDF:
+            # use text layer where available, and OCR the rest
             try:
-                ofp = convert_pdf_to_image(ifp, ofp, force=force_convert)
+                pages = get_pdf_pages(src, page_types, force_convert, page_workers, max_frames,
+                                      image_dir, ocr, preprocess, laparams)
+            except LimitExceeded:
+                raise
             except Exception as e:
-                logger.info(f'Failed to convert: {name}')
+                logger.error(f'Failed to extract text: {ifp}')
                 logger.exception(e)
-                return FileType.SCANNED_PDF, False
-            ft = FileType.SCANNED_PDF
+                return FileType.MIXED_PDF, None, None
+            logger.info(f'Page types for {ifp}: {[page.filetype.name for page in pages]}')
+            return FileType.MIXED_PDF, pages_to_text(pages), txt_fp
+        # try to read text, unless there clearly isn't any
+        result = None
+        if page_types is None or FileType.TEXT_PDF in page_types:
+            try:
+                result = read_pdf(src, laparams=laparams, workers=pdf_workers)
+            except Exception as e:
+                logger.warning(f'Not a pdf: {ifp}, {e}')
+                metrics.incr('not_a_pdf')
+        if result and len(result) > 20:
+            return FileType.TEXT_PDF, result, txt_fp
+        # does it have embedded image?
+        ft = FileType.SCANNED_PDF
+        ofp = os.path.join(img_dir, f'{name}.png')
+        if keep_intermediates:
+            txt_fp = ofp + '.txt'
+        try:
+            if stream_pages:
+                return ft, pdf_images_to_text(src, force_convert, page_workers, max_frames, image_dir,
+                                              ocr, preprocess), txt_fp
+            im = convert_pdf_to_image(src, ofp if keep_intermediates else BytesIO(),
+                                      force=force_convert, image_dir=image_dir)
+        except LimitExceeded:
+            raise
+        except Exception as e:
+            logger.info(f'Failed to convert: {name}')
+            logger.exception(e)
+            return ft, None, None
+        if not im:
+            return ft, None, None
+        if isinstance(im, str):
+            txt_fp = im + '.txt'
     else:
-        ofp = os.path.join(img_dir, f'{name}.{ext}')
-        shutil.copy(ifp, ofp)
         ft = FileType.IMAGE
+        im = src
+        if keep_intermediates:
+            txt_fp = os.path.join(img_dir, f'{name}.{ext}.txt')
         logger.info(f'Doing nothing to: "{ifp}" with extension "{ext}"')
     # convert to text
-    if ofp:
-        try:
-            text = convert_to_text(ofp)
-        except Exception as e:
-            logger.error(f'Failed to extract text: {ifp}, {ofp}')
-            logger.exception(e)
-            return ft, False
+    try:
+        text = image_to_text(im, page_workers, max_frames, name=ifp, ocr=ocr,
+                             preprocess=preprocess)
+    except LimitExceeded:
+        raise
+    except Exception as e:
+        logger.error(f'Failed to extract text: {ifp}')
+        logger.exception(e)
+        return ft, None, None
+    return ft, text, txt_fp
+
+
+def _name_and_ext(ifp, data, default_ext='pdf', input_dirs=None):
+    """
+    :param input_dirs: see `read_file`
+    :return: (name for output, relative to its input directory; extension)
+    """
+    p, ext = os.path.splitext(ifp)
+    name = os.path.basename(p)
+    for d in input_dirs or []:
+        rel = os.path.relpath(os.path.abspath(p), os.path.abspath(d))
+        if rel != os.pardir and not rel.startswith(os.pardir + os.sep):
+            name = rel
+            break
+    with metrics.stage('sniff'):
+        return name, sniff_ext(data, ext[1:], default_ext)
+
+
+def _read_file_pages(ifp, data, workspace='.', default_ext='pdf', force_convert=True, page_workers=1,
+                     max_frames=None, keep_intermediates=False, ocr=None, preprocess=None,
+                     laparams=None, collect=False, input_dirs=None, write=True):
+    """
+    Write the text of each page to `workspace/text/{name}/{page}.txt` as soon as it is extracted.
+
+    :param data: content of `ifp`
+    :param collect: also return the text of all pages (see `split_pages`)
+    :param input_dirs: see `read_file`
+    :param write: write page files; otherwise only collect pages
+    :return: (FileType or None if no text was extracted, text or None, page directory)
+    """
+    name, ext = _name_and_ext(ifp, data, default_ext, input_dirs)
+    page_dir = os.path.join(workspace, 'text', name)
+    image_dir = None
+    if keep_intermediates:
+        image_dir = os.path.join(workspace, 'out')
+        os.makedirs(os.path.dirname(os.path.join(image_dir, name)), exist_ok=True)
+        with open(os.path.join(image_dir, f'{name}.{ext}'), 'wb') as out:
+            out.write(data)
+    filetypes = set()
+    texts = []
+    found = False
+    try:
+        for page in iter_text(BytesIO(data), ext, force_convert, page_workers, max_frames, image_dir,
+                              ocr, preprocess, laparams):
+            filetypes.add(page.filetype)
+            text = page.text.rstrip('\f')
+            if text:
+                if write:
+                    write_text(page_path(page_dir, page.number), text)
+                found = True
+            if collect:
+                texts.extend([''] * (page.number - len(texts)))  # pages which failed
+                texts.append(page.text)
+    except LimitExceeded:
+        raise
+    except Exception as e:
+        logger.error(f'Failed to extract text: {ifp}')
+        logger.exception(e)
+        return None, None, page_dir
+    if not found:
+        return None, None, page_dir
+    return document_filetype(filetypes), pages_to_text(Page(i, None, text) for i, text in enumerate(texts)), page_dir
+
+
+def document_filetype(filetypes):
+    """
+    :param filetypes: FileTypes of the pages yielded by `iter_text`
+    :return: FileType of the whole document
+    """
+    if FileType.IMAGE in filetypes:
+        return FileType.IMAGE
+    return classify_pdf(filetypes)
+
+
+def page_path(page_dir, number):
+    return os.path.join(page_dir, f'{number:05d}.txt')
+
+
+def split_pages(text):
+    """Inverse of `pages_to_text`"""
+    return text.split('\f')[:-1]
+
+
+def text_pages(text):
+    """
+    :return: text of each page, if `text` is separated into pages; otherwise [text]
+    """
+    return split_pages(text) if text.endswith('\f') else [text]
+
+
+def write_pages(page_dir, texts):
+    """Write the text of each page to its own file, skipping empty pages"""
+    for i, text in enumerate(texts):
         if text:
-            with open(ofp + '.txt', 'w', encoding='utf8') as out:
-                out.write(text)
-            return ft, True
-    return ft, False
+            write_text(page_path(page_dir, i), text)
+
+
+def classify_pages(pdf, name=None):
+    """
+    :param pdf: path to pdf or binary file-like object
+    :return: FileType of each page, or None if the pdf could not be inspected
+    """
+    try:
+        with metrics.stage('classify'):
+            page_types = classify_pdf_pages(pdf)
+    except Exception as e:
+        logger.info(f'Unable to classify pdf: {name or pdf}, {e}')
+        metrics.incr('classify_failed')
+        return None
+    metrics.incr('pages', len(page_types))
+    limits.check_pages(len(page_types), name)
+    return page_types
+
 
+def write_text(fp, text):
+    os.makedirs(os.path.dirname(os.path.abspath(fp)), exist_ok=True)
+    with metrics.stage('write'), open(fp, 'w', encoding='utf8') as out:
+        out.write(text)
+
+
+def tesseract_version(ocr=None):
+    try:
+        return get_engine(**(ocr or {})).version()
+    except Exception:
+        return None
 
-def image_to_string(im):
+
+def extraction_settings(ocr=None, **kwargs):
+    """Settings which affect extracted text; used to build cache keys"""
+    return dict(kwargs, ocr=ocr, tesseract=tesseract_version(ocr))
+
+
+def image_to_string(im, ocr=None):
+    """
+    :param im: PIL Image
+    :param ocr: OCR engine and its options; see `ocr.get_engine`
+    :return: text
+    """
+    from pytesseract.pytesseract import TesseractNotFoundError
     exc = None
+    metrics.incr('ocr_images')
     try:
-        return pytesseract.image_to_string(im)
+        with metrics.stage('ocr'):
+            return get_engine(**(ocr or {})).image_to_string(im)
     except TesseractNotFoundError as e:
         logger.error(f'Tesseract not installed. Please install.')
         raise e
     except Exception as ex:
         logger.exception('pytesseract failed to parse file')
-        print(ex)
+        metrics.incr('tesseract_failed')
         exc = ex
     return f'Pytesseract Failed to Parse: {exc}'
 
 
-def convert_to_text(ofp: Path, ext=None, force_convert=True):
+def iter_frames(im):
+    """
+    Decode frames of a multi-frame image one at a time.
+
+    :param im: PIL Image with `n_frames`
+    :return: generator of (frame number, frame image)
+    """
+    limits.check_pages(im.n_frames)
+    for i in range(im.n_frames):  # handle number of frames
+        im.seek(i)
+        limits.check_pixels(*im.size, name=f'frame {i}')
+        yield i, im.copy()
+
+
+def _frame_to_text(frame, ocr=None, preprocess=None):
+    i, im = frame
+    with metrics.stage('preprocess'):
+        cim = preprocess_image(im, **(preprocess or {}))
+    try:
+        return image_to_string(cim, ocr=ocr)
+    finally:
+        cim.close()
+        im.close()
+
+
+def frames_to_text(frames, page_workers=1, max_frames=None, name=None, ocr=None,
+                   preprocess=None):
+    """
+    OCR frames/pages on a pool of threads (Tesseract runs as a separate
+        process, so threads are sufficient to use several cores).
+
+    :param frames: iterable of (frame number, image)
+    :param page_workers: number of frames to OCR concurrently; 0 to use all cores
+    :param max_frames: maximum number of decoded frames to hold in memory;
+        defaults to twice the number of workers
+    :param name: used when logging failures
+    :param ocr: OCR engine and its options; see `ocr.get_engine`
+    :param preprocess: image preprocessing options; see `preprocess.preprocess_image`
+    :return: list of text, in frame order
+    """
+    res = _frames_to_text(frames, page_workers, max_frames, name, ocr, preprocess)
+    return [res[i] for i in sorted(res)]
+
+
+def _frames_to_text(frames, page_workers=1, max_frames=None, name=None, ocr=None,
+                    preprocess=None):
+    """
+    :return: dict of frame number to text; frames which failed are omitted
+    """
+    res = {}
+    for (i, _), future in iter_completed(_frame_to_text, frames, workers=page_workers,
+                                         max_pending=max_frames, executor_cls=ThreadPoolExecutor,
+                                         ocr=ocr, preprocess=preprocess):
+        try:
+            res[i] = future.result()
+        except Exception:
+            logger.error(f'frame{i}@{name}', exc_info=True)
+    return res
+
+
+def _numbered_images(images):
+    """Pages may contain several images: number them (page, image)"""
+    return (((i, k), img) for k, (i, img) in enumerate(images))
+
+
+def iter_frames_text(frames, page_workers=1, max_frames=None, name=None, ocr=None,
+                     preprocess=None):
+    """
+    Streaming version of `frames_to_text`: yield text as soon as each frame
+        (and all frames before it) has been OCR'd.
+
+    :param frames: iterable of (frame number, image)
+    :return: generator of (frame number, text), in frame order; frames which
+        failed are omitted
+    """
+    for (i, _), future in iter_ordered(_frame_to_text, frames, workers=page_workers,
+                                       max_pending=max_frames, executor_cls=ThreadPoolExecutor,
+                                       ocr=ocr, preprocess=preprocess):
+        try:
+            yield i, future.result()
+        except Exception:
+            logger.error(f'frame{i}@{name}', exc_info=True)
+
+
+def _copy_source(pdf):
+    """Readers which are consumed together need their own file handles"""
+    if hasattr(pdf, 'read'):
+        pdf.seek(0)
+        return BytesIO(pdf.read())
+    return pdf
+
+
+def _iter_ocr_pages(pdf, pagenos=None, force_convert=True, page_workers=1, max_frames=None,
+                    image_dir=None, ocr=None, preprocess=None):
+    """OCR pdf pages, joining the text of pages which contain several images"""
+    images = iter_pdf_images(pdf, force=force_convert, image_dir=image_dir, pagenos=pagenos)
+    texts = iter_frames_text(_numbered_images(images), page_workers, max_frames, name=pdf,
+                             ocr=ocr, preprocess=preprocess)
+    for i, group in itertools.groupby(texts, key=lambda x: x[0][0]):
+        yield Page(i, FileType.SCANNED_PDF, '\n'.join(text for _, text in group))
+
+
+def _iter_text_pages(pdf, pagenos, force_convert=True, image_dir=None, ocr=None, preprocess=None,
+                     laparams=None):
+    """Read pages with pdfminer, falling back to OCR where the text layer is empty"""
+    for i, text in iter_pdf_text(pdf, pagenos, laparams=laparams):
+        if text.strip():
+            yield Page(i, FileType.TEXT_PDF, text)
+        else:
+            yield from _iter_ocr_pages(pdf, {i}, force_convert, image_dir=image_dir, ocr=ocr,
+                                       preprocess=preprocess)
+
+
+def iter_pdf_pages(pdf, page_types=None, force_convert=True, page_workers=1, max_frames=None,
+                   image_dir=None, ocr=None, preprocess=None, laparams=None):
+    """
+    Extract text page by page, yielding each page as soon as it is ready:
+        pages with a text layer are read with pdfminer and only image-only
+        pages are OCR'd (concurrently, while the text pages are being read).
+
+    :param pdf: path to pdf file or binary file-like object
+    :param page_types: FileType of each page (see `classify.classify_pdf_pages`)
+    :param laparams: pdfminer layout options; see `util.read_pdf`
+    :return: generator of Page, in page order
+    """
+    if page_types is None:
+        page_types = classify_pdf_pages(pdf)
+    text_pagenos = {i for i, ft in enumerate(page_types) if ft == FileType.TEXT_PDF}
+    ocr_pagenos = {i for i, ft in enumerate(page_types) if ft == FileType.SCANNED_PDF}
+    streams = [(Page(i, FileType.UNKNOWN, '') for i, ft in enumerate(page_types) if ft == FileType.UNKNOWN)]
+    if text_pagenos:
+        streams.append(_iter_text_pages(_copy_source(pdf), text_pagenos, force_convert, image_dir, ocr,
+                                        preprocess, laparams))
+    if ocr_pagenos:
+        streams.append(_iter_ocr_pages(_copy_source(pdf), ocr_pagenos, force_convert, page_workers,
+                                       max_frames, image_dir, ocr, preprocess))
+    yield from heapq.merge(*streams, key=lambda page: page.number)
+
+
+def get_pdf_pages(pdf, page_types=None, force_convert=True, page_workers=1, max_frames=None,
+                  image_dir=None, ocr=None, preprocess=None, laparams=None):
+    """
+    Extract text page by page; see `iter_pdf_pages`.
+
+    :return: list of Page, in page order
+    """
+    return list(iter_pdf_pages(pdf, page_types, force_convert, page_workers, max_frames, image_dir,
+                               ocr, preprocess, laparams))
+
+
+def pages_to_text(pages):
+    """Join page text, separating pages with form feeds (as pdfminer does)"""
+    return ''.join(page.text if page.text.endswith('\f') else page.text + '\f' for page in pages)
+
+
+def pdf_images_to_text(ifp, force_convert=True, page_workers=1, max_frames=None, image_dir=None,
+                       ocr=None, preprocess=None):
+    """
+    OCR a scanned pdf page by page, so only about `max_frames` pages are
+        decoded at any one time.
+
+    :param ifp: path to pdf file or binary file-like object
+    :param image_dir: if specified, save the extracted images here
+    :param ocr: OCR engine and its options; see `ocr.get_engine`
+    :param preprocess: image preprocessing options; see `preprocess.preprocess_image`
+    :return: text of all pages, in page order
+    """
+    images = iter_pdf_images(ifp, force=force_convert, image_dir=image_dir)
+    return '\n'.join(frames_to_text(_numbered_images(images), page_workers, max_frames, name=ifp,
+                                    ocr=ocr, preprocess=preprocess))
+
+
+def image_to_text(im, page_workers=1, max_frames=None, name=None, ocr=None, preprocess=None):
+    """
+    Preprocess and OCR an image, handling each frame of multi-frame images.
+
+    :param im: PIL Image, path to image, or binary file-like object
+    :param page_workers: number of frames to OCR concurrently
+    :param max_frames: maximum number of decoded frames to hold in memory
+    :param name: used when logging failures
+    :param ocr: OCR engine and its options; see `ocr.get_engine`
+    :param preprocess: image preprocessing options; see `preprocess.preprocess_image`
+    :return: text
+    """
+    from PIL import Image
+    if not isinstance(im, Image.Image):
+        im = Image.open(im)
+    limits.check_pixels(*im.size)  # before decoding
+    if hasattr(im, 'n_frames'):
+        text = '\n'.join(frames_to_text(iter_frames(im), page_workers, max_frames,
+                                        name=f'{name}:{im.format}', ocr=ocr,
+                                        preprocess=preprocess))
+    else:  # jpeg can't have frames
+        with metrics.stage('preprocess'):
+            cim = preprocess_image(im, **(preprocess or {}))
+        text = image_to_string(cim, ocr=ocr)
+        cim.close()
+    try:
+        im.close()
+    except Exception as e:
+        logger.debug(f'Unable to close image: {e}')
+    return text
+
+
+def iter_text(fp, ext=None, force_convert=True, page_workers=1, max_frames=None, image_dir=None,
+              ocr=None, preprocess=None, laparams=None):
+    """
+    Streaming text extraction: yield the text of each page (or image frame)
+        as soon as pdfminer or Tesseract has finished it, rather than waiting
+        for the whole document.
+
+    :param fp: path or binary file-like object containing image or pdf
+    :param ext: extension to use; defaults to that of `fp`
+    :param force_convert: get text at any cost
+    :param page_workers: number of pages/frames to OCR concurrently
+    :param max_frames: maximum number of decoded frames to hold in memory
+    :param image_dir: if specified, save extracted images here
+    :param ocr: OCR engine and its options; see `ocr.get_engine`
+    :param preprocess: image preprocessing options; see `preprocess.preprocess_image`
+    :param laparams: pdfminer layout options; see `util.read_pdf`
+    :return: generator of Page (number, FileType, text), in page order
+    """
+    if not ext:
+        ext = sniff_ext(fp, None if hasattr(fp, 'read') else os.path.splitext(str(fp))[-1][1:], None)
+    if ext == 'pdf':
+        page_types = classify_pages(fp)
+        if page_types is None:  # unreadable by pdfminer: extract (or force) images instead
+            yield from _iter_ocr_pages(fp, None, force_convert, page_workers, max_frames, image_dir,
+                                       ocr, preprocess)
+        else:
+            yield from iter_pdf_pages(fp, page_types, force_convert, page_workers, max_frames,
+                                      image_dir, ocr, preprocess, laparams)
+        return
+    from PIL import Image
+    im = fp if isinstance(fp, Image.Image) else Image.open(fp)
+    try:
+        limits.check_pixels(*im.size)  # before decoding
+        frames = iter_frames(im) if hasattr(im, 'n_frames') else [(0, im.copy())]
+        for i, text in iter_frames_text(frames, page_workers, max_frames, name=f'{fp}:{im.format}',
+                                        ocr=ocr, preprocess=preprocess):
+            yield Page(i, FileType.IMAGE, text)
+    finally:
+        im.close()
+
+
+def convert_to_text(ofp: Path, ext=None, force_convert=True, page_workers=1, max_frames=None,
+                    stream_pages=False, ocr=None, preprocess=None, pdf_workers=1, laparams=None):
     """
 
     :param ofp:
+    :param page_workers: number of frames to OCR concurrently
+    :param max_frames: maximum number of decoded frames to hold in memory
+    :param stream_pages: OCR pdf pages one at a time rather than as a single merged image
+    :param ocr: OCR engine and its options; see `ocr.get_engine`
+    :param preprocess: image preprocessing options; see `preprocess.preprocess_image`
+    :param pdf_workers: number of processes to extract text from long pdfs with
+    :param laparams: pdfminer layout options; see `util.read_pdf`
     :return:
     """
     if isinstance(ofp, str):
         ofp = Path(ofp)
     if not ext:
-        ext = ofp.suffix.strip('.')
-    if ext == 'pdf' or ofp.suffix == '.pdf':
-        result = read_pdf(ofp)
+        ext = sniff_ext(ofp, ofp.suffix[1:], None)
+    if ext == 'pdf':
+        page_types = classify_pages(ofp)
+        if page_types and classify_pdf(page_types) == FileType.MIXED_PDF:
+            return pages_to_text(get_pdf_pages(ofp, page_types, force_convert, page_workers, max_frames,
+                                               ocr=ocr, preprocess=preprocess, laparams=laparams))
+        if page_types is None or FileType.TEXT_PDF in page_types:
+            result = read_pdf(ofp, laparams=laparams, workers=pdf_workers)
+        else:
+            result = None
         if result and result.strip():  # one pdf just had "\f\f\f\f\f\f\f"?!?
             return result
         # embedded image?
-        im = BytesIO()
-        im = convert_pdf_to_image(ofp, im, force=force_convert)
-        # im = Image.open(im)
+        if stream_pages:
+            return pdf_images_to_text(ofp, force_convert, page_workers, max_frames, ocr=ocr,
+                                      preprocess=preprocess)
+        im = convert_pdf_to_image(ofp, BytesIO(), force=force_convert)
+        if not im:
+            return None
     else:
+        from PIL import Image
         try:
             im = Image.open(ofp)
         except Exception as ex:
             logger.exception('PIL failed to open image')
             return str(ex)
-    if hasattr(im, 'n_frames'):
-        res = []
-        for i in range(im.n_frames):  # handle number of frames
-            im.seek(i)
-            cim = im.convert('RGBA')
-            cim = cim.filter(ImageFilter.MedianFilter())
-            enhancer = ImageEnhance.Contrast(cim)
-            cim = enhancer.enhance(2)
-            cim = cim.convert('1')
-            try:
-                text = image_to_string(cim)
-            except Exception as e:
-                logger.error(f'frame{i}@{ofp}:{imghdr.what(ofp)}:{type(im)}', exc_info=True)
-                continue
-            res.append(text)
-        text = '\n'.join(res)
-    else:  # jpeg can't have frames
-        cim = im.convert('RGBA')
-        cim = cim.filter(ImageFilter.MedianFilter())
-        enhancer = ImageEnhance.Contrast(cim)
-        cim = enhancer.enhance(2)
-        cim = cim.convert('1')
-        text = image_to_string(cim)
-    try:
-        im.close()
-        cim.close()
-    except Exception as e:
-        print(e)
-    return text
+    return image_to_text(im, page_workers, max_frames, name=ofp, ocr=ocr, preprocess=preprocess)
 
 
-def get_text(fp, ext=None, force_convert=True):
+def get_text(fp, ext=None, force_convert=True, cache=None, ocr=None):
     """
 
-    :param force_convert: get text at any cost
-    :param ext: extension to use
+    :param force_convert: get text at any cost, rendering pages whose images can't be
+        extracted; True, or a dict of options for `raster.iter_rendered_pages`
+    :param ext: extension to use; if not specified, the type is sniffed from the content
     :param fp: file-like object containing image or pdf
+    :param cache: ResultCache or path to cache database; cached text is
+        returned for identical files
+    :param ocr: OCR engine and its options; see `ocr.get_engine`
     :return:
     """
+    ext = ext or sniff(fp)
+    cache = get_cache(cache)
+    if cache:
+        key = cache_key(content_hash(fp), **extraction_settings(ext=ext, force_convert=force_convert,
+                                                                ocr=ocr))
+        hit = cache.get(key)
+        if hit:
+            return hit[1]
+        ft, text = _get_text(fp, ext, force_convert, ocr)
+        if text:
+            cache.put(key, ft, text)
+        return text
+    return _get_text(fp, ext, force_convert, ocr)[1]
+
+
+def _get_text(fp, ext=None, force_convert=True, ocr=None):
+    """
+    :return: (FileType, text)
+    """
+    engine = get_engine(**(ocr or {}))
     if ext == 'pdf':
-        result = read_pdf(fp)
+        page_types = classify_pages(fp)
+        if page_types and classify_pdf(page_types) == FileType.MIXED_PDF:
+            return FileType.MIXED_PDF, pages_to_text(get_pdf_pages(fp, page_types, force_convert, ocr=ocr))
+        result = read_pdf(fp) if page_types is None or FileType.TEXT_PDF in page_types else None
         if result:
-            return result
-        # does it have embedded image?
-        img = BytesIO()
-        convert_pdf_to_image(fp, img, force=force_convert)
-    else:
-        img = fp
+            return FileType.TEXT_PDF, result
+        # does it have embedded image? OCR it one page at a time
+        return FileType.SCANNED_PDF, '\n'.join(
+            engine.image_to_string(img.convert('RGBA'))
+            for _, img in iter_pdf_images(fp, force=force_convert)
+        )
     # convert image to text
-    return pytesseract.image_to_string(Image.open(img).convert('RGBA'))
+    from PIL import Image
+    return FileType.IMAGE, engine.image_to_string(Image.open(fp).convert('RGBA'))
 
 
 def main():
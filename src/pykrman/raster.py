@@ -0,0 +1,194 @@
+"""Render pdf pages to images, for pdfs whose images can't be extracted directly.
+
+Backends, in order of preference for 'auto':
+    * pdfium: pypdfium2 (`pip install pypdfium2`); pages render in worker processes
+    * pdftoppm: poppler's command line tool; one process per page
+    * ghostscript: `gs`; one process per page
+Pages are rendered at `dpi` and yielded in page order as soon as they are
+ready, so they can be OCR'd while later pages are still rendering. Only the
+requested pages are rendered, and nothing is written next to the input.
+"""
+import itertools
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+
+from loguru import logger
+
+from pykrman import limits, metrics
+from pykrman.limits import LimitExceeded
+from pykrman.pool import iter_ordered
+
+DEFAULT_DPI = 300
+BACKENDS = ('pdfium', 'pdftoppm', 'ghostscript')
+
+
+def _gs_executable():
+    for name in ('gs', 'gswin64c', 'gswin32c'):
+        exe = shutil.which(name)
+        if exe:
+            return exe
+    return None
+
+
+def backend_available(backend):
+    if backend == 'pdfium':
+        try:
+            import pypdfium2  # noqa: F401
+        except ImportError:
+            return False
+        return True
+    if backend == 'pdftoppm':
+        return shutil.which('pdftoppm') is not None
+    if backend == 'ghostscript':
+        return _gs_executable() is not None
+    raise ValueError(f'Unrecognized rasterizer: {backend}')
+
+
+def resolve_backend(backend='auto'):
+    """
+    :param backend: one of `BACKENDS`, or 'auto' to use the first available
+    :return: backend name, or None if none is available
+    """
+    if backend in (None, 'auto'):
+        return next((b for b in BACKENDS if backend_available(b)), None)
+    return backend if backend_available(backend) else None
+
+
+_pdfium_pdf = None
+
+
+def _open_pdfium(source):
+    """Worker initializer: each worker parses the pdf once, rather than once per page"""
+    global _pdfium_pdf
+    if _pdfium_pdf is not None:
+        _pdfium_pdf.close()
+        _pdfium_pdf = None
+    if source is not None:
+        import pypdfium2 as pdfium
+        _pdfium_pdf = pdfium.PdfDocument(source)
+
+
+def _render_pdfium(pageno, dpi=DEFAULT_DPI, grayscale=True, max_pixels=None):
+    pdf = _pdfium_pdf
+    if pageno >= len(pdf):
+        return None
+    page = pdf[pageno]
+    try:
+        width, height = page.get_size()
+        limits.check_pixels(width * dpi / 72, height * dpi / 72, f'page {pageno}', max_pixels)
+        return page.render(scale=dpi / 72, grayscale=grayscale).to_pil()
+    finally:
+        page.close()
+
+
+def _command(backend, source, pageno, dpi=DEFAULT_DPI, grayscale=True):
+    if backend == 'pdftoppm':
+        return ['pdftoppm', '-f', str(pageno + 1), '-l', str(pageno + 1), '-r', str(dpi),
+                '-singlefile', '-png'] + (['-gray'] if grayscale else []) + [source]
+    return [_gs_executable(), '-q', '-dNOPAUSE', '-dBATCH', '-dSAFER',
+            f'-sDEVICE={"pnggray" if grayscale else "png16m"}', f'-r{dpi}',
+            f'-dFirstPage={pageno + 1}', f'-dLastPage={pageno + 1}', '-sOutputFile=-', source]
+
+
+def _render_subprocess(pageno, source=None, backend='pdftoppm', dpi=DEFAULT_DPI, grayscale=True):
+    from PIL import Image
+    proc = subprocess.run(_command(backend, source, pageno, dpi, grayscale),
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0 or not proc.stdout:
+        logger.debug(f'{backend} failed on page {pageno}: {proc.stderr.decode("utf8", "replace").strip()}')
+        return None
+    im = Image.open(BytesIO(proc.stdout))
+    im.load()
+    return im
+
+
+def _page_count(source, backend):
+    """
+    :return: number of pages, or None if the pdf can't be parsed (pages are then
+        rendered until the backend fails)
+    """
+    if backend == 'pdfium':
+        import pypdfium2 as pdfium
+        pdf = pdfium.PdfDocument(source)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    from pykrman.util import count_pages
+    try:
+        return count_pages(source)
+    except Exception as e:
+        logger.debug(f'Unable to count pages: {e}')
+        return None
+
+
+def iter_rendered_pages(pdf, pagenos=None, dpi=DEFAULT_DPI, workers=1, backend='auto', grayscale=True):
+    """
+    Render pdf pages, yielding each page in page order as soon as it is ready.
+
+    :param pdf: path to pdf file or binary file-like object
+    :param pagenos: if specified, only render these (0-based) pages
+    :param dpi: resolution to render at
+    :param workers: number of pages to render concurrently; 0 to use all cores
+    :param backend: see `BACKENDS`; 'auto' uses the first available
+    :param grayscale: render grayscale rather than color images
+    :return: generator of (page number, PIL Image); pages which fail to render are omitted
+    """
+    name = resolve_backend(backend)
+    if name is None:
+        logger.warning(f'No pdf rasterizer available ({backend}): install pypdfium2, poppler or ghostscript.')
+        return
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if hasattr(pdf, 'read'):
+            pdf.seek(0)
+            data = pdf.read()
+            if name == 'pdfium':
+                source = data
+            else:  # command line tools need a file on disk
+                source = os.path.join(tmpdir, 'source.pdf')
+                with open(source, 'wb') as out:
+                    out.write(data)
+        else:
+            source = str(pdf)
+        probe = False
+        if pagenos is None:
+            n_pages = _page_count(source, name)
+            probe = n_pages is None
+            if not probe:
+                limits.check_pages(n_pages)
+            pagenos = itertools.count() if probe else range(n_pages)
+        else:
+            pagenos = sorted(pagenos)
+        if name == 'pdfium':  # only page numbers are sent; limits aren't inherited by processes
+            results = iter_ordered(_render_pdfium, pagenos, workers=workers, executor_cls=ProcessPoolExecutor,
+                                   initializer=_open_pdfium, initargs=(source,),
+                                   dpi=dpi, grayscale=grayscale, max_pixels=limits.current().max_pixels)
+        else:
+            results = iter_ordered(_render_subprocess, pagenos, workers=workers, executor_cls=ThreadPoolExecutor,
+                                   source=source, backend=name, dpi=dpi, grayscale=grayscale)
+        try:
+            for i, future in metrics.timed_iter('rasterize', results):
+                try:
+                    im = future.result()
+                except LimitExceeded:
+                    raise
+                except Exception as e:
+                    logger.warning(f'Failed to render page {i} with {name}: {e}')
+                    im = None
+                if im is None:
+                    if probe:  # past the last page
+                        break
+                    metrics.incr('rasterize_failed')
+                    continue
+                if probe:
+                    limits.check_pages(i + 1)
+                limits.check_pixels(*im.size, f'page {i}')
+                metrics.incr('rasterized_pages')
+                yield i, im
+        finally:
+            if name == 'pdfium':
+                _open_pdfium(None)  # if run inline
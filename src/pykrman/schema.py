@@ -20,12 +20,235 @@ SCHEMA = {
                     'type': 'array',
                     'items': {'type': 'string'},
                     'description': 'Limit only to specified filetypes.'
+                },
+                'recursive': {
+                    'type': 'boolean',
+                    'description': 'Also process files in subdirectories of `directories`; their output'
+                                   ' mirrors the subdirectories.'
                 }
             }
         },
         'workspace': {
             'type': 'string',
             'description': 'Path to do work and save results.'
+        },
+        'workers': {
+            'type': 'integer',
+            'minimum': 0,
+            'description': 'Number of processes to read files with; 0 uses all cores.'
+        },
+        'page_workers': {
+            'type': 'integer',
+            'minimum': 0,
+            'description': 'Number of pages/frames of each file to OCR concurrently; 0 uses all cores.'
+        },
+        'max_frames': {
+            'type': 'integer',
+            'minimum': 1,
+            'description': 'Maximum number of decoded frames to hold in memory for each file.'
+        },
+        'cache': {
+            'type': ['boolean', 'string'],
+            'description': 'Re-use text extracted from identical files: true to keep the cache'
+                           ' in the workspace, or path to a cache database.'
+        },
+        'stream_pages': {
+            'type': 'boolean',
+            'description': 'OCR scanned pdfs one page at a time rather than merging all pages'
+                           ' into a single image; bounds memory to about one page.'
+        },
+        'force_convert': {
+            'type': ['boolean', 'object'],
+            'description': 'Render pdf pages whose images cannot be extracted: true, false, or'
+                           ' rasterizer options.',
+            'properties': {
+                'backend': {
+                    'type': 'string',
+                    'enum': ['auto', 'pdfium', 'pdftoppm', 'ghostscript'],
+                    'description': 'pdfium requires pypdfium2; pdftoppm (poppler) and ghostscript'
+                                   ' run as separate processes; auto uses the first available.'
+                },
+                'dpi': {'type': 'integer', 'minimum': 1, 'description': 'Resolution to render at.'},
+                'workers': {
+                    'type': 'integer',
+                    'minimum': 0,
+                    'description': 'Number of pages to render concurrently; 0 uses all cores.'
+                },
+                'grayscale': {'type': 'boolean', 'description': 'Render grayscale rather than color.'},
+            }
+        },
+        'keep_intermediates': {
+            'type': 'boolean',
+            'description': 'Write copies of inputs and extracted images to the workspace;'
+                           ' otherwise files are processed in memory.'
+        },
+        'ocr': {
+            'type': 'object',
+            'description': 'OCR engine and its options.',
+            'properties': {
+                'engine': {
+                    'type': 'string',
+                    'enum': ['pytesseract', 'tesserocr', 'auto'],
+                    'description': 'pytesseract runs tesseract for each image; tesserocr keeps'
+                                   ' Tesseract loaded in each worker; auto prefers tesserocr.'
+                },
+                'lang': {'type': 'string', 'description': 'Tesseract language(s), e.g., "eng".'},
+                'psm': {'type': 'integer', 'description': 'Tesseract page segmentation mode.'},
+                'oem': {'type': 'integer', 'description': 'Tesseract OCR engine mode.'},
+            }
+        },
+        'preprocess': {
+            'type': 'object',
+            'description': 'Image preprocessing options.',
+            'properties': {
+                'method': {
+                    'type': 'string',
+                    'enum': ['pil', 'numpy'],
+                    'description': 'pil is the original filter chain; numpy works on a single grayscale buffer.'
+                },
+                'median': {'type': 'integer', 'minimum': 0, 'description': 'Median filter size; 0 disables.'},
+                'contrast': {'type': 'number', 'description': 'Contrast enhancement factor; 1 disables.'},
+                'stretch': {'type': 'boolean', 'description': '(numpy) Stretch intensities to full range.'},
+                'threshold': {
+                    'type': 'string',
+                    'enum': ['otsu', 'sauvola', 'fixed', 'dither'],
+                    'description': '(numpy) Binarization method.'
+                },
+                'level': {'type': 'integer', 'description': '(numpy) Threshold for "fixed".'},
+                'window': {'type': 'integer', 'minimum': 3, 'description': '(numpy) Window size for "sauvola".'},
+                'k': {'type': 'number', 'description': '(numpy) Sensitivity for "sauvola".'},
+            }
+        },
+        'pdf_workers': {
+            'type': 'integer',
+            'minimum': 0,
+            'description': 'Number of processes to extract text from long pdfs with; 0 uses all cores.'
+        },
+        'manifest': {
+            'type': ['boolean', 'string'],
+            'description': 'Only process new, changed or failed files: true to keep the manifest'
+                           ' in the workspace, or path to a manifest database.'
+        },
+        'page_output': {
+            'type': 'boolean',
+            'description': 'Write the text of each page to its own file as soon as it is extracted.'
+        },
+        'timeout': {
+            'type': 'number',
+            'exclusiveMinimum': 0,
+            'description': 'Seconds to allow for each file; files taking longer are killed and'
+                           ' recorded as failed. Files are read in worker processes.'
+        },
+        'max_memory': {
+            'type': 'integer',
+            'minimum': 1,
+            'description': 'Megabytes each file may use (POSIX only). Files are read in worker processes.'
+        },
+        'max_pages': {
+            'type': 'integer',
+            'minimum': 1,
+            'description': 'Skip (and record as failed) files with more pages or image frames.'
+        },
+        'max_pixels': {
+            'type': 'integer',
+            'minimum': 1,
+            'description': 'Skip (and record as failed) files containing or requiring a larger image.'
+        },
+        'isolate': {
+            'type': 'boolean',
+            'description': 'Read each file in its own worker process, so that a crash cannot stop the batch.'
+        },
+        'laparams': {
+            'type': ['object', 'boolean'],
+            'description': 'pdfminer layout analysis options (LAParams), or false to skip layout analysis.'
+        },
+        'sink': {
+            'description': 'Where to write text: "text" for one file per input, or records of every input'
+                           ' in batches to jsonl shards, a sqlite database or parquet shards.',
+            'oneOf': [
+                {'enum': ['text', 'jsonl', 'sqlite', 'parquet']},
+                {
+                    'type': 'object',
+                    'required': ['format'],
+                    'additionalProperties': False,
+                    'properties': {
+                        'format': {'enum': ['text', 'jsonl', 'sqlite', 'parquet']},
+                        'path': {
+                            'type': 'string',
+                            'description': 'Output directory (jsonl, parquet) or database (sqlite);'
+                                           ' defaults to the workspace.'
+                        },
+                        'batch_size': {
+                            'type': 'integer',
+                            'minimum': 1,
+                            'description': 'Number of records to write in each commit.'
+                        },
+                        'shard_size': {
+                            'type': 'integer',
+                            'minimum': 1,
+                            'description': 'Maximum number of records in each jsonl shard (parquet'
+                                           ' writes a file per batch).'
+                        },
+                    }
+                }
+            ]
+        }
+    }
+}
+
+SWEEP_SCHEMA = {
+    'type': 'object',
+    'required': ['corpus', 'grid'],
+    'definitions': {
+        'grid': {
+            'type': 'object',
+            'properties': {
+                'preprocess': {
+                    'type': 'object',
+                    'description': 'Values to try for each preprocessing option (see `preprocess`).'
+                },
+                'ocr': {
+                    'type': 'object',
+                    'description': 'Values to try for each OCR option (see `ocr`), e.g., psm, oem.'
+                },
+            }
         }
+    },
+    'properties': {
+        'corpus': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'required': ['truth', 'documents'],
+                'properties': {
+                    'truth': {'type': 'string', 'description': 'Ground truth pdf or text file.'},
+                    'documents': {
+                        'type': 'array',
+                        'items': {'type': 'string'},
+                        'description': 'Renderings of the ground truth: files, or directories of page images.'
+                    },
+                }
+            }
+        },
+        'grid': {
+            'oneOf': [
+                {'$ref': '#/definitions/grid'},
+                {'type': 'array', 'items': {'$ref': '#/definitions/grid'}},
+            ],
+            'description': 'Every combination of these settings is run; a list of grids is combined.'
+        },
+        'workspace': {'type': 'string', 'description': 'Directory for results.'},
+        'workers': {
+            'type': 'integer',
+            'minimum': 0,
+            'description': 'Number of runs to execute concurrently; 0 uses all cores.'
+        },
+        'metric': {
+            'type': 'string',
+            'description': 'Accuracy metric to rank by, e.g., "word_similarity.swd".'
+        },
+        'min_score': {'type': 'number', 'description': 'Accuracy floor for choosing the best configuration.'},
+        'important_words': {'type': 'array', 'items': {'type': 'string'}},
+        'keep_text': {'type': 'boolean', 'description': 'Write the text of each run to the workspace.'},
     }
 }
@@ -0,0 +1,260 @@
+"""Bulk output of extracted text, as an alternative to one text file per input.
+
+Each document becomes a record (see `document_record`) which is buffered by
+a sink and written in batches of `batch_size`, with one commit (and fsync)
+per batch rather than per document:
+    * jsonl: `{path}/part-00000.jsonl`, ...; a new shard every `shard_size` records
+    * sqlite: `document` and `page` tables in a single database
+    * parquet: `{path}/part-00000.parquet`, ...; one file per batch, since a
+      parquet file can't be read until it is closed (requires pyarrow:
+      `pip install pyarrow`)
+"""
+import json
+import os
+import sqlite3
+
+from pykrman.names import FileType
+
+FORMATS = ('text', 'jsonl', 'sqlite', 'parquet')
+DEFAULT_PATHS = {'jsonl': 'output', 'sqlite': 'output.sqlite', 'parquet': 'output'}
+
+
+def document_record(path, filetype=None, sha256=None, pages=None, metrics=None, error=None):
+    """
+    :param path: input file
+    :param filetype: FileType of the input, if known
+    :param sha256: hash of the input's content
+    :param pages: text of each page
+    :param metrics: `metrics.Metrics.as_dict` for the input
+    :param error: reason for failure; None if successful
+    :return: dict
+    """
+    stages = (metrics or {}).get('stages', {})
+    return {
+        'path': os.path.abspath(path),
+        'sha256': sha256,
+        'filetype': filetype.name if isinstance(filetype, FileType) else filetype,
+        'pages': list(pages or []),
+        'seconds': stages.get('document', {}).get('wall'),
+        'timings': {stage: timing['wall'] for stage, timing in stages.items()},
+        'error': error,
+    }
+
+
+class Sink:
+
+    def __init__(self, path, batch_size=1000):
+        """
+        Buffers records and writes them in batches. Use as a context manager, or call `close`.
+
+        :param path: location of output
+        :param batch_size: number of records to write in each commit
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.buffer = []
+
+    def write(self, record):
+        """
+        :param record: see `document_record`
+        :return: True if this (and every earlier) record has now been committed
+        """
+        self.buffer.append(record)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        if self.buffer:
+            self._write_batch(self.buffer)
+            self.buffer = []
+
+    def _write_batch(self, records):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ShardedSink(Sink):
+    extension = None
+
+    def __init__(self, path, batch_size=1000, shard_size=100_000):
+        """
+        :param path: directory to write shards to
+        :param shard_size: maximum number of records per shard
+        """
+        super().__init__(path, batch_size)
+        self.shard_size = shard_size
+        self.shard = None
+        self.shard_records = 0
+        os.makedirs(path, exist_ok=True)
+        self._shardno = self._next_shardno()
+
+    def _next_shardno(self):
+        """Continue numbering after existing shards, so re-runs don't overwrite output"""
+        numbers = [int(fn[5:10]) for fn in os.listdir(self.path)
+                   if fn.startswith('part-') and fn[5:10].isdigit()]
+        return max(numbers, default=-1) + 1
+
+    def shard_path(self, number):
+        return os.path.join(self.path, f'part-{number:05d}.{self.extension}')
+
+    def _write_batch(self, records):
+        while records:
+            if self.shard is None:
+                self.shard = self._open_shard(self.shard_path(self._shardno))
+                self._shardno += 1
+                self.shard_records = 0
+            n = self.shard_size - self.shard_records
+            self._write_shard(records[:n])
+            self.shard_records += len(records[:n])
+            records = records[n:]
+            if self.shard_records >= self.shard_size:
+                self._close_shard()
+
+    def close(self):
+        super().close()
+        if self.shard is not None:
+            self._close_shard()
+
+    def _open_shard(self, path):
+        raise NotImplementedError
+
+    def _write_shard(self, records):
+        raise NotImplementedError
+
+    def _close_shard(self):
+        self.shard.close()
+        self.shard = None
+
+
+class JsonlSink(ShardedSink):
+    extension = 'jsonl'
+
+    def _open_shard(self, path):
+        return open(path, 'a', encoding='utf8')
+
+    def _write_shard(self, records):
+        self.shard.write(''.join(json.dumps(record) + '\n' for record in records))
+        self.shard.flush()
+        os.fsync(self.shard.fileno())
+
+
+class ParquetSink(ShardedSink):
+    extension = 'parquet'
+
+    def __init__(self, path, batch_size=1000):
+        """
+        :param path: directory to write shards to
+        :param batch_size: number of records in each shard
+        """
+        import pyarrow as pa
+        super().__init__(path, batch_size, shard_size=batch_size)
+        self.schema = pa.schema([
+            ('path', pa.string()), ('sha256', pa.string()), ('filetype', pa.string()),
+            ('pages', pa.list_(pa.string())), ('seconds', pa.float64()),
+            ('timings', pa.map_(pa.string(), pa.float64())), ('error', pa.string()),
+        ])
+
+    def _open_shard(self, path):
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(path, self.schema)
+
+    def _write_shard(self, records):
+        import pyarrow as pa
+        records = [dict(record, timings=list(record['timings'].items())) for record in records]
+        self.shard.write_table(pa.Table.from_pylist(records, schema=self.schema))
+
+    def _write_batch(self, records):
+        super()._write_batch(records)
+        if self.shard is not None:  # a partial batch, when closing
+            self._close_shard()
+
+
+class SqliteSink(Sink):
+
+    def __init__(self, path, batch_size=1000):
+        """
+        :param path: path to sqlite database; re-processed documents replace earlier records
+        """
+        super().__init__(path, batch_size)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=FULL')  # fsync each commit (i.e., batch)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS document ('
+            ' path TEXT PRIMARY KEY,'
+            ' sha256 TEXT,'
+            ' filetype TEXT,'
+            ' pages INTEGER NOT NULL,'
+            ' seconds REAL,'
+            ' timings TEXT,'
+            ' error TEXT'
+            ')'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS page ('
+            ' path TEXT NOT NULL,'
+            ' number INTEGER NOT NULL,'
+            ' text TEXT NOT NULL,'
+            ' PRIMARY KEY (path, number)'
+            ')'
+        )
+        self.conn.commit()
+
+    def _write_batch(self, records):
+        with self.conn:
+            self.conn.executemany('DELETE FROM page WHERE path = ?', [(r['path'],) for r in records])
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO document (path, sha256, filetype, pages, seconds, timings, error)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(r['path'], r['sha256'], r['filetype'], len(r['pages']), r['seconds'],
+                  json.dumps(r['timings']), r['error']) for r in records]
+            )
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO page (path, number, text) VALUES (?, ?, ?)',
+                [(r['path'], i, text) for r in records for i, text in enumerate(r['pages'])]
+            )
+
+    def close(self):
+        super().close()
+        self.conn.close()
+
+
+SINKS = {
+    'jsonl': JsonlSink,
+    'sqlite': SqliteSink,
+    'parquet': ParquetSink,
+}
+
+
+def get_sink(output, workspace='.'):
+    """
+    :param output: 'text' (or None) for one text file per input, a format name
+        (see `FORMATS`), or {'format': ..., 'path': ..., 'batch_size': ..., 'shard_size': ...}
+    :param workspace: directory containing the default output location
+    :return: Sink, or None to write text files
+    """
+    if output is None or isinstance(output, Sink):
+        return output
+    if isinstance(output, str):
+        output = {'format': output}
+    options = dict(output)
+    fmt = options.pop('format', 'text')
+    if fmt == 'text':
+        return None
+    if fmt not in SINKS:
+        raise ValueError(f'Unrecognized output format: {fmt}')
+    if fmt in ('sqlite', 'parquet'):
+        options.pop('shard_size', None)  # a single database, or a file per batch
+    path = options.pop('path', None) or os.path.join(workspace, DEFAULT_PATHS[fmt])
+    return SINKS[fmt](path, **options)
@@ -0,0 +1,71 @@
+"""Identify file types from their first bytes, without loading any parser.
+"""
+SNIFF_SIZE = 1024  # pdf headers may be preceded by junk
+
+# (extension, magic bytes, offset)
+SIGNATURES = (
+    ('tiff', b'II*\x00', 0),
+    ('tiff', b'MM\x00*', 0),
+    ('tiff', b'II+\x00', 0),  # BigTIFF
+    ('tiff', b'MM\x00+', 0),
+    ('jpeg', b'\xff\xd8\xff', 0),
+    ('png', b'\x89PNG\r\n\x1a\n', 0),
+    ('jp2', b'\x00\x00\x00\x0cjP  \r\n\x87\n', 0),
+    ('jp2', b'\xff\x4f\xff\x51', 0),  # raw JPEG 2000 codestream
+    ('gif', b'GIF87a', 0),
+    ('gif', b'GIF89a', 0),
+    ('bmp', b'BM', 0),
+)
+IMAGE_EXTS = frozenset(ext for ext, _, _ in SIGNATURES)
+
+
+def read_header(fp, size=SNIFF_SIZE):
+    """
+    :param fp: path, bytes, or binary file-like object (position is restored)
+    :return: first `size` bytes
+    """
+    if isinstance(fp, (bytes, bytearray, memoryview)):
+        return bytes(fp[:size])
+    if hasattr(fp, 'read'):
+        pos = fp.tell()
+        fp.seek(0)
+        header = fp.read(size)
+        fp.seek(pos)
+        return header
+    with open(fp, 'rb') as fh:
+        return fh.read(size)
+
+
+def sniff(fp):
+    """
+    Identify a file from its magic bytes.
+
+    :param fp: path, bytes, or binary file-like object
+    :return: extension ('pdf', 'tiff', 'jpeg', 'png', 'jp2', 'gif', 'bmp'), or None if unrecognized
+    """
+    header = read_header(fp)
+    for ext, magic, offset in SIGNATURES:
+        if header.startswith(magic, offset):
+            if ext == 'bmp' and len(header) >= 18 and header[14] not in (12, 40, 52, 56, 64, 108, 124):
+                continue  # 'BM' alone is too weak: require a known DIB header size
+            return ext
+    # only after the fixed-offset signatures, since image metadata may contain '%PDF-'
+    if b'%PDF-' in header:
+        return 'pdf'
+    return None
+
+
+def sniff_ext(fp, ext=None, default_ext='pdf'):
+    """
+    Decide how to handle a file: the sniffed type wins over the given extension,
+        which wins over `default_ext`.
+
+    :param fp: path, bytes, or binary file-like object
+    :param ext: extension from the file name, if any (without leading '.')
+    :return: extension
+    """
+    sniffed = sniff(fp)
+    if sniffed:
+        return sniffed
+    return (ext or '').lower() or default_ext
+
@@ -0,0 +1,257 @@
+"""Sweep preprocessing and OCR settings over a corpus with ground truth.
+
+    python -m pykrman.sweep sweep.yaml
+
+Every combination of the settings in `grid` is run on every document of the
+corpus (in a pool of processes), scored against the document's ground truth
+with `compare.Wordlist.compare`, and timed. Each run is appended to
+`workspace/results.jsonl` as soon as it finishes, and runs which are already
+there are skipped, so an interrupted sweep can be resumed. Finally, runs are
+summarized per configuration in `workspace/summary.json`, and the fastest
+configuration meeting the accuracy floor is reported.
+
+    corpus:
+      - truth: tests/ocr-wiki/orig.pdf  # pdf or text file
+        documents:  # files, or directories of page images (one document)
+          - tests/ocr-wiki/jpg-1
+          - tests/ocr-wiki/jpg-3
+    grid:  # or a list of grids
+      preprocess:
+        method: [pil, numpy]
+        median: [0, 3]
+      ocr:
+        psm: [3, 6]
+    metric: word_similarity.swd
+    min_score: 0.9
+    workers: 4
+    workspace: sweep
+"""
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+
+from loguru import logger
+
+from pykrman.pool import iter_completed
+
+RESULTS_FILENAME = 'results.jsonl'
+SUMMARY_FILENAME = 'summary.json'
+DEFAULT_METRIC = 'word_similarity.swd'
+
+
+def expand_grid(grid):
+    """
+    :param grid: {'preprocess': {option: [values]}, 'ocr': {option: [values]}}, or a list of these
+    :return: list of {'preprocess': {option: value}, 'ocr': {option: value}}, one for each combination
+    """
+    if isinstance(grid, list):
+        configs = []
+        for g in grid:
+            configs.extend(c for c in expand_grid(g) if c not in configs)
+        return configs
+    axes = [(section, option, values if isinstance(values, list) else [values])
+            for section in ('preprocess', 'ocr')
+            for option, values in (grid.get(section) or {}).items()]
+    configs = []
+    for combination in itertools.product(*(values for _, _, values in axes)):
+        config = {'preprocess': {}, 'ocr': {}}
+        for (section, option, _), value in zip(axes, combination):
+            config[section][option] = value
+        configs.append(config)
+    return configs
+
+
+def config_id(config):
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode('utf8')).hexdigest()[:12]
+
+
+def document_pages(document):
+    """
+    :param document: file, or directory of page images
+    :return: list of files, in page order
+    """
+    if os.path.isdir(document):
+        return [os.path.join(document, fn) for fn in sorted(os.listdir(document))
+                if os.path.isfile(os.path.join(document, fn))]
+    return [document]
+
+
+def _cpu():
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system  # includes tesseract processes
+
+
+def ocr_document(document, preprocess=None, ocr=None):
+    """
+    :return: (text, number of pages)
+    """
+    from pykrman.pykrfy import iter_text, pages_to_text
+    pages = []
+    for fp in document_pages(document):
+        pages.extend(iter_text(fp, ocr=ocr, preprocess=preprocess))
+    return pages_to_text(pages), len(pages)
+
+
+_truths = {}
+
+
+def _set_truths(truths):
+    """Worker initializer: ground truth is only sent once to each worker"""
+    global _truths
+    _truths = truths
+
+
+def _run(task, text_dir=None):
+    """OCR a document with a configuration, and score it"""
+    config, document, truth = task
+    record = {'run': task_id(task), 'config': config_id(config), 'document': document, 'truth': truth}
+    record.update(config)
+    start, cpu = time.perf_counter(), _cpu()
+    try:
+        text, pages = ocr_document(document, config['preprocess'], config['ocr'])
+    except Exception as e:
+        logger.exception(e)
+        return dict(record, error=f'{type(e).__name__}: {e}')
+    wall, cpu = time.perf_counter() - start, _cpu() - cpu
+    if text_dir:
+        with open(os.path.join(text_dir, f'{record["run"]}.txt'), 'w', encoding='utf8') as out:
+            out.write(text)
+    record.update(pages=pages, wall_seconds=wall, cpu_seconds=cpu,
+                  pages_per_second=pages / wall if wall else None,
+                  scores=_truths[truth].compare(text), error=None)
+    return record
+
+
+def task_id(task):
+    config, document, truth = task
+    return config_id({'config': config, 'document': document, 'truth': truth})
+
+
+def read_results(path):
+    """
+    :return: dict of run id to the latest record for that run
+    """
+    results = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf8') as fh:
+            for line in fh:
+                if line.strip():
+                    record = json.loads(line)
+                    results[record['run']] = record
+    return results
+
+
+def get_metric(scores, metric=DEFAULT_METRIC):
+    """
+    :param metric: path into the result of `Wordlist.compare`, e.g., 'word_similarity.swd'
+    """
+    for key in metric.split('.'):
+        scores = scores[key]
+    return scores
+
+
+def summarize(records, metric=DEFAULT_METRIC):
+    """
+    :return: list of per-configuration summaries, fastest first
+    """
+    by_config = {}
+    for record in records:
+        if record.get('error'):
+            continue
+        by_config.setdefault(record['config'], []).append(record)
+    summary = []
+    for cid, runs in by_config.items():
+        pages = sum(r['pages'] for r in runs)
+        wall = sum(r['wall_seconds'] for r in runs)
+        cpu = sum(r['cpu_seconds'] for r in runs)
+        summary.append({
+            'config': cid, 'preprocess': runs[0]['preprocess'], 'ocr': runs[0]['ocr'],
+            'documents': len(runs), 'pages': pages,
+            'pages_per_second': pages / wall if wall else None,
+            'cpu_seconds_per_page': cpu / pages if pages else None,
+            metric: sum(get_metric(r['scores'], metric) for r in runs) / len(runs),
+        })
+    summary.sort(key=lambda s: -(s['pages_per_second'] or 0))
+    return summary
+
+
+def best_config(summary, metric=DEFAULT_METRIC, min_score=None):
+    """
+    :return: fastest configuration with a mean `metric` of at least `min_score`
+        (or the most accurate if none do), or None
+    """
+    passing = [s for s in summary if min_score is None or s[metric] >= min_score]
+    if passing:
+        return passing[0]  # summary is fastest first
+    return max(summary, key=lambda s: s[metric], default=None)
+
+
+def run_sweep(corpus, grid, workspace='sweep', workers=1, metric=DEFAULT_METRIC, min_score=None,
+              important_words=None, keep_text=False):
+    """
+    :param corpus: list of {'truth': path to pdf or text file, 'documents': [files or directories]}
+    :param grid: see `expand_grid`
+    :param workers: number of runs to execute concurrently; 0 to use all cores
+    :param metric: accuracy metric to summarize and apply `min_score` to; see `get_metric`
+    :param min_score: accuracy floor for choosing the best configuration
+    :param important_words: passed to `compare.Wordlist`
+    :param keep_text: write the text of each run to `workspace/text/{run}.txt`
+    :return: (summary, best configuration)
+    """
+    from pykrman.compare import get_wordlist
+    os.makedirs(workspace, exist_ok=True)
+    text_dir = None
+    if keep_text:
+        text_dir = os.path.join(workspace, 'text')
+        os.makedirs(text_dir, exist_ok=True)
+    results_fp = os.path.join(workspace, RESULTS_FILENAME)
+    results = read_results(results_fp)
+    configs = expand_grid(grid)
+    tasks = [(config, document, entry['truth'])
+             for entry in corpus for document in entry['documents'] for config in configs]
+    pending = [task for task in tasks if results.get(task_id(task), {}).get('error', True) is not None]
+    logger.info(f'Sweep: {len(configs)} configurations x {len(tasks) // max(len(configs), 1)} documents;'
+                f' {len(tasks) - len(pending)} runs already done')
+    truths = {entry['truth']: get_wordlist(entry['truth'], important_words) for entry in corpus}
+    with open(results_fp, 'a', encoding='utf8') as out:
+        for task, future in iter_completed(_run, pending, workers=workers, initializer=_set_truths,
+                                           initargs=(truths,), text_dir=text_dir):
+            try:
+                record = future.result()
+            except Exception as e:
+                logger.exception(e)
+                record = {'run': task_id(task), 'config': config_id(task[0]), 'document': task[1],
+                          'truth': task[2], 'error': f'{type(e).__name__}: {e}', **task[0]}
+            results[record['run']] = record
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+            if record['error']:
+                logger.warning(f'Failed: {task[1]} with {task[0]}: {record["error"]}')
+    current = {task_id(task) for task in tasks}
+    summary = summarize((r for run, r in results.items() if run in current), metric)
+    best = best_config(summary, metric, min_score)
+    with open(os.path.join(workspace, SUMMARY_FILENAME), 'w', encoding='utf8') as out:
+        json.dump({'metric': metric, 'min_score': min_score, 'best': best, 'configs': summary}, out, indent=2)
+    logger.info(f'Best configuration: {best}')
+    return summary, best
+
+
+def main():
+    import yaml
+    from jsonschema import validate
+    from pykrman.schema import SWEEP_SCHEMA
+    if len(sys.argv) <= 1:
+        raise ValueError('Missing sweep configuration json or yaml file.')
+    with open(sys.argv[1]) as fh:
+        config = json.load(fh) if sys.argv[1].endswith('json') else yaml.safe_load(fh)
+    validate(config, SWEEP_SCHEMA)
+    summary, best = run_sweep(**config)
+    for s in summary:
+        print(json.dumps(s))
+
+
+if __name__ == '__main__':
+    main()
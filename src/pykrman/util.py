@@ -1,154 +1,171 @@
+"""
+pdfminer, PIL and the image extraction backends are imported on first use,
+so that importing this module (and `pykrfy`) stays cheap.
+"""
+import collections
+import contextlib
 import io
+import itertools
 from loguru import logger
 import os
-import struct
-import zlib
-
-# noinspection PyPackageRequirements
-from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
-# noinspection PyPackageRequirements
-from pdfminer.converter import TextConverter
-# noinspection PyPackageRequirements
-from pdfminer.layout import LAParams
-# noinspection PyPackageRequirements
-from pdfminer.pdfpage import PDFPage
+
 from io import StringIO
-import PyPDF2
-from PIL import Image
-from pykrman.defaultlist import defaultlist
+from pykrman import limits, metrics
+from pykrman.pool import iter_completed
+
 
+def __getattr__(name):
+    if name == 'tiff_header_for_ccitt':  # moved to pdfimages
+        from pykrman.pdfimages import tiff_header_for_ccitt
+        return tiff_header_for_ccitt
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
-def convert_pdf_to_image(ifp, ofp, force=True):
+
+def convert_pdf_to_image(ifp, ofp, force=True, image_dir=None):
     """
 
     :param ifp:
     :param ofp: might be BytesIO
     :param force: ensure that some image is obtained
+    :param image_dir: if specified, save the extracted images here
     :return:
     """
     try:
-        images = get_images_from_scanned_pdf(ifp)
-    except PyPDF2.utils.PdfReadError as e:
+        images = get_images_from_scanned_pdf(ifp, image_dir=image_dir)
+    except limits.LimitExceeded:
+        raise
+    except Exception as e:
         logger.info('Unable to get images from scanned pdf')
         logger.exception(e)
         images = None
     if images:
-        res = merge_images(images, out=ofp)
+        with metrics.stage('merge_images'):
+            res = merge_images(images, out=ofp)
         if isinstance(ofp, io.BytesIO):
             ofp = res
     else:
         logger.warning(f'Failed to parse scanned pdf: "{ifp}"')
         if force:
             logger.warning(f'Forcing conversion of scanned pdf.')
+            metrics.incr('forced_conversion')
             try:
                 ofp = os.path.splitext(ofp)[0] + '.force' + os.path.splitext(ofp)[-1]
             except TypeError:
                 pass
-            if not force_pdf_to_image(ifp, ofp):
+            if not force_pdf_to_image(ifp, ofp, **_raster_options(force)):
                 return None
     return ofp
 
 
-def tiff_header_for_ccitt(width, height, img_size, ccitt_group=4):
-    tiff_header_struct = '<' + '2s' + 'h' + 'l' + 'h' + 'hhll' * 8 + 'h'
-    return struct.pack(tiff_header_struct,
-                       b'II',  # Byte order indication: Little indian
-                       42,  # Version number (always 42)
-                       8,  # Offset to first IFD
-                       8,  # Number of tags in IFD
-                       256, 4, 1, width,  # ImageWidth, LONG, 1, width
-                       257, 4, 1, height,  # ImageLength, LONG, 1, lenght
-                       258, 3, 1, 1,  # BitsPerSample, SHORT, 1, 1
-                       259, 3, 1, ccitt_group,  # Compression, SHORT, 1, 4 = CCITT Group 4 fax encoding
-                       262, 3, 1, 0,  # Threshholding, SHORT, 1, 0 = WhiteIsZero
-                       273, 4, 1, struct.calcsize(tiff_header_struct),  # StripOffsets, LONG, 1, len of header
-                       278, 4, 1, height,  # RowsPerStrip, LONG, 1, lenght
-                       279, 4, 1, img_size,  # StripByteCounts, LONG, 1, size of image
-                       0  # last IFD
-                       )
+def iter_pdf_images(ifp, force=True, image_dir=None, pagenos=None):
+    """
+    Streaming version of `convert_pdf_to_image`: yield the images of a scanned
+        pdf one page at a time rather than merging them into a single image.
+
+    :param ifp: path to pdf file or binary file-like object
+    :param force: ensure that every page (in `pagenos`) has an image, by rendering
+        pages without extractable images; True, or a dict of options for
+        `raster.iter_rendered_pages` (e.g., dpi, backend, workers)
+    :param image_dir: if specified, save the extracted (or rendered) images here
+    :param pagenos: if specified, only get images for these (0-based) pages
+    :return: generator of (page number, image), in page order
+    """
+    data = None
+    if hasattr(ifp, 'read'):  # pages may be rendered while images are still being extracted
+        ifp.seek(0)
+        data = ifp.read()
+
+    def source():
+        return ifp if data is None else io.BytesIO(data)
+
+    expected = None  # pages not yet seen, if known
+    if force:
+        try:
+            expected = collections.deque(sorted(pagenos) if pagenos is not None else range(count_pages(source())))
+        except Exception as e:
+            logger.debug(f'Unable to count pages: {e}')
+    found = False
+    try:
+        for i, img in iter_images_from_scanned_pdf(source(), image_dir=image_dir, pagenos=pagenos):
+            missing = []
+            while expected and expected[0] <= i:
+                pageno = expected.popleft()
+                if pageno < i:
+                    missing.append(pageno)
+            if missing:
+                yield from _force_pages(source(), ifp, missing, force, image_dir)
+            found = True
+            yield i, img
+    except limits.LimitExceeded:
+        raise
+    except Exception as e:
+        logger.info('Unable to get images from scanned pdf')
+        logger.exception(e)
+    if not found:
+        logger.warning(f'Failed to parse scanned pdf: "{ifp}"')
+        if force:
+            yield from _force_pages(source(), ifp, pagenos, force, image_dir)
+    elif expected:
+        yield from _force_pages(source(), ifp, list(expected), force, image_dir)
+
+
+def _force_pages(pdf, name, pagenos, force, image_dir=None):
+    """Render pages (all, if `pagenos` is None) whose images couldn't be extracted"""
+    logger.warning(f'Forcing conversion of scanned pdf{"" if pagenos is None else f" pages {pagenos}"}: "{name}"')
+    metrics.incr('forced_conversion')
+    from pykrman.raster import iter_rendered_pages
+    for i, im in iter_rendered_pages(pdf, pagenos=pagenos, **_raster_options(force)):
+        if image_dir:
+            im.save(os.path.join(image_dir, f'{i}_rendered.png'))
+        yield i, im
+
 
+def _open_binary(fp):
+    """Open path for reading, or pass through an already open file-like object"""
+    if hasattr(fp, 'read'):
+        fp.seek(0)
+        return contextlib.nullcontext(fp)
+    return open(fp, 'rb')
 
-def get_images_from_scanned_pdf(pdf_filepath):
+
+def get_images_from_scanned_pdf(pdf_filepath, image_dir=None):
     """
     Built for collecting images from a pdf produced by scanning,
     so it assumes that all images contribute to a single image.
 
     :param pdf_filepath: path to pdf file
+    :param image_dir: if specified, save the raw image streams here
     :return:
     """
-    with open(pdf_filepath, 'rb') as pdf_file:
-        reader = PyPDF2.PdfFileReader(pdf_file)
-        images = defaultlist()  # images not read in correct order
-        images2 = list()
-        for i in range(reader.getNumPages()):
-            page = reader.getPage(i)
-            x_object = page['/Resources']['/XObject'].getObject()
-            for obj in x_object:
-                img = None
-                if x_object[obj]['/Subtype'] == '/Image':
-                    """
-                    The  CCITTFaxDecode filter decodes image data that has been encoded using
-                    either Group 3 or Group 4 CCITT facsimile (fax) encoding. CCITT encoding is
-                    designed to achieve efficient compression of monochrome (1 bit per pixel) image
-                    data at relatively low resolutions, and so is useful only for bitmap image data, not
-                    for color images, grayscale images, or general data.
-    
-                    K < 0 --- Pure two-dimensional encoding (Group 4)
-                    K = 0 --- Pure one-dimensional encoding (Group 3, 1-D)
-                    K > 0 --- Mixed one- and two-dimensional encoding (Group 3, 2-D)
-                    """
-                    x_filter = x_object[obj]['/Filter']
-                    # noinspection PyProtectedMember
-                    data = x_object[obj]._data  # sorry, getData() does not work for CCITTFaxDecode
-                    ext = ''
-                    if isinstance(x_filter, list):
-                        if x_filter[0] == '/FlateDecode':
-                            data = zlib.decompress(data)
-                        x_filter = x_filter[1]
-                    if x_filter == '/CCITTFaxDecode':
-                        if x_object[obj]['/DecodeParms']['/K'] == -1:
-                            ccitt_group = 4
-                        else:
-                            ccitt_group = 3
-                        width = x_object[obj]['/Width']
-                        height = x_object[obj]['/Height']
-                        img_size = len(data)
-                        tiff_header = tiff_header_for_ccitt(width, height, img_size, ccitt_group)
-                        img = Image.open(io.BytesIO(tiff_header + data))
-                        ext = 'tiff'
-                    elif x_filter == '/DCTDecode':  # jpg
-                        img = Image.open(io.BytesIO(data))
-                        ext = 'jpg'
-                    elif x_filter == '/JPXDecode':  # jp2
-                        img = Image.open(io.BytesIO(data))
-                        ext = 'jp2'
-                    elif x_filter == '/FlateDecode':  # png
-                        try:
-                            img = Image.open(io.BytesIO(data))
-                        except Exception as e:
-                            logger.warning('Failed to read /FlateDecode', e)
-                            continue
-                        ext = 'png'
-                    elif x_filter == '/JBIG2Decode':  # jbig2
-                        ext = 'jbig2'
-                        # images[key] = Image.open(io.BytesIO(data))
-                    with open(f'{i}_{obj[1:]}.{ext}', 'wb') as out:
-                        out.write(data)
-                    if img:
-                        try:
-                            images[i * 1000 + int(obj[3:])] = img
-                        except:
-                            images2.append(img)
-    return images if images else images2
+    return [img for _, img in iter_images_from_scanned_pdf(pdf_filepath, image_dir=image_dir)]
+
+
+def iter_images_from_scanned_pdf(pdf_filepath, image_dir=None, backend='auto', pagenos=None):
+    """
+    Lazily collect images from a pdf produced by scanning, one page at a time.
+
+    :param pdf_filepath: path to pdf file or binary file-like object
+    :param image_dir: if specified, save the raw image streams here
+    :param backend: see `pdfimages.iter_page_images`
+    :param pagenos: if specified, only get images for these (0-based) pages
+    :return: generator of (page number, image) in page order
+    """
+    from pykrman.pdfimages import iter_page_images
+    with _open_binary(pdf_filepath) as pdf_file:
+        yield from metrics.timed_iter('image_extraction', iter_page_images(
+            pdf_file, image_dir=image_dir, backend=backend, pagenos=pagenos
+        ))
 
 
 def merge_images(images, horizontal=False, out=None):
+    from PIL import Image
     if horizontal:
         width = sum(x.size[0] for x in images if x)
         height = max(x.size[1] for x in images if x)
     else:
         width = max(x.size[0] for x in images if x)
         height = sum(x.size[1] for x in images if x)
+    limits.check_pixels(width, height, name='merged image')
     result = Image.new('RGB', (width, height))
     prev = 0
     for im in images:
@@ -165,56 +182,179 @@ def merge_images(images, horizontal=False, out=None):
     return result
 
 
-def force_pdf_to_image(pdf, outfile):
+def _raster_options(force):
     """
-    Uses ImageMagick to convert pdf file into an image. The quality
-        of the image will be poor, but at least there will be an image.
+    :param force: True, or dict of `raster.iter_rendered_pages` options (e.g., dpi, backend, workers)
+    """
+    return force if isinstance(force, dict) else {}
+
 
-    :param outfile:
-    :param pdf: path to pdf file
-    :return: PythonMagick Image
+def force_pdf_to_image(pdf, outfile, **options):
     """
-    logger.info('Using ImageMagick')
-    try:
-        # noinspection PyPackageRequirements
-        from PythonMagick import Image as PMImage
-    except ImportError:
-        logger.exception('PythonMagick library not detected.')
-        logger.warning('Unable to convert pdf to image: {}'.format(pdf))
-        return None
-
-    if 'MAGICK_HOME' not in os.environ:
-        logger.exception('PythonMagick environment variable not set.')
-        logger.warning(r'Set MAGICK_HOME to something like "C:\Program Files\ImageMagick-x.y.z-w."')
-        logger.warning('Unable to convert pdf to image: {}'.format(pdf))
-        return None
-
-    # if not pdf.endswith('pdf'):
-    #     new_pdf = f'{pdf}.im.pdf'  # imagemagick requires extension
-    #     shutil.copy(pdf, new_pdf)
-    #     pdf = new_pdf
-    try:
-        img = PMImage(pdf)
-    except Exception as e:
-        logger.warning('Not a file that ImageMagick can work with.')
-        return None
-    img.write(f'{pdf}.tiff')
-    with open(outfile, 'wb') as out:
-        with open(f'{pdf}.tiff', 'rb') as fh:
-            out.write(fh.read())
+    Render every page of a pdf (see `raster.iter_rendered_pages`) into a
+        single multi-page tiff.
+
+    :param outfile: path or binary file-like object
+    :param pdf: path to pdf file or binary file-like object
+    :param options: passed to `raster.iter_rendered_pages` (e.g., dpi, backend, workers)
+    :return: outfile, or None if no page could be rendered
+    """
+    from pykrman.raster import iter_rendered_pages
+    with metrics.stage('force_conversion'):
+        pages = [im for _, im in iter_rendered_pages(pdf, **options)]
+        if not pages:
+            logger.warning('Unable to convert pdf to image: {}'.format(pdf))
+            return None
+        pages[0].save(outfile, format='TIFF', save_all=True, append_images=pages[1:])
+    if hasattr(outfile, 'seek'):
+        outfile.seek(0)
     return outfile
 
 
-def read_pdf(pdf):
-    rsrcmgr = PDFResourceManager()
-    with open(pdf, 'rb') as fh:
+def _get_laparams(laparams=None):
+    """
+    :param laparams: LAParams, dict of LAParams options, None for defaults,
+        or False to skip layout analysis
+    """
+    # noinspection PyPackageRequirements
+    from pdfminer.layout import LAParams
+    if laparams is None:
+        return LAParams()
+    elif isinstance(laparams, dict):
+        return LAParams(**laparams)
+    return laparams or None
+
+
+def _pdfminer_text():
+    # noinspection PyPackageRequirements
+    from pdfminer.converter import TextConverter
+    # noinspection PyPackageRequirements
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    # noinspection PyPackageRequirements
+    from pdfminer.pdfpage import PDFPage
+    return PDFPage, PDFPageInterpreter, PDFResourceManager, TextConverter
+
+
+def count_pages(pdf):
+    """
+    :param pdf: path to pdf file or binary file-like object
+    :return: number of pages, read from the page tree without parsing pages
+    """
+    # noinspection PyPackageRequirements
+    from pdfminer.pdfdocument import PDFDocument
+    # noinspection PyPackageRequirements
+    from pdfminer.pdfparser import PDFParser
+    # noinspection PyPackageRequirements
+    from pdfminer.pdftypes import resolve1
+    with _open_binary(pdf) as fh:
+        doc = PDFDocument(PDFParser(fh))
+        return resolve1(resolve1(doc.catalog['Pages'])['Count'])
+
+
+def read_pdf(pdf, pagenos=None, maxpages=0, laparams=None, workers=1, chunk_size=50, caching=True):
+    """
+    :param pdf: path to pdf file or binary file-like object
+    :param pagenos: (0-based) pages to extract; defaults to all pages
+    :param maxpages: maximum number of pages to extract (the first of `pagenos`); 0 for no limit
+    :param laparams: LAParams, dict of LAParams options, or False to skip
+        layout analysis (fastest, but loses line ordering)
+    :param workers: number of processes; documents with more than `chunk_size`
+        pages are split into ranges of pages which are extracted in parallel
+    :param chunk_size: number of pages in each range
+    :param caching: cache parsed pdf objects
+    :return: text
+    """
+    with metrics.stage('pdfminer'):
+        return _read_pdf(pdf, pagenos, maxpages, laparams, workers, chunk_size, caching)
+
+
+def _read_pdf(pdf, pagenos=None, maxpages=0, laparams=None, workers=1, chunk_size=50, caching=True):
+    if workers != 1:
+        selected = range(count_pages(pdf))
+        if pagenos is not None:
+            selected = sorted(i for i in pagenos if i < len(selected))
+        if maxpages:
+            selected = selected[:maxpages]
+        if len(selected) > chunk_size:
+            return _read_pdf_parallel(pdf, list(selected), laparams, workers, chunk_size, caching)
+    PDFPage, PDFPageInterpreter, PDFResourceManager, TextConverter = _pdfminer_text()
+    rsrcmgr = PDFResourceManager(caching=caching)
+    with _open_binary(pdf) as fh:
         result = StringIO()
-        device = TextConverter(rsrcmgr, result, laparams=LAParams())
+        device = TextConverter(rsrcmgr, result, laparams=_get_laparams(laparams))
         interpreter = PDFPageInterpreter(rsrcmgr, device)
-        for page in PDFPage.get_pages(fh, set(), maxpages=0, password='',
-                                      caching=True, check_extractable=True):
+        # pdfminer's maxpages counts all pages, rather than those in pagenos
+        pages = PDFPage.get_pages(fh, set(pagenos or ()), maxpages=0, password='',
+                                  caching=caching, check_extractable=True)
+        for page in itertools.islice(pages, maxpages or None):
             interpreter.process_page(page)
         text = result.getvalue()
     device.close()
     result.close()
     return text
+
+
+_pdf_source = None
+
+
+def _set_pdf_source(source):
+    """Worker initializer: the pdf is only sent once to each worker, rather than with every chunk"""
+    global _pdf_source
+    _pdf_source = source
+
+
+def _read_pdf_chunk(chunk, laparams=None, caching=True):
+    _, pagenos = chunk
+    source = io.BytesIO(_pdf_source) if isinstance(_pdf_source, bytes) else _pdf_source
+    return read_pdf(source, pagenos=set(pagenos), laparams=laparams, caching=caching)
+
+
+def _read_pdf_parallel(pdf, pagenos, laparams=None, workers=None, chunk_size=50, caching=True):
+    """Extract ranges of pages on a process pool, and join them in page order"""
+    if hasattr(pdf, 'read'):
+        pdf.seek(0)
+        source = pdf.read()
+    else:
+        source = str(pdf)
+    chunks = ((i, pagenos[start:start + chunk_size])
+              for i, start in enumerate(range(0, len(pagenos), chunk_size)))
+    texts = {}
+    try:
+        for (i, _), future in iter_completed(_read_pdf_chunk, chunks, workers=workers,
+                                             initializer=_set_pdf_source, initargs=(source,),
+                                             laparams=laparams, caching=caching):
+            texts[i] = future.result()
+    finally:
+        _set_pdf_source(None)  # if run inline
+    return ''.join(texts[i] for i in sorted(texts))
+
+
+def iter_pdf_text(pdf, pagenos=None, laparams=None, caching=True):
+    """
+    Extract text one page at a time.
+
+    :param pdf: path to pdf file or binary file-like object
+    :param pagenos: if specified, only extract these (0-based) pages
+    :param laparams: see `read_pdf`
+    :return: generator of (page number, text)
+    """
+    PDFPage, PDFPageInterpreter, PDFResourceManager, TextConverter = _pdfminer_text()
+    rsrcmgr = PDFResourceManager(caching=caching)
+    with _open_binary(pdf) as fh:
+        result = StringIO()
+        device = TextConverter(rsrcmgr, result, laparams=_get_laparams(laparams))
+        interpreter = PDFPageInterpreter(rsrcmgr, device)
+        pages = PDFPage.get_pages(fh, set(pagenos) if pagenos is not None else set(), maxpages=0,
+                                  password='', caching=caching, check_extractable=True)
+        # get_pages skips pages not in pagenos, so track page numbers separately
+        for i in sorted(pagenos) if pagenos is not None else itertools.count():
+            with metrics.stage('pdfminer'):
+                page = next(pages, None)
+                if page is None:
+                    break
+                interpreter.process_page(page)
+            yield i, result.getvalue()
+            result.seek(0)
+            result.truncate()
+    device.close()
+    result.close()
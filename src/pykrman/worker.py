@@ -0,0 +1,182 @@
+"""Run a single extraction task in a separate process.
+
+The worker can be killed (together with any Tesseract processes it started)
+without affecting its caller, which makes it possible to enforce timeouts
+and to cancel runaway documents.
+
+Protocol: the first line of stdin is a JSON request
+    {"task": <name in TASKS>, "kwargs": {...}, "log": <optional log file>,
+    "max_memory": <optional megabytes>, "size": <bytes of data>}, followed by
+    `size` bytes of data (the content of the document, for tasks taking one).
+    A single JSON line is written to stdout: {"result": ...} on success or
+    {"error": ..., "type": ...} on failure.
+
+With `--serve`, the worker answers requests until stdin is closed, so that
+imports and OCR engines are re-used between documents (see `aio.WorkerPool`).
+"""
+import contextlib
+import json
+import os
+import signal
+import subprocess
+import sys
+import traceback
+from io import BytesIO
+
+from loguru import logger
+
+POSIX = os.name == 'posix'
+
+
+class WorkerError(RuntimeError):
+    """
+    A task failed in the worker, or the worker died
+
+    :param type: name of the exception raised by the task, if any
+    """
+
+    def __init__(self, message, type=None):
+        super().__init__(message)
+        self.type = type
+
+
+def _get_text_task(data, ext=None, **kwargs):
+    from pykrman.pykrfy import get_text
+    return {'text': get_text(BytesIO(data), ext, **kwargs)}
+
+
+def _read_file_task(data, ifp, **kwargs):
+    from pykrman.pykrfy import read_file_with_metrics
+    (ft, success, output), metrics = read_file_with_metrics(ifp, **kwargs)
+    return {'filetype': ft.name, 'success': success, 'output': output, 'metrics': metrics}
+
+
+TASKS = {
+    'get_text': _get_text_task,
+    'read_file': _read_file_task,
+}
+
+
+def build_request(task, kwargs, log=None, max_memory=None, size=0):
+    """
+    :param max_memory: megabytes the worker may allocate; see `limits.set_memory_limit`
+    :param size: length of the data following the request
+    :return: first line of the worker's stdin
+    """
+    request = {'task': task, 'kwargs': kwargs, 'log': log, 'max_memory': max_memory, 'size': size}
+    return (json.dumps(request, default=str) + '\n').encode('utf8')
+
+
+def worker_command(serve=False):
+    """
+    :param serve: keep answering requests until stdin is closed
+    """
+    return [sys.executable, '-m', 'pykrman.worker'] + (['--serve'] if serve else [])
+
+
+def parse_response(stdout, stderr, returncode):
+    """
+    :return: result of the task
+    :raises WorkerError: if the task failed or the worker died
+    """
+    try:
+        response = json.loads(stdout.splitlines()[-1])
+    except (IndexError, ValueError):
+        if b'MemoryError' in stderr:
+            raise WorkerError('Worker ran out of memory', 'MemoryError')
+        raise WorkerError(f'Worker exited with code {returncode}: '
+                          f'{stderr.decode("utf8", errors="replace")[-1000:]}')
+    if 'error' in response:
+        raise WorkerError(response['error'], response.get('type'))
+    return response['result']
+
+
+def run(task, kwargs, data=b'', timeout=None, log=None, max_memory=None):
+    """
+    Run a task in a new worker process, blocking until it finishes; see `aio.run_worker`
+        for the asyncio equivalent.
+
+    :param data: content of the document, if the task requires it
+    :param timeout: seconds to wait before killing the worker (and its children)
+    :param log: file for the worker to log to
+    :param max_memory: megabytes the worker may allocate
+    :return: result of the task
+    :raises TimeoutError: if `timeout` was exceeded
+    :raises WorkerError: if the task failed or the worker died
+    """
+    proc = subprocess.Popen(worker_command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, start_new_session=POSIX)
+    try:
+        stdout, stderr = proc.communicate(build_request(task, kwargs, log, max_memory, len(data)) + data,
+                                          timeout)
+    except subprocess.TimeoutExpired:
+        kill(proc)
+        raise TimeoutError(f'Timed out after {timeout}s')
+    except BaseException:
+        kill(proc)
+        raise
+    return parse_response(stdout, stderr, proc.returncode)
+
+
+def kill(proc):
+    """Kill the worker's whole process group, including Tesseract children"""
+    try:
+        if POSIX:
+            os.killpg(proc.pid, signal.SIGKILL)
+        elif proc.returncode is None:
+            proc.kill()
+    except ProcessLookupError:
+        pass
+    proc.wait()
+
+
+_logs = set()
+
+
+def run_request(stdin, line=None):
+    """
+    :param stdin: binary file-like object containing the request
+    :param line: first line of the request, if already read
+    :return: response dict
+    """
+    request = json.loads(line or stdin.readline())
+    if request.get('log') and request['log'] not in _logs:
+        logger.add(request['log'])
+        _logs.add(request['log'])
+    if request.get('max_memory'):
+        from pykrman.limits import set_memory_limit
+        set_memory_limit(request['max_memory'])
+    data = stdin.read(request['size']) if 'size' in request else stdin.read()
+    try:
+        # keep stray prints away from the response
+        with contextlib.redirect_stdout(sys.stderr):
+            return {'result': TASKS[request['task']](data, **request['kwargs'])}
+    except Exception as e:
+        logger.exception(e)
+        return {'error': ''.join(traceback.format_exception_only(type(e), e)).strip(),
+                'type': type(e).__name__}
+
+
+def serve(stdin, stdout):
+    """Answer requests until stdin is closed"""
+    for line in iter(stdin.readline, b''):
+        stdout.write(json.dumps(run_request(stdin, line)) + '\n')
+        stdout.flush()
+
+
+def main():
+    if '--serve' in sys.argv[1:]:
+        # answer on a private copy of stdout, and send anything else written to it (e.g., by
+        # libraries) to stderr, so that it can't be mistaken for a response
+        out = os.fdopen(os.dup(sys.stdout.fileno()), 'w', encoding='utf8')
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+        serve(sys.stdin.buffer, out)
+        return
+    response = run_request(sys.stdin.buffer)
+    sys.stdout.write(json.dumps(response) + '\n')
+    sys.stdout.flush()
+    sys.exit(1 if 'error' in response else 0)
+
+
+if __name__ == '__main__':
+    main()
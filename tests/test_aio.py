@@ -0,0 +1,157 @@
+import asyncio
+import json
+import os
+import shutil
+import time
+
+import pytest
+
+from pykrman import aio, worker
+from pykrman.names import FileType
+from pykrman.pykrfy import get_text
+from pykrman.util import read_pdf
+
+OCR_WIKI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ocr-wiki')
+
+
+@pytest.fixture(autouse=True)
+def worker_path(monkeypatch):
+    """Workers must be able to import pykrman"""
+    src = os.path.dirname(os.path.dirname(aio.__file__))
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join(filter(None, [src, os.environ.get('PYTHONPATH')])))
+
+
+def test_get_text():
+    pdf = os.path.join(OCR_WIKI, 'orig.pdf')
+
+    async def get_texts():
+        semaphore = asyncio.Semaphore(2)
+        try:
+            with open(pdf, 'rb') as fh:
+                return await asyncio.gather(aio.get_text(pdf, semaphore=semaphore),
+                                            aio.get_text(fh, 'pdf', semaphore=semaphore))
+        finally:
+            await aio.close_pool()
+
+    texts = asyncio.run(get_texts())
+    with open(pdf, 'rb') as fh:
+        assert texts == [get_text(fh, 'pdf')] * 2
+
+
+class ModeEngine:
+
+    def image_to_string(self, im):
+        return im.mode
+
+
+def test_get_text_task_matches_sync_get_text():
+    """Images are OCR'd as they are by `pykrfy.get_text`: not preprocessed, nor followed by a form feed"""
+    jpg = os.path.join(OCR_WIKI, 'jpg-1', sorted(os.listdir(os.path.join(OCR_WIKI, 'jpg-1')))[0])
+    with open(jpg, 'rb') as fh:
+        data = fh.read()
+    ocr = {'engine': ModeEngine()}
+    result = worker.TASKS['get_text'](data, 'jpg', ocr=ocr)
+    with open(jpg, 'rb') as fh:
+        assert result == {'text': get_text(fh, 'jpg', ocr=ocr)} == {'text': 'RGBA'}
+
+
+def test_pool_reuses_and_replaces_workers():
+    pdf = os.path.join(OCR_WIKI, 'orig.pdf')
+
+    async def run():
+        async with aio.WorkerPool(1) as pool:
+            assert await aio.get_text(pdf, pool=pool) == read_pdf(pdf)
+            worker = pool.workers[0]
+            pid = worker.proc.pid
+            assert await aio.get_text(pdf, pool=pool) == read_pdf(pdf)
+            assert worker.proc.pid == pid  # warm worker re-used
+            with pytest.raises(asyncio.TimeoutError):
+                await aio.get_text(os.path.join(OCR_WIKI, 'pdf-3.pdf'), timeout=0.01, pool=pool)
+            assert worker.proc is None  # killed
+            assert await aio.get_text(pdf, pool=pool) == read_pdf(pdf)
+            worker.proc.kill()  # crashes between tasks are survived too
+            await worker.proc.wait()
+            assert await aio.get_text(pdf, pool=pool) == read_pdf(pdf)
+            assert worker.proc.pid != pid
+
+    asyncio.run(run())
+
+
+def test_long_response(tmp_path):
+    pikepdf = pytest.importorskip('pikepdf')
+    pdf = pikepdf.new()
+    font = pikepdf.Dictionary(Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type1, BaseFont=pikepdf.Name.Courier)
+    line = b'(' + b'x' * 80 + b') Tj T*'
+    for _ in range(20):
+        pdf.add_blank_page(page_size=(612, 792))
+        pdf.pages[-1].Resources = pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=font))
+        pdf.pages[-1].Contents = pikepdf.Stream(pdf, b'BT /F1 5 Tf 6 TL 10 780 Td ' + b' '.join([line] * 60) + b' ET')
+    fp = tmp_path / 'long.pdf'
+    pdf.save(fp)
+
+    async def run():
+        async with aio.WorkerPool(1) as pool:
+            return await aio.get_text(str(fp), pool=pool)
+
+    text = asyncio.run(run())
+    assert len(text) > 1 << 16
+    assert text == read_pdf(str(fp))
+
+
+def test_default_pool_is_shared():
+    async def run():
+        try:
+            assert aio.get_pool() is aio.get_pool()
+            assert aio.get_pool().size == os.cpu_count()
+        finally:
+            await aio.close_pool()
+
+    asyncio.run(run())
+
+
+def test_get_text_timeout():
+    start = time.time()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(aio.get_text(os.path.join(OCR_WIKI, 'pdf-3.pdf'), timeout=0.01))
+    assert time.time() - start < 5
+
+
+def test_run_config(tmp_path):
+    data = {'files': [os.path.join(OCR_WIKI, 'orig.pdf'), os.path.join(OCR_WIKI, 'pdf-3.pdf')]}
+    c = asyncio.run(aio.run_config(data, workspace=str(tmp_path), concurrency=2, timeout=0.01))
+    assert c == {}  # both killed
+    c = asyncio.run(aio.run_config({'files': data['files'][:1]}, workspace=str(tmp_path)))
+    assert c == {FileType.TEXT_PDF: 1}
+    assert (tmp_path / 'text' / 'orig.txt').exists()
+    assert 'Timed out' in (tmp_path / 'log.txt').read_text()
+
+
+def test_run_config_recursive_output_mirrors_subdirectories(tmp_path):
+    indir = tmp_path / 'in'
+    for sub in ('x', 'y'):
+        (indir / sub).mkdir(parents=True)
+        shutil.copy(os.path.join(OCR_WIKI, 'orig.pdf'), indir / sub / 'doc.pdf')
+    workspace = tmp_path / 'ws'
+    c = asyncio.run(aio.run_config({'directories': [str(indir)], 'recursive': True}, workspace=str(workspace),
+                                   concurrency=2))
+    assert c == {FileType.TEXT_PDF: 2}
+    assert sorted(os.listdir(workspace / 'text')) == ['x', 'y']
+    for sub in ('x', 'y'):
+        assert (workspace / 'text' / sub / 'doc.txt').exists()
+
+
+def test_run_config_with_sink(tmp_path):
+    from pykrman.manifest import DONE, Manifest
+    workspace = tmp_path / 'ws'
+    pdf = os.path.join(OCR_WIKI, 'orig.pdf')
+    c = asyncio.run(aio.run_config({'files': [pdf]}, workspace=str(workspace), manifest=True,
+                                   sink={'format': 'jsonl', 'batch_size': 10}))
+    assert c == {FileType.TEXT_PDF: 1}
+    assert not (workspace / 'text').exists()
+    with open(workspace / 'output' / 'part-00000.jsonl', encoding='utf8') as fh:
+        [record] = [json.loads(line) for line in fh]
+    assert record['path'] == os.path.abspath(pdf)
+    assert ''.join(record['pages']) == read_pdf(pdf).replace('\f', '')
+    manifest = Manifest(str(workspace / 'manifest.sqlite'))
+    assert manifest.get(pdf)[2:5] == (DONE, 'TEXT_PDF', 'output')
+    manifest.close()
@@ -0,0 +1,69 @@
+import io
+
+from pykrman.cache import ResultCache, cache_key, content_hash, get_cache
+from pykrman.names import FileType
+
+
+def test_content_hash_sources(tmp_path):
+    fp = tmp_path / 'doc.pdf'
+    fp.write_bytes(b'%PDF-1.4 content')
+    fh = io.BytesIO(b'%PDF-1.4 content')
+    assert content_hash(str(fp)) == content_hash(b'%PDF-1.4 content') == content_hash(fh)
+    assert fh.tell() == 0
+
+
+def test_cache_key_depends_on_settings():
+    assert cache_key('abc', force_convert=True) == cache_key('abc', force_convert=True)
+    assert cache_key('abc', force_convert=True) != cache_key('abc', force_convert=False)
+
+
+def test_result_cache_roundtrip(tmp_path):
+    cache = get_cache(True, str(tmp_path))
+    assert cache is get_cache(True, str(tmp_path))
+    assert cache.get('key') is None
+    cache.put('key', FileType.SCANNED_PDF, 'some text', 'out/doc.png.txt')
+    cache.close()
+    assert ResultCache(cache.path).get('key') == (FileType.SCANNED_PDF, 'some text', 'out/doc.png.txt')
+
+
+def test_duplicate_files_each_get_output(tmp_path):
+    import os
+    import shutil
+    from pykrman import pykrfy
+    orig = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ocr-wiki', 'orig.pdf')
+    indir = tmp_path / 'in'
+    indir.mkdir()
+    for name in ('a.pdf', 'b.pdf'):
+        shutil.copy(orig, indir / name)
+    workspace = tmp_path / 'ws'
+    assert pykrfy.run_config(data={'directories': [str(indir)]}, workspace=str(workspace),
+                             cache=True) == {FileType.TEXT_PDF: 2}
+    assert (workspace / 'text' / 'a.txt').read_text(encoding='utf8') == \
+           (workspace / 'text' / 'b.txt').read_text(encoding='utf8')
+
+
+class FakeEngine:
+
+    def image_to_string(self, im):
+        return f'{im.size[0]}x{im.size[1]}'
+
+
+def test_cache_hits_use_the_same_output_location(tmp_path):
+    import os
+    import shutil
+    from pykrman import pykrfy
+    jpg_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ocr-wiki', 'jpg-1')
+    indir = tmp_path / 'in'
+    indir.mkdir()
+    for name in ('a.jpg', 'b.jpg'):
+        shutil.copy(os.path.join(jpg_dir, sorted(os.listdir(jpg_dir))[0]), indir / name)
+    workspace = tmp_path / 'ws'
+    ocr = {'engine': FakeEngine()}
+    assert pykrfy.run_config(data={'directories': [str(indir)]}, workspace=str(workspace), cache=True,
+                             keep_intermediates=True, ocr=ocr) == {FileType.IMAGE: 2}
+    assert (workspace / 'out' / 'a.jpeg.txt').read_text(encoding='utf8') == \
+           (workspace / 'out' / 'b.jpeg.txt').read_text(encoding='utf8')
+    assert not (workspace / 'text').exists()
+    cache = get_cache(True, str(workspace))
+    assert [output for output, in cache.conn.execute('SELECT output FROM result')] == [
+        os.path.join('out', '{name}.jpeg.txt')]
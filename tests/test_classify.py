@@ -0,0 +1,58 @@
+import io
+import os
+
+import pytest
+
+from pykrman.classify import classify_pdf, classify_pdf_pages
+from pykrman.names import FileType
+
+OCR_WIKI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ocr-wiki')
+
+
+def test_text_pdf():
+    page_types = classify_pdf_pages(os.path.join(OCR_WIKI, 'orig.pdf'))
+    assert page_types == [FileType.TEXT_PDF] * 9
+    assert classify_pdf(page_types) == FileType.TEXT_PDF
+
+
+def test_scanned_pdf():
+    with open(os.path.join(OCR_WIKI, 'pdf-3.pdf'), 'rb') as fh:
+        page_types = classify_pdf_pages(io.BytesIO(fh.read()))
+    assert page_types == [FileType.SCANNED_PDF] * 9
+    assert classify_pdf(page_types) == FileType.SCANNED_PDF
+
+
+def make_pdf(content, form=None):
+    """Single page pdf with a font, drawing `content` and, as /Fm0, a form (without resources) drawing `form`"""
+    pikepdf = pytest.importorskip('pikepdf')
+    pdf = pikepdf.new()
+    pdf.add_blank_page(page_size=(100, 100))
+    font = pikepdf.Dictionary(Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type1, BaseFont=pikepdf.Name.Helvetica)
+    resources = pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=font))
+    if form is not None:
+        xobj = pikepdf.Stream(pdf, form)
+        xobj.Type = pikepdf.Name.XObject
+        xobj.Subtype = pikepdf.Name.Form
+        xobj.BBox = [0, 0, 100, 100]
+        resources.XObject = pikepdf.Dictionary(Fm0=xobj)
+    page = pdf.pages[0]
+    page.Resources = resources
+    page.Contents = pikepdf.Stream(pdf, content)
+    fh = io.BytesIO()
+    pdf.save(fh)
+    return fh
+
+
+@pytest.mark.parametrize('content', [
+    b'BT /F1 12 Tf 14 TL (text) Tj ET',
+    b'BT /F1 12 Tf 14 TL [(te) 10 (xt)] TJ ET',
+    b"BT /F1 12 Tf 14 TL (text)' ET",
+    b'BT /F1 12 Tf 14 TL 0 0 <74657874> " ET',
+])
+def test_text_operators(content):
+    assert classify_pdf_pages(make_pdf(content)) == [FileType.TEXT_PDF]
+    assert classify_pdf_pages(make_pdf(b'BT /F1 12 Tf ET')) == [FileType.UNKNOWN]
+
+
+def test_form_uses_page_resources():
+    assert classify_pdf_pages(make_pdf(b'/Fm0 Do', b"BT /F1 12 Tf 14 TL (text)' ET")) == [FileType.TEXT_PDF]
@@ -0,0 +1,136 @@
+import json
+import random
+from collections import Counter
+
+import pytest
+
+from pykrman import compare
+from pykrman.compare import Wordlist, smith_waterman_distance
+
+
+def reference_swd(seq1, seq2, match=3, mismatch=-1, insertion=-1, deletion=-1, normalize=1):
+    """Full-matrix implementation"""
+    if len(seq2) > len(seq1):
+        seq1, seq2 = seq2, seq1
+    mat = [[0] * (len(seq1) + 1) for _ in range(len(seq2) + 1)]
+    for i in range(1, len(seq2) + 1):
+        for j in range(1, len(seq1) + 1):
+            mat[i][j] = max(
+                0,
+                mat[i - 1][j - 1] + (match if seq1[j - 1] == seq2[i - 1] else mismatch),
+                mat[i - 1][j] + deletion,
+                mat[i][j - 1] + insertion,
+            )
+    best = max(max(row) for row in mat)
+    return best / (len(seq2) * match) if normalize else best
+
+
+def noisy_copy(rnd, seq, rate=0.1):
+    out = []
+    for x in seq:
+        r = rnd.random()
+        if r < rate / 3:
+            continue  # deleted
+        out.append(rnd.choice('abc') if r < rate * 2 / 3 else x)
+        if r > 1 - rate / 3:
+            out.append(rnd.choice('abc'))  # inserted
+    return ''.join(out)
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def implementation(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(compare, '_sw_numpy', compare._sw_python)
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'mismatch': -2, 'deletion': -2, 'insertion': -0.5}])
+def test_matches_full_matrix(implementation, kwargs):
+    rnd = random.Random(0)
+    for n in [1, 5, 30, 60]:
+        a = ''.join(rnd.choice('abcd') for _ in range(n))
+        b = noisy_copy(rnd, a) + ''.join(rnd.choice('abcd') for _ in range(rnd.randint(0, 10)))
+        for x, y in [(a, b), (b, a)]:
+            assert smith_waterman_distance(x, y, **kwargs) == pytest.approx(reference_swd(x, y, **kwargs))
+            assert smith_waterman_distance(x, y, normalize=0, **kwargs) == reference_swd(x, y, normalize=0, **kwargs)
+
+
+def test_empty():
+    assert smith_waterman_distance('abc', '') == 0.0
+
+
+def test_band(implementation):
+    rnd = random.Random(1)
+    a = ''.join(rnd.choice('abcdefgh') for _ in range(300))
+    b = noisy_copy(rnd, a)
+    exact = reference_swd(a, b, normalize=0)
+    assert smith_waterman_distance(a, b, normalize=0, band=50) == exact
+    assert smith_waterman_distance(a, b, normalize=0, band=1) <= exact
+
+
+def test_band_is_lower_bound(implementation):
+    # alignments which drift off the diagonal move the band between rows
+    rnd = random.Random(2)
+    for _ in range(300):
+        a = ''.join(rnd.choice('abc') for _ in range(rnd.randint(1, 30)))
+        b = ''.join(rnd.choice('abc') for _ in range(rnd.randint(1, 30)))
+        exact = reference_swd(a, b, normalize=0)
+        for band in range(1, 5):
+            assert smith_waterman_distance(a, b, normalize=0, band=band) <= exact
+
+
+def test_auto_band():
+    assert compare.auto_band(100, 100) is None
+    assert compare.auto_band(10 ** 5, 10 ** 5, max_cells=10 ** 8) == 500
+    assert compare.auto_band(10 ** 6, 10 ** 6, max_cells=10 ** 8) == compare.MIN_BAND
+
+
+def test_wordlist_letters_are_a_sequence():
+    wl = Wordlist('Hello, world!', important_words=[])
+    assert wl.letters == 'helloworld'
+    assert wl.letter_counts['l'] == 3
+
+
+def test_prefix_index():
+    index = compare.PrefixIndex(Counter({'cat': 2, 'catalog': 1, 'cab': 4, 'dog': 1}))
+    assert index.count('cat') == 3
+    assert index.count('ca') == 7
+    assert index.count('') == 8
+    assert index.count('z') == 0
+
+
+def test_important_words():
+    wl = Wordlist('Cats and catalogs, cabs; a cat.', important_words=['Cat*', 'cab', 'dog*'])
+    assert wl.important_counts == {'cat*': 3, 'cab': 0, 'dog*': 0}
+
+
+def _fake_compare(self, text):
+    return {'words': len(self.text_to_wordlist(text)), 'true_words': len(self.words)}
+
+
+def test_compare_versions(tmp_path, monkeypatch):
+    monkeypatch.setattr(Wordlist, 'compare', _fake_compare)
+    (tmp_path / 'a.txt').write_text('apples bananas')
+    (tmp_path / 'b').mkdir()
+    (tmp_path / 'b' / '1.txt').write_text('apples')
+    (tmp_path / 'b' / '2.txt').write_text('cherries')
+    wl = Wordlist('apples bananas cherries')
+    results = compare.compare_ocr_pdf(wl, str(tmp_path / 'a.txt'), str(tmp_path / 'b'),
+                                      ('named', 'apples'), 'plain text')
+    assert [(r[0], json.loads(r[1])['words']) if len(r) == 2 else json.loads(r[0])['words']
+            for r in results] == [(str(tmp_path / 'a.txt'), 2), (str(tmp_path / 'b'), 2), ('named', 1), 2]
+
+
+def test_process_in_parallel(tmp_path):
+    pytest.importorskip('nlpakki')
+    versions = []
+    for i in range(3):
+        versions.append(str(tmp_path / f'{i}.txt'))
+        (tmp_path / f'{i}.txt').write_text('the quick brown fox jumps' + ' over' * i)
+    output = tmp_path / 'out.jsonl'
+    compare.process('the quick brown fox jumps over the lazy dog', str(output), versions,
+                    important_words=['fox', 'jump*'], workers=2)
+    lines = output.read_text().splitlines()
+    assert sorted(lines[::2]) == versions
+    assert json.loads(lines[1])['important_words']['jump*'] == {'true_count': 1, 'count': 1}
@@ -0,0 +1,33 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from pykrman import pykrfy
+
+
+@pytest.fixture
+def multiframe_tiff():
+    frames = [Image.new('L', (40 + i, 20), color=255) for i in range(7)]
+    fh = io.BytesIO()
+    frames[0].save(fh, format='TIFF', save_all=True, append_images=frames[1:])
+    fh.seek(0)
+    return Image.open(fh)
+
+
+@pytest.mark.parametrize('page_workers', [1, 3])
+def test_frames_to_text_in_order(monkeypatch, multiframe_tiff, page_workers):
+    monkeypatch.setattr(pykrfy, 'image_to_string', lambda im, ocr=None: str(im.size[0]))
+    texts = pykrfy.frames_to_text(pykrfy.iter_frames(multiframe_tiff),
+                                  page_workers=page_workers, max_frames=2)
+    assert texts == [str(40 + i) for i in range(7)]
+
+
+def test_pdf_images_to_text_streams_pages(monkeypatch, tmp_path):
+    pdf = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ocr-wiki', 'pdf-3.pdf')
+    monkeypatch.chdir(tmp_path)  # nothing should be written here
+    monkeypatch.setattr(pykrfy, 'image_to_string', lambda im, ocr=None: str(im.size[1]))
+    text = pykrfy.pdf_images_to_text(pdf, page_workers=2, max_frames=2)
+    assert text.split('\n') == ['2202', '4408', '4404', '4368', '4388', '4396', '4370', '4380', '4380']
+    assert not os.listdir(tmp_path)
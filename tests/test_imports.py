@@ -0,0 +1,16 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+HEAVY = ('pdfminer', 'PIL', 'pytesseract', 'yaml', 'jsonschema', 'numpy', 'nlpakki')
+
+
+@pytest.mark.parametrize('module', ['pykrman.pykrfy', 'pykrman.aio', 'pykrman.compare'])
+def test_heavy_backends_are_imported_lazily(module):
+    code = f'import sys, {module}; print(" ".join(m for m in {HEAVY!r} if m in sys.modules))'
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [SRC, os.environ.get('PYTHONPATH')])))
+    out = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.split() == []
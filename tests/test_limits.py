@@ -0,0 +1,93 @@
+import os
+import shutil
+
+import pytest
+from PIL import Image
+
+from pykrman import limits, pykrfy
+from pykrman.limits import LimitExceeded
+from pykrman.manifest import DONE, FAILED, Manifest
+from pykrman.util import merge_images
+
+OCR_WIKI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ocr-wiki')
+
+
+def test_limits_only_apply_within_block():
+    im = Image.new('L', (10, 10))
+    with limits.apply(max_pixels=150):
+        with pytest.raises(LimitExceeded, match='max_pixels=150'):
+            merge_images([im, im])
+    assert merge_images([im, im]).size == (10, 20)
+
+
+def test_read_file_max_pages(tmp_path):
+    with pytest.raises(LimitExceeded, match='9 pages'):
+        pykrfy.read_file(os.path.join(OCR_WIKI, 'orig.pdf'), str(tmp_path), max_pages=2)
+    with pytest.raises(LimitExceeded, match='max_pixels'):
+        pykrfy.read_file(os.path.join(OCR_WIKI, 'jpg-1', 'ocr-jpg-1.jpg'), str(tmp_path), max_pixels=1000)
+
+
+@pytest.mark.parametrize('backend', ['pypdf2', 'pikepdf'])
+def test_embedded_images_checked_before_decoding(backend, monkeypatch):
+    if backend == 'pikepdf':
+        pikepdf = pytest.importorskip('pikepdf')
+        monkeypatch.setattr(pikepdf.PdfImage, 'as_pil_image', lambda self: pytest.fail('decoded'))
+    else:
+        from pykrman import pdfimages
+        monkeypatch.setattr(pdfimages, 'decode_image', lambda x_object: pytest.fail('decoded'))
+    from pykrman.pdfimages import iter_page_images
+    with open(os.path.join(OCR_WIKI, 'pdf-3.pdf'), 'rb') as fh, limits.apply(max_pixels=10 ** 6):
+        with pytest.raises(LimitExceeded, match='is 1700x2202 pixels'):
+            next(iter_page_images(fh, backend=backend))
+
+
+@pytest.mark.parametrize('stream_pages', [False, True])
+def test_read_file_max_pixels_scanned_pdf(tmp_path, stream_pages):
+    with pytest.raises(LimitExceeded, match='max_pixels'):
+        pykrfy.read_file(os.path.join(OCR_WIKI, 'pdf-3.pdf'), str(tmp_path), max_pixels=10 ** 6,
+                         stream_pages=stream_pages)
+
+
+def _run(tmp_path, **kwargs):
+    indir = tmp_path / 'in'
+    indir.mkdir(exist_ok=True)
+    shutil.copy(os.path.join(OCR_WIKI, 'orig.pdf'), indir / 'orig.pdf')
+    workspace = tmp_path / 'ws'
+    c = pykrfy.run_config({'directories': [str(indir)]}, str(workspace), manifest=True, **kwargs)
+    manifest = Manifest(str(workspace / 'manifest.sqlite'))
+    try:
+        return c, manifest.get(indir / 'orig.pdf')
+    finally:
+        manifest.close()
+
+
+def test_run_config_records_limit(tmp_path):
+    c, entry = _run(tmp_path, max_pages=2)
+    assert not c
+    assert entry[2] == FAILED
+    assert 'max_pages=2' in entry[5]
+
+
+def test_run_config_isolated(tmp_path):
+    c, entry = _run(tmp_path, isolate=True, max_pages=2)
+    assert entry[2] == FAILED
+    assert 'LimitExceeded' in entry[5] and 'max_pages=2' in entry[5]
+
+    c, entry = _run(tmp_path, timeout=60)
+    assert sum(c.values()) == 1
+    assert entry[2] == DONE
+
+
+def test_run_config_timeout(tmp_path):
+    c, entry = _run(tmp_path, timeout=0.01)
+    assert not c
+    assert entry[2] == FAILED
+    assert entry[5] == 'TimeoutError: Timed out after 0.01s'
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='memory limits need POSIX')
+def test_run_config_memory_limit(tmp_path):
+    c, entry = _run(tmp_path, max_memory=16)
+    assert not c
+    assert entry[2] == FAILED
+    assert 'memory' in entry[5].lower()  # depending on where the allocation failed
@@ -0,0 +1,70 @@
+import os
+import shutil
+
+from pykrman import pykrfy
+from pykrman.manifest import DONE, FAILED, Manifest
+from pykrman.names import FileType
+
+OCR_WIKI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ocr-wiki')
+
+
+def test_collect_input_files_recursive(tmp_path):
+    (tmp_path / 'a' / 'b').mkdir(parents=True)
+    for fp in ['x.pdf', 'a/y.pdf', 'a/b/z.pdf', 'a/b/z.txt']:
+        (tmp_path / fp).write_bytes(b'')
+    data = {'directories': [str(tmp_path)], 'filetypes': ['.pdf']}
+    assert list(pykrfy.collect_input_files(**data)) == [str(tmp_path / 'x.pdf')]
+    assert list(pykrfy.collect_input_files(recursive=True, **data)) == [
+        str(tmp_path / fp) for fp in ['a/b/z.pdf', 'a/y.pdf', 'x.pdf']
+    ]
+
+
+def test_run_config_skips_processed_files(tmp_path):
+    indir = tmp_path / 'in'
+    (indir / 'sub').mkdir(parents=True)
+    shutil.copy(os.path.join(OCR_WIKI, 'orig.pdf'), indir / 'sub' / 'orig.pdf')
+    (indir / 'bad.txt').write_text('not an image')
+    workspace = tmp_path / 'ws'
+    kwargs = {'data': {'directories': [str(indir)], 'recursive': True},
+              'workspace': str(workspace), 'manifest': True}
+    assert pykrfy.run_config(**kwargs) == {FileType.TEXT_PDF: 1}
+    manifest = Manifest(str(workspace / 'manifest.sqlite'))
+    assert manifest.get(indir / 'sub' / 'orig.pdf')[2:5] == (DONE, 'TEXT_PDF', os.path.join('text', 'sub', 'orig.txt'))
+    assert manifest.get(indir / 'bad.txt')[2] == FAILED
+
+    # unchanged files are skipped; failed files are retried
+    (workspace / 'text' / 'sub' / 'orig.txt').unlink()
+    assert pykrfy.run_config(**kwargs) == {}
+    assert not (workspace / 'text' / 'sub' / 'orig.txt').exists()
+    assert manifest.counts() == {DONE: 1, FAILED: 1}
+
+    # changed files are processed again
+    (indir / 'sub' / 'orig.pdf').write_bytes(b'%PDF' + (indir / 'sub' / 'orig.pdf').read_bytes()[4:] + b'\n')
+    assert pykrfy.run_config(**kwargs) == {FileType.TEXT_PDF: 1}
+    manifest.close()
+
+
+def test_recursive_output_mirrors_subdirectories(tmp_path):
+    indir = tmp_path / 'in'
+    for sub in ('x', 'y'):
+        (indir / sub).mkdir(parents=True)
+        shutil.copy(os.path.join(OCR_WIKI, 'orig.pdf'), indir / sub / 'doc.pdf')
+    workspace = tmp_path / 'ws'
+    assert pykrfy.run_config(data={'directories': [str(indir)], 'recursive': True}, workspace=str(workspace),
+                             manifest=True) == {FileType.TEXT_PDF: 2}
+    manifest = Manifest(str(workspace / 'manifest.sqlite'))
+    for sub in ('x', 'y'):
+        output = os.path.join('text', sub, 'doc.txt')
+        assert manifest.get(indir / sub / 'doc.pdf')[4] == output
+        assert (workspace / output).exists()
+    manifest.close()
+
+
+def test_interrupted_files_are_resumed(tmp_path):
+    manifest = Manifest(str(tmp_path / 'manifest.sqlite'))
+    entries = [('a.pdf', 1, 10), ('b.pdf', 2, 20)]
+    assert list(manifest.pending(entries)) == ['a.pdf', 'b.pdf']
+    manifest.finish('a.pdf', FileType.TEXT_PDF, 'text/a.txt')
+    # b.pdf was started but never finished
+    assert list(manifest.pending(entries)) == ['b.pdf']
+    assert list(manifest.pending([('a.pdf', 1, 11)])) == ['a.pdf']
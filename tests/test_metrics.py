@@ -0,0 +1,67 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from pykrman import metrics, pykrfy
+from pykrman.pool import iter_completed
+
+OCR_WIKI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ocr-wiki')
+
+
+def test_collect_nested():
+    with metrics.collect() as outer:
+        metrics.incr('a')
+        with metrics.collect() as inner:
+            metrics.incr('a', 2)
+            with metrics.stage('s'):
+                pass
+        with metrics.collect(propagate=False):
+            metrics.incr('a', 10)
+    assert inner.as_dict()['counters'] == {'a': 2}
+    assert outer.as_dict()['counters'] == {'a': 3}
+    assert outer.as_dict()['stages']['s']['calls'] == 1
+    metrics.incr('a')  # nothing collecting
+    assert metrics.current() is None
+
+
+def test_hooks():
+    seen = []
+
+    def hook(kind, name, value):
+        seen.append((kind, name))
+    metrics.add_hook(hook)
+    try:
+        with metrics.stage('s'):
+            metrics.incr('c')
+    finally:
+        metrics.remove_hook(hook)
+    assert seen == [('counter', 'c'), ('stage', 's')]
+
+
+def test_threads_record_into_caller():
+    def work(i):
+        metrics.incr('items')
+        return i
+
+    with metrics.collect() as m:
+        for _ in iter_completed(work, range(5), workers=2, executor_cls=ThreadPoolExecutor):
+            pass
+    assert m.counters['items'] == 5
+
+
+def test_run_config_metrics(tmp_path):
+    runs = []
+    metrics.add_hook(lambda kind, name, value: kind == 'run' and runs.append(value))
+    try:
+        with metrics.collect() as m:
+            pykrfy.run_config({'files': [os.path.join(OCR_WIKI, 'orig.pdf')]}, str(tmp_path))
+    finally:
+        metrics._hooks.clear()
+    data = m.as_dict()
+    assert runs == [data]
+    for stage in ('pdfminer', 'read', 'sniff', 'classify', 'write', 'document'):
+        assert stage in data['stages']
+    assert data['counters']['documents'] == 1
+    assert data['counters']['pages'] == 9
+    assert data['counters']['filetype.TEXT_PDF'] == 1
+    assert data['counters']['bytes_read'] == os.path.getsize(os.path.join(OCR_WIKI, 'orig.pdf'))
+    assert 'pdfminer' in m.summary()
@@ -0,0 +1,20 @@
+import pytest
+
+from pykrman.ocr import PytesseractEngine, get_engine
+
+
+def test_get_engine_reuses_engines():
+    engine = get_engine('pytesseract', psm=6)
+    assert engine is get_engine('pytesseract', psm=6)
+    assert engine is not get_engine('pytesseract', psm=4)
+    assert get_engine(engine) is engine
+
+
+def test_pytesseract_config():
+    assert PytesseractEngine(psm=6, oem=1, config='-c preserve_interword_spaces=1').config \
+           == '--psm 6 --oem 1 -c preserve_interword_spaces=1'
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        get_engine('ocrad')
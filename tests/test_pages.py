@@ -0,0 +1,75 @@
+import io
+import os
+
+import pytest
+
+from pykrman import pykrfy
+from pykrman.classify import classify_pdf, classify_pdf_pages
+from pykrman.names import FileType
+from pykrman.util import iter_pdf_text, read_pdf
+
+OCR_WIKI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ocr-wiki')
+
+
+@pytest.fixture
+def mixed_pdf():
+    """Text page, then two scanned pages"""
+    pikepdf = pytest.importorskip('pikepdf')
+    pdf = pikepdf.new()
+    with pikepdf.open(os.path.join(OCR_WIKI, 'orig.pdf')) as text_pdf, \
+            pikepdf.open(os.path.join(OCR_WIKI, 'pdf-3.pdf')) as scanned_pdf:
+        pdf.pages.append(text_pdf.pages[0])
+        pdf.pages.extend(scanned_pdf.pages[1:3])
+        fh = io.BytesIO()
+        pdf.save(fh)
+    return fh
+
+
+def test_iter_pdf_text_matches_read_pdf():
+    pdf = os.path.join(OCR_WIKI, 'orig.pdf')
+    pages = list(iter_pdf_text(pdf))
+    assert [i for i, _ in pages] == list(range(9))
+    assert ''.join(text for _, text in pages) == read_pdf(pdf)
+    assert list(iter_pdf_text(pdf, {2, 5})) == [pages[2], pages[5]]
+
+
+def test_get_pdf_pages(monkeypatch, mixed_pdf):
+    monkeypatch.setattr(pykrfy, 'image_to_string', lambda im, ocr=None: f'ocr {im.size[1]}')
+    page_types = classify_pdf_pages(mixed_pdf)
+    assert classify_pdf(page_types) == FileType.MIXED_PDF
+    pages = pykrfy.get_pdf_pages(mixed_pdf, page_types)
+    assert [page.filetype for page in pages] == [FileType.TEXT_PDF, FileType.SCANNED_PDF, FileType.SCANNED_PDF]
+    assert [page.text for page in pages[1:]] == ['ocr 4408', 'ocr 4404']
+    assert pykrfy.pages_to_text(pages).count('\f') == 3
+
+
+def test_read_pdf_page_ranges_in_parallel():
+    pdf = os.path.join(OCR_WIKI, 'orig.pdf')
+    assert read_pdf(pdf, workers=2, chunk_size=4) == read_pdf(pdf)
+    assert read_pdf(pdf, pagenos={1, 2, 7}, workers=2, chunk_size=1) == read_pdf(pdf, pagenos={1, 2, 7})
+    with open(pdf, 'rb') as fh:  # sent to each worker once
+        assert read_pdf(fh, workers=2, chunk_size=2) == read_pdf(pdf)
+    assert read_pdf(pdf, maxpages=2) == read_pdf(pdf, pagenos={0, 1})
+    # maxpages counts selected pages, whether or not pages are extracted in parallel
+    assert read_pdf(pdf, pagenos={3, 5, 7}, maxpages=2) == read_pdf(pdf, pagenos={3, 5})
+    assert read_pdf(pdf, pagenos={3, 5, 7}, maxpages=2, workers=2, chunk_size=1) == read_pdf(pdf, pagenos={3, 5})
+
+
+def test_iter_text_streams_pages_in_order(monkeypatch, mixed_pdf):
+    monkeypatch.setattr(pykrfy, 'image_to_string', lambda im, ocr=None: f'ocr {im.size[1]}')
+    pages = pykrfy.iter_text(mixed_pdf, 'pdf', page_workers=2)
+    first = next(pages)  # available before the scanned pages are OCR'd
+    assert first.number == 0 and first.filetype == FileType.TEXT_PDF
+    assert [first] + list(pages) == pykrfy.get_pdf_pages(mixed_pdf)
+
+
+def test_run_config_page_output(monkeypatch, tmp_path):
+    monkeypatch.setattr(pykrfy, 'image_to_string', lambda im, ocr=None: f'ocr {im.size[1]}')
+    data = {'files': [os.path.join(OCR_WIKI, 'orig.pdf'), os.path.join(OCR_WIKI, 'pdf-3.pdf')]}
+    for _ in range(2):  # second run is served from the cache
+        c = pykrfy.run_config(data, workspace=str(tmp_path), page_output=True, cache=True)
+        assert c == {FileType.TEXT_PDF: 1, FileType.SCANNED_PDF: 1}
+        assert len(os.listdir(tmp_path / 'text' / 'orig')) == 9
+        assert (tmp_path / 'text' / 'pdf-3' / '00001.txt').read_text() == 'ocr 4408'
+        assert (tmp_path / 'text' / 'orig' / '00002.txt').read_text() == \
+            read_pdf(os.path.join(OCR_WIKI, 'orig.pdf'), pagenos={2}).rstrip('\f')
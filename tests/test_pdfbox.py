@@ -0,0 +1,99 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+from pykrman import pdfbox
+
+HERE = os.path.dirname(__file__)
+
+# answers the batch protocol like BatchExtractImages, but exits on pdfs named "crash"
+FAKE_JVM = '''#!{python}
+import sys
+for line in sys.stdin:
+    if 'crash' in line:
+        sys.exit(1)
+    print('ok', flush=True)
+'''
+
+
+class FakeEngine:
+
+    def image_to_string(self, im):
+        return f'{im.size[0]}x{im.size[1]}'
+
+
+class FakePdfBox:
+    """Writes the images of tests/ocr-wiki/jpg-1 as though extracted from each pdf"""
+    started = 0
+
+    def __init__(self, java=None, jar=None):
+        FakePdfBox.started += 1
+        self.closed = False
+
+    def extract_images(self, pdf, image_dir):
+        if 'broken' in pdf:
+            raise RuntimeError('PDFBox failed')
+        os.makedirs(image_dir, exist_ok=True)
+        src = os.path.join(HERE, 'ocr-wiki', 'jpg-1')
+        for i, fn in enumerate(sorted(os.listdir(src)), start=1):
+            shutil.copy(os.path.join(src, fn), f'{pdfbox.image_prefix(pdf, image_dir)}-{i}.jpg')
+
+    def close(self):
+        self.closed = True
+
+
+def test_list_images_in_page_order(tmp_path):
+    for n in (10, 2, 1):
+        (tmp_path / f'doc-{n}.png').write_bytes(b'')
+    assert [os.path.basename(fp) for fp in pdfbox.list_images(tmp_path)] == ['doc-1.png', 'doc-2.png', 'doc-10.png']
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_batch_uses_one_jvm(tmp_path, monkeypatch, workers):
+    monkeypatch.setattr(pdfbox, 'PdfBox', FakePdfBox)
+    FakePdfBox.started = 0
+    for name in ('a', 'b', 'broken'):
+        (tmp_path / f'{name}.pdf').write_bytes(b'%PDF')
+    outdir = tmp_path / 'out'
+    pdfbox.pdfs_to_text(tmp_path, outdir=outdir, workers=workers, ocr={'engine': FakeEngine()})
+    assert FakePdfBox.started == 1
+    expected = ''.join(FakeEngine().image_to_string(pytest.importorskip('PIL.Image').open(fp)) + '\n'
+                       for fp in pdfbox.list_images(outdir / 'a'))
+    assert (outdir / 'a.txt').read_text(encoding='utf8') == expected
+    assert (outdir / 'b.txt').read_text(encoding='utf8') == expected
+    assert not (outdir / 'broken.txt').exists()
+    assert sorted(os.listdir(tmp_path)) == ['a.pdf', 'b.pdf', 'broken.pdf', 'out']  # no copies next to the pdfs
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='fake JVM is a script')
+def test_batch_restarts_jvm_after_it_exits(tmp_path):
+    java = tmp_path / 'java'
+    java.write_text(FAKE_JVM.format(python=sys.executable))
+    java.chmod(0o755)
+    with pdfbox.PdfBox(java=str(java)) as box:
+        box.extract_images('a.pdf', str(tmp_path / 'a'))
+        pid = box.proc.pid
+        with pytest.raises(RuntimeError, match='JVM exited'):
+            box.extract_images('crash.pdf', str(tmp_path / 'crash'))
+        box.extract_images('b.pdf', str(tmp_path / 'b'))
+        assert box.proc.pid != pid
+        box.proc.kill()  # also if it dies between pdfs
+        box.proc.wait()
+        box.extract_images('c.pdf', str(tmp_path / 'c'))
+
+
+def test_batch_protocol_with_java(tmp_path):
+    if not shutil.which('java') or not os.path.isfile(pdfbox.PDFBOX_JAR):
+        pytest.skip('needs java and the PDFBox jar')
+    pdf = os.path.join(HERE, 'ocr-wiki', 'pdf-3.pdf')
+    with pdfbox.PdfBox(java=shutil.which('java')) as box:
+        box.extract_images(pdf, str(tmp_path / 'a'))
+        assert pdfbox.list_images(tmp_path / 'a')
+        with pytest.raises(RuntimeError, match='PDFBox failed'):
+            box.extract_images(str(tmp_path / 'missing.pdf'), str(tmp_path / 'b'))
+        box.proc.kill()
+        box.proc.wait()
+        box.extract_images(pdf, str(tmp_path / 'c'))
+        assert len(pdfbox.list_images(tmp_path / 'c')) == len(pdfbox.list_images(tmp_path / 'a'))
@@ -0,0 +1,126 @@
+import binascii
+import io
+import os
+import zlib
+
+import pytest
+
+from pykrman import metrics
+from pykrman.pdfimages import iter_page_images, run_length_decode
+
+np = pytest.importorskip('numpy')
+pikepdf = pytest.importorskip('pikepdf')
+
+SCANNED_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ocr-wiki', 'pdf-3.pdf')
+
+
+def make_pdf(data, filters, parms=None, indirect=(), **image):
+    """
+    Single page pdf containing one image XObject
+
+    :param indirect: image dictionary keys (or, as '/DecodeParms/Key', decode parameters)
+        to store as indirect objects
+    :param image: image dictionary entries; callables are passed the pdf (e.g., to make streams)
+    """
+    pdf = pikepdf.new()
+    pdf.add_blank_page(page_size=(100, 100))
+
+    def value(key, v):
+        v = v(pdf) if callable(v) else v
+        return pdf.make_indirect(v) if key in indirect else v
+
+    stream = pikepdf.Stream(pdf, data)
+    stream.Type = pikepdf.Name.XObject
+    stream.Subtype = pikepdf.Name.Image
+    stream.Filter = pikepdf.Array([pikepdf.Name(f) for f in filters])
+    if parms:
+        stream.DecodeParms = value('/DecodeParms', pikepdf.Array([
+            pikepdf.Dictionary({k: value(f'/DecodeParms{k}', v) for k, v in p.items()}) if p else None
+            for p in parms
+        ]))
+    for key, v in image.items():
+        stream[f'/{key}'] = value(f'/{key}', v)
+    pdf.pages[0].Resources = pikepdf.Dictionary(XObject=pikepdf.Dictionary(Im0=stream))
+    fh = io.BytesIO()
+    pdf.save(fh)
+    fh.seek(0)
+    return fh
+
+
+@pytest.fixture
+def gray_pixels():
+    return ((np.arange(24 * 10).reshape(10, 24) * 7) % 256).astype(np.uint8)
+
+
+def png_up_predicted(pixels):
+    rows = []
+    prev = np.zeros(pixels.shape[1], dtype=np.uint8)
+    for row in pixels:
+        rows.append(b'\x02' + (row - prev).astype(np.uint8).tobytes())
+        prev = row
+    return zlib.compress(b''.join(rows))
+
+
+@pytest.mark.parametrize('backend', ['pypdf2', 'pikepdf'])
+def test_nested_filters_with_predictor(gray_pixels, backend):
+    data = binascii.hexlify(png_up_predicted(gray_pixels)) + b'>'
+    pdf = make_pdf(data, ['/ASCIIHexDecode', '/FlateDecode'],
+                   [None, {'/Predictor': 15, '/Columns': 24}],
+                   Width=24, Height=10, BitsPerComponent=8, ColorSpace=pikepdf.Name.DeviceGray)
+    [(page, img)] = list(iter_page_images(pdf, backend=backend))
+    assert page == 0
+    assert (np.array(img.convert('L')) == gray_pixels).all()
+
+
+@pytest.mark.parametrize('backend', ['pypdf2', 'pikepdf'])
+def test_raw_indexed_image(backend):
+    pixels = np.array([[0, 1, 2, 1]] * 3, dtype=np.uint8)
+    palette = bytes([255, 0, 0, 0, 255, 0, 0, 0, 255])
+    pdf = make_pdf(zlib.compress(pixels.tobytes()), ['/FlateDecode'],
+                   Width=4, Height=3, BitsPerComponent=8,
+                   ColorSpace=pikepdf.Array([pikepdf.Name.Indexed, pikepdf.Name.DeviceRGB, 2, palette]))
+    [(_, img)] = list(iter_page_images(pdf, backend=backend))
+    assert img.convert('RGB').getpixel((2, 0)) == (0, 0, 255)
+
+
+@pytest.mark.parametrize('backend', ['pypdf2', 'pikepdf'])
+def test_scanned_pdf(backend):
+    with open(SCANNED_PDF, 'rb') as fh:
+        sizes = [img.size for _, img in iter_page_images(fh, backend=backend)]
+    assert len(sizes) == 9
+    assert sizes[1] == (3396, 4408)
+
+
+@pytest.mark.parametrize('backend', ['pypdf2', 'pikepdf'])
+def test_indirect_entries(gray_pixels, backend):
+    pdf = make_pdf(png_up_predicted(gray_pixels), ['/FlateDecode'], [{'/Predictor': 15, '/Columns': 24}],
+                   indirect=('/DecodeParms', '/ColorSpace', '/Decode'),
+                   Width=24, Height=10, BitsPerComponent=8, ColorSpace=pikepdf.Name.DeviceGray,
+                   Decode=pikepdf.Array([0, 1]))
+    [(_, img)] = list(iter_page_images(pdf, backend=backend))
+    assert (np.array(img.convert('L')) == gray_pixels).all()
+
+    palette = bytes([255, 0, 0, 0, 255, 0, 0, 0, 255])
+    pixels = np.array([[0, 1, 2, 1]] * 3, dtype=np.uint8)
+    pdf = make_pdf(zlib.compress(pixels.tobytes()), ['/FlateDecode'], indirect=('/ColorSpace',),
+                   Width=4, Height=3, BitsPerComponent=8,
+                   ColorSpace=pikepdf.Array([pikepdf.Name.Indexed, pikepdf.Name.DeviceRGB, 2, palette]))
+    [(_, img)] = list(iter_page_images(pdf, backend=backend))
+    assert img.convert('RGB').getpixel((2, 0)) == (0, 0, 255)
+
+
+def test_indirect_jbig2_globals(monkeypatch):
+    from pykrman import pdfimages
+    calls = []
+    monkeypatch.setattr(pdfimages, 'decode_jbig2', lambda data, global_data=None: calls.append(global_data))
+    pdf = make_pdf(b'page', ['/JBIG2Decode'], [{'/JBIG2Globals': lambda pdf: pikepdf.Stream(pdf, b'globals')}],
+                   indirect=('/DecodeParms/JBIG2Globals',), Width=8, Height=8, BitsPerComponent=1,
+                   ColorSpace=pikepdf.Name.DeviceGray)
+    with metrics.collect() as m:
+        assert list(iter_page_images(pdf, backend='pypdf2')) == []
+    assert calls == [b'globals']
+    assert not m.counters['image_decode_failed']
+
+
+def test_run_length_decode():
+    assert run_length_decode(bytes([2, 1, 2, 3, 254, 9, 128])) == bytes([1, 2, 3, 9, 9, 9])
@@ -0,0 +1,40 @@
+import pytest
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pykrman.pool import iter_completed, iter_ordered
+
+
+def square(x, offset=0):
+    if x < 0:
+        raise ValueError(x)
+    return x * x + offset
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_iter_completed(workers):
+    results = {item: future.result()
+               for item, future in iter_completed(square, range(10), workers=workers, offset=1)}
+    assert results == {x: x * x + 1 for x in range(10)}
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_iter_completed_exception(workers):
+    results = dict(iter_completed(square, [-1, 2], workers=workers))
+    assert results[2].result() == 4
+    with pytest.raises(ValueError):
+        results[-1].result()
+
+
+def sleepy_square(x):
+    time.sleep((5 - x) * 0.01)  # earlier items finish last
+    return x * x
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_iter_ordered(workers):
+    results = [(item, future.result())
+               for item, future in iter_ordered(sleepy_square, range(5), workers=workers,
+                                                executor_cls=ThreadPoolExecutor)]
+    assert results == [(x, x * x) for x in range(5)]
@@ -0,0 +1,46 @@
+import pytest
+from PIL import Image, ImageEnhance
+
+from pykrman.preprocess import otsu_threshold, preprocess_image, sauvola_threshold
+
+np = pytest.importorskip('numpy')
+
+
+@pytest.fixture
+def gray_image():
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (30, 40)).astype(np.uint8))
+
+
+@pytest.mark.parametrize('method,threshold', [
+    ('pil', None), ('numpy', 'otsu'), ('numpy', 'sauvola'), ('numpy', 'fixed'), ('numpy', 'dither')
+])
+def test_preprocess_image_is_binary(gray_image, method, threshold):
+    kwargs = {'threshold': threshold} if threshold else {}
+    im = preprocess_image(gray_image.convert('RGB'), method=method, **kwargs)
+    assert im.mode == '1'
+    assert im.size == gray_image.size
+
+
+def test_numpy_contrast_matches_pil(gray_image):
+    im = preprocess_image(gray_image, method='numpy', median=0, contrast=2, threshold='fixed')
+    expected = np.array(ImageEnhance.Contrast(gray_image).enhance(2)) > 128
+    assert (np.array(im) == expected).all()
+
+
+def test_otsu_threshold_separates_classes():
+    arr = np.array([[20] * 10 + [220] * 10], dtype=np.uint8)
+    assert 20 <= otsu_threshold(arr) < 220
+
+
+def test_sauvola_threshold_matches_direct_computation(gray_image):
+    arr = np.array(gray_image)
+    thresholds = sauvola_threshold(arr, window=5, k=0.2)
+    padded = np.pad(arr, 2, mode='edge').astype(float)
+    window = padded[7:12, 11:16]
+    assert thresholds[7, 11] == pytest.approx(window.mean() * (1 + 0.2 * (window.std() / 128 - 1)))
+
+
+def test_unknown_method(gray_image):
+    with pytest.raises(ValueError):
+        preprocess_image(gray_image, method='opencv')
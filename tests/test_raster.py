@@ -0,0 +1,82 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from pykrman import raster
+from pykrman.util import force_pdf_to_image, iter_pdf_images
+
+ORIG_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ocr-wiki', 'orig.pdf')
+JPG_DIR = os.path.join(os.path.dirname(ORIG_PDF), 'jpg-1')
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_render_selected_pages(workers):
+    pytest.importorskip('pypdfium2')
+    with open(ORIG_PDF, 'rb') as fh:
+        pages = list(raster.iter_rendered_pages(fh, pagenos={3, 1}, dpi=36, workers=workers,
+                                                backend='pdfium'))
+    assert [i for i, _ in pages] == [1, 3]
+    assert [im.size for _, im in pages] == [(306, 396)] * 2  # letter size at 36dpi
+    assert pages[0][1].mode == 'L'
+    assert raster._pdfium_pdf is None  # closed after rendering inline
+
+
+def test_force_renders_only_requested_pages(tmp_path):
+    pytest.importorskip('pypdfium2')
+    # orig.pdf has no embedded images, so conversion must be forced
+    pages = list(iter_pdf_images(ORIG_PDF, force={'dpi': 20}, pagenos={8}, image_dir=str(tmp_path)))
+    assert [i for i, _ in pages] == [8]
+    assert os.listdir(tmp_path) == ['8_rendered.png']
+    assert list(iter_pdf_images(ORIG_PDF, force=False, pagenos={8})) == []
+
+
+def test_force_pdf_to_image_does_not_write_next_to_input(tmp_path):
+    pytest.importorskip('pypdfium2')
+    out = tmp_path / 'out.tiff'
+    assert force_pdf_to_image(ORIG_PDF, str(out), dpi=10) == str(out)
+    with Image.open(out) as im:
+        assert im.n_frames == 9
+    assert not any(f.endswith('.tiff') for f in os.listdir(os.path.dirname(ORIG_PDF)))
+
+
+def test_render_until_failure_when_page_count_unknown(monkeypatch):
+    def render(pageno, source=None, **kwargs):
+        assert os.path.exists(source)  # file-like input is written to a temporary file
+        return Image.new('L', (10, 10)) if pageno < 3 else None
+
+    monkeypatch.setattr(raster, 'resolve_backend', lambda backend: 'pdftoppm')
+    monkeypatch.setattr(raster, '_page_count', lambda source, backend: None)
+    monkeypatch.setattr(raster, '_render_subprocess', render)
+    with open(ORIG_PDF, 'rb') as fh:
+        assert [i for i, _ in raster.iter_rendered_pages(fh, workers=2)] == [0, 1, 2]
+
+
+def test_no_backend(monkeypatch):
+    monkeypatch.setattr(raster, 'backend_available', lambda backend: False)
+    assert list(raster.iter_rendered_pages(ORIG_PDF)) == []
+
+
+def test_force_renders_pages_whose_images_fail():
+    pytest.importorskip('pypdfium2')
+    pikepdf = pytest.importorskip('pikepdf')
+    jpg = os.path.join(JPG_DIR, sorted(os.listdir(JPG_DIR))[0])
+    with Image.open(jpg) as im, open(jpg, 'rb') as fh:
+        size, jpeg = im.size, fh.read()
+    pdf = pikepdf.new()
+    for data, filter_ in ((jpeg, '/DCTDecode'), (b'not jbig2', '/JBIG2Decode')):
+        pdf.add_blank_page(page_size=(100, 100))
+        image = pikepdf.Stream(pdf, data)
+        image.Type = pikepdf.Name.XObject
+        image.Subtype = pikepdf.Name.Image
+        image.Filter = pikepdf.Name(filter_)
+        image.Width, image.Height = size if filter_ == '/DCTDecode' else (8, 8)
+        image.BitsPerComponent = 8 if filter_ == '/DCTDecode' else 1
+        image.ColorSpace = pikepdf.Name.DeviceGray if filter_ == '/JBIG2Decode' else pikepdf.Name.DeviceRGB
+        pdf.pages[-1].Resources = pikepdf.Dictionary(XObject=pikepdf.Dictionary(Im0=image))
+    fh = io.BytesIO()
+    pdf.save(fh)
+    pages = list(iter_pdf_images(fh, force={'dpi': 20}))
+    assert [(i, im.size) for i, im in pages] == [(0, size), (1, (28, 28))]  # the second page is rendered
+    assert list(iter_pdf_images(fh, force=False)) == pages[:1]
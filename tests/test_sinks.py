@@ -0,0 +1,117 @@
+import json
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from pykrman import pykrfy
+from pykrman.manifest import DONE, FAILED, Manifest
+from pykrman.names import FileType
+from pykrman.sinks import JsonlSink, SqliteSink, document_record, get_sink
+
+OCR_WIKI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ocr-wiki')
+
+
+class FakeEngine:
+
+    def image_to_string(self, im):
+        return f'{im.size[0]}x{im.size[1]}'
+
+
+def records(n):
+    return [document_record(f'doc{i}.pdf', FileType.TEXT_PDF, f'{i:064x}', [f'page {i}', ''],
+                            {'stages': {'document': {'calls': 1, 'wall': 0.5, 'cpu': 0.4}}})
+            for i in range(n)]
+
+
+def test_jsonl_batches_and_shards(tmp_path):
+    with JsonlSink(str(tmp_path), batch_size=2, shard_size=3) as sink:
+        committed = [sink.write(record) for record in records(5)]
+        assert committed == [False, True, False, True, False]
+        assert sorted(os.listdir(tmp_path)) == ['part-00000.jsonl', 'part-00001.jsonl']
+    lines = [json.loads(line) for fn in sorted(os.listdir(tmp_path)) for line in open(tmp_path / fn)]
+    assert lines == records(5)
+    with JsonlSink(str(tmp_path)) as sink:  # later runs don't overwrite earlier shards
+        sink.write(records(1)[0])
+    assert len(os.listdir(tmp_path)) == 3
+
+
+def test_sqlite_replaces_reprocessed_documents(tmp_path):
+    path = str(tmp_path / 'out.sqlite')
+    for n in (3, 2):
+        with SqliteSink(path, batch_size=2) as sink:
+            for record in records(n):
+                sink.write(record)
+    conn = sqlite3.connect(path)
+    assert conn.execute('SELECT COUNT(*), SUM(pages), SUM(seconds) FROM document').fetchone() == (3, 6, 1.5)
+    assert conn.execute('SELECT text FROM page WHERE path = ? ORDER BY number',
+                        (os.path.abspath('doc1.pdf'),)).fetchall() == [('page 1',), ('',)]
+    conn.close()
+
+
+def test_parquet(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    with get_sink({'format': 'parquet', 'batch_size': 2, 'shard_size': 10}, str(tmp_path)) as sink:
+        for record in records(3):
+            if sink.write(record):  # committed records can be read before the sink is closed
+                assert pq.read_table(tmp_path / 'output' / 'part-00000.parquet').num_rows == 2
+    table = pq.read_table(tmp_path / 'output')
+    assert table.column('pages').to_pylist() == [r['pages'] for r in records(3)]
+    assert sorted(os.listdir(tmp_path / 'output')) == ['part-00000.parquet', 'part-00001.parquet']
+
+
+def test_get_sink(tmp_path):
+    assert get_sink(None) is None
+    assert get_sink('text') is None
+    with pytest.raises(ValueError):
+        get_sink('csv')
+
+
+def test_run_config_with_sink(tmp_path):
+    indir = tmp_path / 'in'
+    indir.mkdir()
+    shutil.copy(os.path.join(OCR_WIKI, 'orig.pdf'), indir / 'orig.pdf')
+    (indir / 'bad.txt').write_text('not an image')
+    workspace = tmp_path / 'ws'
+    assert pykrfy.run_config(data={'directories': [str(indir)]}, workspace=str(workspace), manifest=True,
+                             sink={'format': 'sqlite', 'batch_size': 10}) == {FileType.TEXT_PDF: 1}
+    assert not (workspace / 'text').exists()
+    conn = sqlite3.connect(workspace / 'output.sqlite')
+    rows = dict(conn.execute('SELECT path, filetype FROM document').fetchall())
+    assert rows[str(indir / 'orig.pdf')] == 'TEXT_PDF'
+    assert str(indir / 'bad.txt') in rows
+    assert 'Wikipedia' in ''.join(t for t, in conn.execute('SELECT text FROM page'))
+    conn.close()
+    manifest = Manifest(str(workspace / 'manifest.sqlite'))
+    assert manifest.get(indir / 'orig.pdf')[2:5] == (DONE, 'TEXT_PDF', 'output.sqlite')
+    assert manifest.get(indir / 'bad.txt')[2] == FAILED
+    manifest.close()
+
+
+def test_sink_records_each_page(tmp_path):
+    from PIL import Image
+    jpg_dir = os.path.join(OCR_WIKI, 'jpg-1')
+    frames = [Image.open(os.path.join(jpg_dir, fn)).convert('L') for fn in sorted(os.listdir(jpg_dir))[:3]]
+    tiff = tmp_path / 'frames.tiff'
+    frames[0].save(tiff, save_all=True, append_images=frames[1:])
+    workspace = tmp_path / 'ws'
+    pykrfy.run_config(data={'files': [str(tiff), os.path.join(OCR_WIKI, 'pdf-3.pdf')]}, workspace=str(workspace),
+                      ocr={'engine': FakeEngine()}, sink='jsonl')
+    with open(workspace / 'output' / 'part-00000.jsonl', encoding='utf8') as fh:
+        pages = {os.path.basename(r['path']): r['pages'] for r in map(json.loads, fh)}
+    assert pages['frames.tiff'] == [FakeEngine().image_to_string(im) for im in frames]
+    assert len(pages['pdf-3.pdf']) == 9
+
+
+def test_sink_is_closed_when_a_file_raises(tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(pykrfy, 'read_file_with_metrics', fail)
+    closed = []
+    monkeypatch.setattr(JsonlSink, 'close', lambda self: closed.append(self.path))
+    with pytest.raises(KeyboardInterrupt):
+        pykrfy.run_config(data={'files': [os.path.join(OCR_WIKI, 'orig.pdf')]}, workspace=str(tmp_path),
+                          sink='jsonl')
+    assert closed == [str(tmp_path / 'output')]
@@ -0,0 +1,59 @@
+import io
+import os
+
+import pytest
+
+from pykrman.sniff import sniff, sniff_ext
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.mark.parametrize('header, ext', [
+    (b'%PDF-1.7\n', 'pdf'),
+    (b'\r\n\x00junk before %PDF-1.4\n', 'pdf'),
+    (b'II*\x00\x08\x00\x00\x00', 'tiff'),
+    (b'MM\x00*\x00\x00\x00\x08', 'tiff'),
+    (b'\xff\xd8\xff\xe0\x00\x10JFIF', 'jpeg'),
+    (b'\xff\xd8\xff\xfe\x00\x0cmade from %PDF-1.4', 'jpeg'),  # comment mentioning a pdf
+    (b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR', 'png'),
+    (b'\x89PNG\r\n\x1a\n\x00\x00\x00\x0ctEXt%PDF-1.7', 'png'),
+    (b'\x00\x00\x00\x0cjP  \r\n\x87\n\x00\x00\x00\x14ftypjp2 ', 'jp2'),
+    (b'GIF89a\x01\x00', 'gif'),
+    (b'BM' + bytes(12) + b'\x28' + bytes(20), 'bmp'),
+    (b'BMW is not a bitmap, just some text', None),
+    (b'plain text', None),
+    (b'', None),
+])
+def test_sniff(header, ext):
+    assert sniff(header) == ext
+
+
+def test_sniff_files():
+    assert sniff(os.path.join(TESTS, 'ocr-wiki', 'orig.pdf')) == 'pdf'
+    assert sniff(os.path.join(TESTS, 'ocr-wiki', 'jpg-1', 'ocr-jpg-1.jpg')) == 'jpeg'
+    # misnamed: these are pngs
+    assert sniff(os.path.join(TESTS, 'tiff', 'image1.tiff')) == 'png'
+
+
+def test_sniff_restores_position():
+    fh = io.BytesIO(b'%PDF-1.4 more')
+    fh.seek(5)
+    assert sniff(fh) == 'pdf'
+    assert fh.tell() == 5
+
+
+def test_sniff_ext_precedence():
+    assert sniff_ext(b'%PDF-1.4', 'jpg') == 'pdf'
+    assert sniff_ext(b'???', 'PNG') == 'png'
+    assert sniff_ext(b'???') == 'pdf'
+    assert sniff_ext(b'???', default_ext=None) is None
+
+
+def test_read_file_routes_by_content(tmp_path):
+    from pykrman import pykrfy
+    from pykrman.names import FileType
+    misnamed = tmp_path / 'scan.jpg'
+    with open(os.path.join(TESTS, 'ocr-wiki', 'orig.pdf'), 'rb') as fh:
+        misnamed.write_bytes(fh.read())
+    ft, success, _ = pykrfy.read_file(str(misnamed), workspace=str(tmp_path / 'ws'))
+    assert (ft, success) == (FileType.TEXT_PDF, True)
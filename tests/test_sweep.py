@@ -0,0 +1,67 @@
+import json
+import os
+
+from pykrman import ocr, sweep
+from pykrman.compare import Wordlist
+
+OCR_WIKI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ocr-wiki')
+
+
+def test_expand_grid():
+    grid = {'preprocess': {'method': ['pil', 'numpy'], 'median': 3}, 'ocr': {'psm': [3, 6]}}
+    configs = sweep.expand_grid(grid)
+    assert len(configs) == 4
+    assert {'preprocess': {'method': 'numpy', 'median': 3}, 'ocr': {'psm': 6}} in configs
+    assert len(sweep.expand_grid([grid, {'preprocess': {'method': ['pil']}}, grid])) == 5
+
+
+def test_best_config():
+    summary = [
+        {'config': 'fast', 'pages_per_second': 10, 'word_similarity.swd': 0.7},
+        {'config': 'slow', 'pages_per_second': 1, 'word_similarity.swd': 0.9},
+    ]
+    assert sweep.best_config(summary, min_score=0.8)['config'] == 'slow'
+    assert sweep.best_config(summary, min_score=0.5)['config'] == 'fast'
+    assert sweep.best_config(summary, min_score=0.95)['config'] == 'slow'
+
+
+class FakeEngine:
+    calls = 0
+
+    def __init__(self, psm=None):
+        self.psm = psm
+
+    def image_to_string(self, im):
+        FakeEngine.calls += 1
+        return 'cat dog' if self.psm == 6 else 'cat'
+
+
+def fake_compare(self, text):
+    found = self.unique & set(self.text_to_wordlist(text))
+    return {'word_similarity': {'swd': len(found) / len(self.unique)}}
+
+
+def test_run_sweep_resumes(tmp_path, monkeypatch):
+    monkeypatch.setitem(ocr.ENGINES, 'fake', FakeEngine)
+    monkeypatch.setattr(Wordlist, 'compare', fake_compare)
+    truth = tmp_path / 'truth.txt'
+    truth.write_text('cat dog')
+    kwargs = {
+        'corpus': [{'truth': str(truth), 'documents': [os.path.join(OCR_WIKI, 'jpg-1')]}],
+        'grid': {'preprocess': {'median': [0]}, 'ocr': {'engine': 'fake', 'psm': [3, 6]}},
+        'workspace': str(tmp_path / 'ws'),
+        'min_score': 0.9,
+        'keep_text': True,
+    }
+    summary, best = sweep.run_sweep(**kwargs)
+    assert best['ocr'] == {'engine': 'fake', 'psm': 6}
+    assert best['word_similarity.swd'] == 1.0
+    assert all(s['pages'] == 9 for s in summary)
+    assert FakeEngine.calls == 18
+    with open(tmp_path / 'ws' / sweep.RESULTS_FILENAME) as fh:
+        assert len([json.loads(line) for line in fh]) == 2
+    assert len(os.listdir(tmp_path / 'ws' / 'text')) == 2
+
+    # nothing left to run
+    assert sweep.run_sweep(**kwargs)[1] == best
+    assert FakeEngine.calls == 18